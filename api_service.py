@@ -4,8 +4,6 @@ import json
 import threading
 import cv2
 import numpy as np
-from PIL import Image
-import io
 import base64
 from datetime import datetime
 
@@ -73,6 +71,7 @@ class FaceRecognitionAPI:
                 'endpoints': {
                     '/api/status': '获取系统状态',
                     '/api/face_recognition': '人脸识别',
+                    '/api/face_match': '批量特征匹配',
                     '/api/attendance/check_in': '签到',
                     '/api/attendance/check_out': '签退',
                     '/api/attendance/records': '考勤记录',
@@ -170,6 +169,8 @@ class FaceRecognitionAPI:
                     'total_recognitions': getattr(self.parent, 'total_recognitions', 0),
                     'total_attendance': getattr(self.parent, 'total_attendance', 0),
                     'model_status': getattr(self.parent, 'model_status', '未知'),
+                    'camera_pipeline': self.parent.camera.get_pipeline_stats()
+                    if hasattr(getattr(self.parent, 'camera', None), 'get_pipeline_stats') else {},
                     'timestamp': datetime.now().isoformat()
                 }
                 return jsonify({'status': 'success', 'data': status})
@@ -194,27 +195,33 @@ class FaceRecognitionAPI:
 
                     # 读取图片
                     image_data = file.read()
+                    location = request.form.get('location', 'API调用')
 
                 # 处理base64数据
                 elif request.json and 'image_data' in request.json:
                     image_data = base64.b64decode(request.json['image_data'])
+                    location = request.json.get('location', 'API调用')
 
                 if not image_data:
                     return jsonify({'status': 'error', 'message': '图片数据无效'})
 
-                # 转换为PIL图像
-                image = Image.open(io.BytesIO(image_data))
-
-                # 进行人脸识别
-                result = self.parent.recognize_face_from_image(image)
+                # 进行人脸识别：图片字节直接解码（按检测分辨率缩小，人脸框映射回原图坐标）；
+                # location 决定分片特征库检索哪些分片
+                result = self.parent.recognize_face_from_image(image_data, location)
 
                 if result['success']:
                     # 构建识别结果
                     recognitions = []
                     if 'descriptors' in result:
+                        matches = result.get('matches', [])
+                        boxes = result.get('boxes', [])
                         for i, descriptor in enumerate(result['descriptors']):
+                            match = matches[i] if i < len(matches) else {}
                             recognitions.append({
                                 'face_id': i,
+                                'name': match.get('name') or "无该人像",
+                                'confidence': match.get('confidence', 0.0),
+                                'box': list(boxes[i]) if i < len(boxes) else None,
                                 'descriptor': descriptor.tolist() if hasattr(descriptor, 'tolist') else descriptor
                             })
 
@@ -235,6 +242,44 @@ class FaceRecognitionAPI:
             except Exception as e:
                 return jsonify({'status': 'error', 'message': f'识别过程中发生错误: {str(e)}'})
 
+        @self.app.route('/api/face_match', methods=['POST'])
+        def face_match():
+            """批量特征匹配API：一次请求提交多个128维特征，整批在特征库中检索"""
+            try:
+                data = request.json
+                if not data or 'descriptors' not in data:
+                    return jsonify({'status': 'error', 'message': '缺少必要参数: descriptors'})
+
+                descriptors = np.asarray(data['descriptors'], dtype=np.float32)
+                if descriptors.ndim != 2 or descriptors.shape[1] != 128:
+                    return jsonify({'status': 'error', 'message': 'descriptors 必须是 N x 128 的数组'})
+
+                k = max(1, int(data.get('k', 1)))
+                threshold = self.config.get('threshold', 0.4)
+                location = data.get('location', 'API调用')
+                results = []
+                for i, candidates in enumerate(self.parent.face_gallery.search_batch(
+                        descriptors, k=k, location=location, threshold=threshold)):
+                    results.append({
+                        'face_id': i,
+                        'name': candidates[0][0] if candidates and candidates[0][1] <= threshold else "无该人像",
+                        'candidates': [
+                            {'name': name, 'distance': distance, 'confidence': max(0.0, 1.0 - distance)}
+                            for name, distance in candidates
+                        ]
+                    })
+
+                return jsonify({
+                    'status': 'success',
+                    'data': {
+                        'results': results,
+                        'total': len(results)
+                    }
+                })
+
+            except Exception as e:
+                return jsonify({'status': 'error', 'message': f'特征匹配失败: {str(e)}'})
+
         @self.app.route('/api/attendance/check_in', methods=['POST'])
         def attendance_check_in():
             """签到API"""
@@ -1,9 +1,16 @@
 import os
+import math
+import time
 from PyQt5.QtMultimedia import QCamera, QCameraInfo
 from PyQt5.QtMultimediaWidgets import QCameraViewfinder
-from PyQt5.QtWidgets import QLabel, QMessageBox
+from PyQt5.QtWidgets import QLabel, QMessageBox, QWidget, QGridLayout
+from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor
 from PyQt5.QtCore import Qt, QTimer
 
+from face_tracker import FaceTracker
+from frame_pipeline import PipelineStats, LatestFrameQueue, CaptureThread, QCameraFrameSource, RecognitionWorker
+from multi_camera import MultiCameraSystem, camera_sources
+
 class FaceRecognitionCamera:
     """摄像头管理类"""
     def __init__(self, parent):
@@ -13,8 +20,20 @@ class FaceRecognitionCamera:
         self.current_camera_index = self.config.get('camera_index', 0)
         self.viewfinder = None
         self.enroll_viewfinder = None
-        self.attendance_camera = None
-        self.attendance_viewfinder = None
+        # 考勤闸机：多路摄像头共用一个识别线程和同一套模型
+        self.gate_system = None
+        self.gate_labels = {}  # 摄像头ID -> 预览标签
+        self.gate_votes = {}  # (摄像头ID, track_id) -> [姓名, 连续帧数]
+        self.gate_last_confirmed = {}  # 姓名 -> 最近一次确认时间（time.monotonic）
+        # 帧处理流水线：采集线程/QVideoProbe -> 有界最新帧队列 -> 识别线程
+        self.frame_queue = None
+        self.pipeline_stats = None  # 丢帧数与采集到出结果的延迟
+        self.face_tracker = None  # 当前识别线程的人脸跟踪器
+        self.capture_thread = None
+        self.frame_source = None
+        self.recognition_worker = None
+        self.preview_label = None  # OpenCV 采集时的预览标签
+        self.last_preview_id = 0
         self.init_camera_and_timers()
 
     def init_camera_and_timers(self):
@@ -24,9 +43,6 @@ class FaceRecognitionCamera:
         self.camera_timer.timeout.connect(self.update_camera_frame)
         self.camera_timer.setInterval(30)  # 33fps
         
-        # 修复问题1和2：使用主窗口的定时器而不是创建新的
-        self.recognition_timer = self.parent.recognition_timer
-        
         self.enrollment_timer = QTimer()
         self.enrollment_timer.timeout.connect(self.update_enrollment_frame)
         self.enrollment_timer.setInterval(30)
@@ -35,7 +51,7 @@ class FaceRecognitionCamera:
         self.attendance_timer.timeout.connect(self.parent.update_attendance)
         self.attendance_timer.setInterval(1000)
         
-        # 考勤摄像头定时器
+        # 考勤摄像头预览定时器（只绘制各路最新帧，识别在共用识别线程中进行）
         self.attendance_camera_timer = QTimer()
         self.attendance_camera_timer.timeout.connect(self.update_attendance_camera_frame)
         self.attendance_camera_timer.setInterval(30)
@@ -51,9 +67,41 @@ class FaceRecognitionCamera:
         self.stats_timer.setInterval(5000)  # 每5秒更新一次统计
 
     def update_camera_frame(self):
-        """更新摄像头帧"""
-        # 简化实现：摄像头预览已经通过QCameraViewfinder处理
-        pass
+        """更新摄像头帧：取最新帧作为 current_frame，OpenCV 采集时绘制预览和识别框（只做绘制，不做推理）"""
+        if self.frame_queue is None:
+            return
+        frame_id, frame = self.frame_queue.latest()
+        if frame is None or frame_id == self.last_preview_id:
+            return
+        self.last_preview_id = frame_id
+        self.parent.current_frame = frame
+        if self.preview_label is None:
+            return
+
+        result = getattr(self.parent, 'latest_recognition', None)
+        self.render_frame(self.preview_label, frame, result['faces'] if result else [])
+
+    @staticmethod
+    def render_frame(label, frame, faces):
+        """把 RGB 帧缩放到标签大小并绘制识别框（只做绘制，不做推理）"""
+        height, width = frame.shape[:2]
+        image = QImage(frame.data, width, height, 3 * width, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(image).scaled(label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if faces:
+            scale = pixmap.width() / width
+            painter = QPainter(pixmap)
+            for face in faces:
+                left, top, right, bottom = face['box']
+                # 稳定化后的姓名（无稳定化结果时用本帧匹配结果）
+                label_text = face.get('label', face.get('name'))
+                color = QColor(0, 200, 0) if face.get('name') and not face.get('rejected') else QColor(230, 160, 0)
+                painter.setPen(QPen(color, 2))
+                painter.drawRect(int(left * scale), int(top * scale),
+                                 int((right - left) * scale), int((bottom - top) * scale))
+                painter.drawText(int(left * scale), max(12, int(top * scale) - 4),
+                                 f"#{face.get('track_id')} {label_text or ''}")
+            painter.end()
+        label.setPixmap(pixmap)
 
     def update_enrollment_frame(self):
         """更新录入摄像头帧"""
@@ -61,9 +109,17 @@ class FaceRecognitionCamera:
         pass
 
     def update_attendance_camera_frame(self):
-        """更新考勤摄像头帧"""
-        # 简化实现：考勤摄像头预览处理
-        pass
+        """更新各路考勤摄像头预览：取各路最新帧，绘制该路最新识别结果"""
+        if self.gate_system is None:
+            return
+        for channel in self.gate_system.channels:
+            label = self.gate_labels.get(channel.camera_id)
+            frame_id, frame = channel.frame_queue.latest()
+            if label is None or frame is None or frame_id == channel.last_preview_id:
+                continue
+            channel.last_preview_id = frame_id
+            result = channel.latest_result
+            self.render_frame(label, frame, result['faces'] if result else [])
 
     def toggle_camera(self):
         """切换摄像头状态"""
@@ -75,20 +131,6 @@ class FaceRecognitionCamera:
     def start_camera(self):
         """启动摄像头"""
         try:
-            # 使用PyQt5的QCamera替代OpenCV
-            # 获取可用摄像头
-            cameras = QCameraInfo.availableCameras()
-            if not cameras:
-                QMessageBox.warning(self.parent, "警告", "未找到可用摄像头")
-                return
-
-            # 创建摄像头对象
-            self.camera = QCamera(cameras[self.current_camera_index])
-            
-            # 创建取景器
-            self.viewfinder = QCameraViewfinder()
-            self.viewfinder.setFixedSize(640, 480)
-            
             # 清空视频标签布局
             layout = self.parent.video_label.layout()
             if layout:
@@ -96,13 +138,19 @@ class FaceRecognitionCamera:
                     widget = layout.itemAt(i).widget()
                     if widget:
                         widget.deleteLater()
-            
-            # 添加取景器到视频标签
-            layout.addWidget(self.viewfinder)
-            self.camera.setViewfinder(self.viewfinder)
-            
-            # 启动摄像头
-            self.camera.start()
+
+            self.pipeline_stats = PipelineStats(self.config.get('camera_location', '默认位置'))
+            self.frame_queue = LatestFrameQueue(self.config.get('frame_queue_size', 1), self.pipeline_stats)
+            self.last_preview_id = 0
+            started = False
+            if self.config.get('camera_backend', 'qcamera') == 'qcamera':
+                started = self.start_qcamera(layout)
+                if started is None:
+                    return
+            if not started:
+                self.start_opencv_capture(layout)
+
+            self.camera_timer.start()
             self.parent.is_camera_running = True
             
             # 更新界面
@@ -115,9 +163,113 @@ class FaceRecognitionCamera:
             self.parent.update_log(f"摄像头启动失败: {str(e)}")
             QMessageBox.critical(self.parent, "错误", f"摄像头启动失败: {str(e)}")
 
+    def start_qcamera(self, layout):
+        """使用PyQt5的QCamera取景器预览，QVideoProbe取帧
+
+        返回 True 已启动；False 平台不支持取帧（改用OpenCV采集）；None 未找到摄像头。
+        """
+        cameras = QCameraInfo.availableCameras()
+        if not cameras:
+            QMessageBox.warning(self.parent, "警告", "未找到可用摄像头")
+            return None
+
+        # 创建摄像头对象
+        self.camera = QCamera(cameras[self.current_camera_index])
+        self.frame_source = QCameraFrameSource(self.camera, self.frame_queue)
+        if not self.frame_source.attach():
+            self.parent.update_log("当前平台的QCamera不支持取帧，改用OpenCV采集（可将 camera_backend 设为 opencv）")
+            self.frame_source = None
+            self.camera.deleteLater()
+            self.camera = None
+            return False
+
+        # 创建取景器
+        self.viewfinder = QCameraViewfinder()
+        self.viewfinder.setFixedSize(640, 480)
+
+        # 添加取景器到视频标签
+        layout.addWidget(self.viewfinder)
+        self.camera.setViewfinder(self.viewfinder)
+
+        # 启动摄像头
+        self.camera.start()
+        return True
+
+    def start_opencv_capture(self, layout):
+        """OpenCV 采集线程读取帧，界面定时器绘制预览"""
+        self.preview_label = QLabel()
+        self.preview_label.setFixedSize(640, 480)
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setStyleSheet("background-color: black;")
+        layout.addWidget(self.preview_label)
+
+        source = self.config.get('camera_source', '') or self.current_camera_index
+        self.capture_thread = CaptureThread(source, self.frame_queue)
+        self.capture_thread.capture_failed.connect(self.on_capture_failed)
+        self.capture_thread.start()
+
+    def on_capture_failed(self, message):
+        """采集线程无法打开或读取视频源"""
+        self.parent.update_log(message)
+        if self.parent.is_camera_running:
+            self.parent.stop_recognition()
+            self.stop_camera()
+
+    def start_recognition_worker(self):
+        """启动识别线程（已在运行时不重复启动）"""
+        if self.frame_queue is None:
+            return False
+        if self.recognition_worker is not None and self.recognition_worker.isRunning():
+            return True
+        # 每个摄像头一个跟踪器，只在该摄像头的识别线程中使用
+        location = self.config.get('camera_location', '默认位置')
+        models = self.parent.models
+        tracker = FaceTracker.from_config(self.config, models.detector, location) if models.detector else None
+        self.face_tracker = tracker
+        self.recognition_worker = RecognitionWorker(
+            self.frame_queue, lambda frame: models.analyze_frame(frame, location, tracker),
+            analyze_batch=lambda frames: models.analyze_frames([(frame, location, tracker) for frame in frames]),
+            batch_size=self.config.get('recognition_batch_frames', 1))
+        self.recognition_worker.results_ready.connect(self.parent.on_recognition_results)
+        self.recognition_worker.analysis_failed.connect(
+            lambda message: self.parent.update_log(f"人脸识别过程中发生错误: {message}"))
+        self.recognition_worker.start()
+        return True
+
+    def stop_recognition_worker(self):
+        """停止识别线程"""
+        if self.recognition_worker is not None:
+            self.recognition_worker.stop()
+            self.recognition_worker = None
+        self.parent.latest_recognition = None
+
+    def get_pipeline_stats(self):
+        """摄像头流水线统计 {摄像头: 统计}（主摄像头和各路考勤摄像头），摄像头未启动时为空"""
+        pipeline_stats = {}
+        if self.pipeline_stats is not None:
+            stats = self.pipeline_stats.snapshot()
+            if self.face_tracker is not None:
+                # 整帧检测与特征复用情况
+                stats.update(self.face_tracker.counters())
+            pipeline_stats[stats['camera']] = stats
+        if self.gate_system is not None:
+            pipeline_stats.update(self.gate_system.snapshot())
+        return pipeline_stats
+
     def stop_camera(self):
         """停止摄像头"""
         try:
+            self.camera_timer.stop()
+            if self.frame_queue is not None:
+                self.frame_queue.close()
+            self.stop_recognition_worker()
+            if self.capture_thread is not None:
+                self.capture_thread.stop()
+                self.capture_thread = None
+            self.frame_source = None
+            self.frame_queue = None
+            self.preview_label = None
+            self.parent.current_frame = None
             if self.camera:
                 self.camera.stop()
                 self.camera.deleteLater()
@@ -228,63 +380,134 @@ class FaceRecognitionCamera:
         self.stop_camera()
 
     def start_attendance_camera(self):
-        """启动考勤摄像头"""
+        """启动考勤摄像头：attendance_cameras 中的每路摄像头一个采集线程，共用一个识别线程"""
         try:
-            # 获取可用摄像头
-            cameras = QCameraInfo.availableCameras()
-            if not cameras:
-                QMessageBox.warning(self.parent, "警告", "未找到可用摄像头")
+            if self.gate_system is not None:
                 return
 
-            # 创建摄像头对象（使用第二个摄像头，如果有的话）
-            camera_index = self.config.get('camera_index', 0)
-            if len(cameras) > 1:
-                camera_index = 1  # 使用第二个摄像头
-            
-            self.attendance_camera = QCamera(cameras[camera_index])
-            
-            # 创建取景器
-            self.attendance_viewfinder = QCameraViewfinder()
-            self.attendance_viewfinder.setFixedSize(320, 240)
-            
-            # 清空考勤摄像头布局
-            layout = self.parent.attendance_camera_label.layout()
-            if layout:
-                for i in reversed(range(layout.count())):
-                    widget = layout.itemAt(i).widget()
-                    if widget:
-                        widget.deleteLater()
-            
-            # 添加取景器到考勤摄像头区域
-            layout.addWidget(self.attendance_viewfinder)
-            self.attendance_camera.setViewfinder(self.attendance_viewfinder)
-            
-            # 启动摄像头
-            self.attendance_camera.start()
-            
+            # 未配置 attendance_cameras 时使用一路：有多个摄像头时用第二个，否则用 camera_index
+            default_source = self.config.get('camera_index', 0)
+            if not self.config.get('attendance_cameras') and len(QCameraInfo.availableCameras()) > 1:
+                default_source = 1
+            sources = camera_sources(self.config, default_source)
+            if not sources:
+                QMessageBox.warning(self.parent, "警告", "未配置考勤摄像头")
+                return
+
+            self.gate_system = MultiCameraSystem(self.config, sources)
+            self.build_gate_previews()
+            self.gate_system.start(
+                self.parent.models, self.on_gate_results, self.on_gate_capture_failed,
+                lambda message: self.parent.update_log(f"考勤摄像头识别过程中发生错误: {message}"))
+            if self.gate_system.worker is None:
+                self.parent.update_log("人脸检测器未加载，考勤摄像头只显示预览")
+
             # 更新界面
             self.parent.start_attendance_camera_btn.setEnabled(False)
             self.parent.stop_attendance_camera_btn.setEnabled(True)
-            self.parent.update_log("考勤摄像头启动成功")
-            
-            # 启动考勤摄像头定时器
+            self.parent.update_log(f"考勤摄像头启动成功: {len(sources)} 路 "
+                                   f"({', '.join(str(item['id']) for item in sources)})")
+
+            # 预览定时器：只做绘制
             self.attendance_camera_timer.start()
-            
+
         except Exception as e:
             self.parent.update_log(f"考勤摄像头启动失败: {str(e)}")
             QMessageBox.critical(self.parent, "错误", f"考勤摄像头启动失败: {str(e)}")
 
+    def build_gate_previews(self):
+        """在考勤摄像头区域按网格排列各路预览标签"""
+        layout = self.parent.attendance_camera_label.layout()
+        for i in reversed(range(layout.count())):
+            widget = layout.itemAt(i).widget()
+            if widget:
+                widget.deleteLater()
+
+        channels = self.gate_system.channels
+        columns = max(1, math.ceil(math.sqrt(len(channels))))
+        rows = max(1, math.ceil(len(channels) / columns))
+        grid_widget = QWidget()
+        grid = QGridLayout(grid_widget)
+        grid.setContentsMargins(0, 0, 0, 0)
+        grid.setSpacing(2)
+        self.gate_labels = {}
+        for i, channel in enumerate(channels):
+            label = QLabel(str(channel.camera_id))
+            label.setFixedSize(300 // columns, 220 // rows)
+            label.setAlignment(Qt.AlignCenter)
+            label.setStyleSheet("background-color: black; color: #aaa;")
+            grid.addWidget(label, i // columns, i % columns)
+            self.gate_labels[channel.camera_id] = label
+        layout.addWidget(grid_widget)
+
+    def on_gate_results(self, result):
+        """共用识别线程送回某一路的一帧结果（Qt信号，在界面线程中执行）"""
+        if self.gate_system is None:
+            return
+        channel = self.gate_system.channel(result['camera'])
+        if channel is None:
+            return
+        channel.latest_result = result
+
+        # 同一轨迹连续 gate_confirm_frames 帧匹配到同一人（距离不超过 threshold * gate_max_distance_ratio）时确认
+        max_distance = self.config.get('threshold', 0.4) * self.config.get('gate_max_distance_ratio', 0.9)
+        confirm_frames = self.config.get('gate_confirm_frames', 3)
+        seen = set()
+        for face in result['faces']:
+            key = (channel.camera_id, face['track_id'])
+            seen.add(key)
+            if not face['name'] or face['rejected'] or face['distance'] is None or face['distance'] > max_distance:
+                continue
+            vote = self.gate_votes.get(key)
+            if vote is None or vote[0] != face['name']:
+                vote = [face['name'], 0]
+                self.gate_votes[key] = vote
+            vote[1] += 1
+            if vote[1] == confirm_frames:
+                self.on_gate_confirmed(channel, face['name'], face['confidence'])
+        # 离开画面的轨迹不再保留投票
+        for key in [key for key in self.gate_votes if key[0] == channel.camera_id and key not in seen]:
+            del self.gate_votes[key]
+
+    def on_gate_confirmed(self, channel, name, confidence):
+        """闸机确认识别到某人：设为当前考勤用户，开启 gate_auto_check_in 时按该路位置自动签到"""
+        now = time.monotonic()
+        last = self.gate_last_confirmed.get(name)
+        if last is not None and now - last < self.config.get('gate_repeat_interval', 60.0):
+            return
+        self.gate_last_confirmed[name] = now
+        self.parent.update_log(f"[{channel.location}] 识别到: {name} (置信度 {confidence:.3f})")
+        if not self.parent.is_attendance_running:
+            return
+        self.parent.set_current_attendance_user(name)
+        if self.config.get('gate_auto_check_in', False):
+            success, message = self.parent.database.check_in(name, channel.location)
+            if success:
+                self.parent.update_log(f"[{channel.location}] 自动签到成功: {name}")
+                self.parent.refresh_attendance_records()
+            else:
+                self.parent.update_log(f"[{channel.location}] 自动签到未完成: {name} - {message}")
+
+    def on_gate_capture_failed(self, channel, message):
+        """某一路无法打开或读取：只停止这一路，其他摄像头继续"""
+        self.parent.update_log(f"考勤摄像头[{channel.camera_id}] {message}")
+        channel.stop()
+        label = self.gate_labels.get(channel.camera_id)
+        if label is not None:
+            label.setText(f"{channel.camera_id}\n无信号")
+
     def stop_attendance_camera(self):
         """停止考勤摄像头"""
         try:
-            if self.attendance_camera:
-                self.attendance_camera.stop()
-                self.attendance_camera.deleteLater()
-                self.attendance_camera = None
-            
             # 停止定时器
             self.attendance_camera_timer.stop()
-            
+
+            if self.gate_system is not None:
+                self.gate_system.stop()
+                self.gate_system = None
+            self.gate_labels = {}
+            self.gate_votes = {}
+
             # 恢复默认显示
             layout = self.parent.attendance_camera_label.layout()
             if layout:
@@ -292,17 +515,17 @@ class FaceRecognitionCamera:
                     widget = layout.itemAt(i).widget()
                     if widget:
                         widget.deleteLater()
-            
+
             default_text = QLabel("考勤摄像头已停止")
             default_text.setStyleSheet("color: #aaa; font-size: 14px;")
             default_text.setAlignment(Qt.AlignCenter)
             layout.addWidget(default_text)
             layout.setAlignment(Qt.AlignCenter)
-            
+
             # 更新界面
             self.parent.start_attendance_camera_btn.setEnabled(True)
             self.parent.stop_attendance_camera_btn.setEnabled(False)
             self.parent.update_log("考勤摄像头停止成功")
-            
+
         except Exception as e:
-            self.parent.update_log(f"考勤摄像头停止失败: {str(e)}")
\ No newline at end of file
+            self.parent.update_log(f"考勤摄像头停止失败: {str(e)}")
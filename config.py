@@ -12,16 +12,61 @@ class FaceRecognitionConfig:
         """加载配置文件"""
         default_config = {
             'database_path': 'face_database',
+            'feature_store_format': 'npy',  # 特征库存储格式: npy 二进制内存映射(feature_store目录) / csv 旧版文本
+            'feature_store_dir': 'feature_store',  # 二进制特征库目录（位于database_path下）
+            'journal_sync_batch': 32,  # 特征日志累计多少条记录执行一次fsync
+            'journal_sync_interval': 1.0,  # 特征日志最长fsync间隔（秒）
+            'journal_compact_records': 1000,  # 特征日志累计多少条记录后在后台合并进基础文件
+            'photo_manifest_file': 'photo_manifest.json',  # 照片目录清单（位于database_path下），只重新列出有变化的用户目录
+            'photo_manifest_hash': True,  # 清单中记录照片内容哈希（只对新增或修改的文件计算）
+            'index_snapshot_enabled': True,  # 启动时内存映射索引快照，不再重新加载全部来源；快照过期时后台重建
+            'index_snapshot_dir': 'index_snapshot',  # 索引快照目录（位于database_path下），由 gallery_tools.py build-index 生成
             'features_file': 'face_features.csv',
             'log_file': 'recognition_log.csv',
             'attendance_file': 'attendance.csv',
             'model_path': 'models',
             'shape_predictor_path': 'models/shape_predictor_68_face_landmarks.dat',
             'face_recognition_model_path': 'models/dlib_face_recognition_resnet_model_v1.dat',
-            'threshold': 0.4,
+            'threshold': 0.4,  # 特征欧氏距离阈值，小于等于该值视为同一人
+            'gallery_backend': 'exact',  # 特征库检索方式: exact 穷举 / ivf 近似(倒排索引) / centroid 两级匹配(先特征中心再全部模板)
+            'ivf_nlist': 0,  # IVF簇数量，0 表示按 4*sqrt(特征数) 自动选择
+            'ivf_nprobe': 8,  # 每次查询扫描的簇数量，越大召回率越高、耗时越长
+            'ivf_min_templates': 100000,  # 特征数达到该值才启用IVF，否则仍使用穷举检索
+            'gallery_storage': 'float32',  # 特征库存储精度: float32 / float16 / int8（量化后全精度重排）
+            'gallery_rerank_k': 64,  # 量化存储时用全精度重新计算距离的候选数量
+            'gallery_exact_tier_on_disk': True,  # 量化存储时全精度特征以内存映射文件保存，不常驻内存
+            'gallery_compaction_ratio': 0.2,  # 已删除(墓碑)特征占比超过该值时压缩特征库索引
+            'centroid_top_k': 8,  # 两级匹配时按特征中心选出的候选身份数，再用其全部模板精确匹配
+            'gallery_shard_field': '',  # 特征库分片字段（如 department），为空时不分片
+            'gallery_shard_routes': {},  # 位置 -> 允许检索的分片列表，如 {"研发楼闸机": ["研发部"]}；未配置的位置检索全部分片
+            'gallery_shard_fallback': True,  # 路由分片中未匹配时是否继续检索其余分片
+            'camera_location': '默认位置',  # 本机摄像头所在位置（分片路由使用）
             'max_faces': 100,
             'api_port': 5000,
             'camera_index': 0,
+            'camera_backend': 'qcamera',  # 识别取帧方式: qcamera 取景器+QVideoProbe（平台不支持取帧时自动改用OpenCV） / opencv 采集线程
+            'camera_source': '',  # OpenCV 视频源（设备序号以外的视频文件或流地址），为空时使用 camera_index
+            'frame_queue_size': 1,  # 采集与识别之间的帧队列长度，满时丢弃最旧帧，识别总是取最新帧
+            'recognition_batch_frames': 1,  # 识别线程一次取走的排队帧数(>1 时多帧人脸合并批量计算特征，需 frame_queue_size 不小于该值)
+            'track_method': 'correlation',  # 两次整帧检测之间的跟踪方式: correlation 相关滤波 / roi 框附近缩小重检
+            'track_detect_interval': 5,  # 每N帧做一次整帧人脸检测，其间跟踪（1 表示每帧检测）
+            'track_roi_expand': 0.5,  # roi 跟踪时在人脸框四周外扩的比例
+            'track_min_confidence': 7.0,  # 相关滤波跟踪置信度(PSR)低于该值时下一帧整帧检测
+            'camera_tracking': {},  # 按摄像头位置覆盖跟踪参数，如 {"东门闸机": {"track_detect_interval": 3}}
+            'attendance_cameras': [],  # 考勤闸机摄像头，如 [{"id": "东门", "source": 1, "location": "东门闸机"}, {"id": "西门", "source": "rtsp://..."}]；为空时使用第二个摄像头
+            'gate_confirm_frames': 3,  # 闸机同一轨迹连续多少帧匹配到同一人时确认
+            'gate_max_distance_ratio': 0.9,  # 闸机只计入匹配距离不超过 threshold 该比例的帧（1.0 即与识别阈值相同）
+            'gate_repeat_interval': 60.0,  # 同一人再次确认的最短间隔（秒）
+            'gate_auto_check_in': False,  # 考勤运行中闸机确认后按该路位置自动签到
+            'embedding_refresh_interval': 2.0,  # 同一跟踪人脸的特征缓存有效秒数，超过后重新计算
+            'embedding_quality_gain': 0.15,  # 人脸质量比缓存时提高该比例以上时提前重新计算特征
+            'descriptor_batch_size': 16,  # 批量计算照片特征时每批的照片数（多张照片的人脸合并为一次网络调用）
+            'ingest_max_side': 1600,  # 图片解码的检测工作分辨率（长边像素），大尺寸JPEG在解码阶段缩小到该值附近，0为原尺寸
+            'video_sample_fps': 2.0,  # 视频文件识别每秒抽取的帧数
+            'video_max_side': 1280,  # 视频抽样帧缩小到的长边像素
+            'video_workers': 0,  # 视频识别工作进程数，0为CPU核数（每个进程各加载一份模型）
+            'video_queue_per_worker': 2,  # 每个工作进程最多在途的抽样帧数（限制内存）
+            'video_merge_gap': 2.0,  # 同一人两次出现间隔不超过该秒数时合并为一个出现区间
             'use_local_models_only': True,
 
             # MySQL数据库配置
@@ -35,8 +80,11 @@ class FaceRecognitionConfig:
             'recognition_stability_threshold': 0.3,  # 提高稳定性阈值，从0.15提高到0.3
             'max_recognition_history': 3,  # 减少历史记录数量，从5降到3
             'face_images_per_person': 5,  # 每人最多保存照片数量
-            'min_face_size': 100,  # 最小人脸尺寸
+            'min_face_size': 100,  # 最小人脸尺寸（人脸质量评分中短边达到该值时尺寸得满分）
+            'face_quality_min_score': 0.4,  # 人脸质量总分(0~1)低于该值时不计算特征，避免模糊/过暗/侧脸造成结果跳变
+            'face_quality_blur_reference': 100.0,  # 清晰度满分对应的拉普拉斯方差（人脸缩放到64像素宽后计算）
             'recognition_fix_threshold': 0.6,  # 降低固定阈值，从0.8降到0.6，更容易固定结果
+            'recognition_instant_fix_ratio': 0.6,  # 匹配距离不超过 threshold 的该比例时直接固定结果（不等待投票）
             'min_stable_frames': 2,  # 减少最少稳定帧数，从3降到2
             'auto_save_after_enrollment': True,  # 修复需求2：人脸录入后自动保存
             'checkout_recognition_required': True,  # 修复需求3：签退需要人脸识别确认
@@ -1,11 +1,26 @@
 import os
 import csv
+import time
+import threading
 import pymysql
 from pymysql import OperationalError
 from datetime import datetime
 from PyQt5.QtWidgets import QMessageBox, QFileDialog
 from PyQt5.QtWidgets import QTableWidgetItem
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal
+import numpy as np
+from feature_store import FeatureStore, convert_legacy_features
+from mysql_embeddings import EMBEDDING_MODEL, encode_embedding, ensure_embedding_columns, migrate_text_encodings
+from photo_manifest import PhotoManifest
+from face_sources import load_sources
+from index_snapshot import IndexSnapshot, snapshot_users, source_fingerprint
+from gallery_shards import create_gallery
+
+
+class LogRelay(QObject):
+    """把后台线程的消息转发到界面日志（跨线程信号自动排队到界面线程执行）"""
+
+    message = pyqtSignal(str)
 
 
 class FaceRecognitionDatabase:
@@ -16,7 +31,19 @@ class FaceRecognitionDatabase:
         self.config = parent.config
         self.db_conn = None
         self.db_cursor = None
+        self.feature_store = None  # 二进制特征库（含追加写日志），首次加载时打开
+        self.gallery_generation = 0  # 特征库每次录入/删除加一，后台重建据此判断结果是否已过时
+        self._rebuild_thread = None
+        self._rebuild_timer = None
+        self._rebuild_result = None
+        self._rebuild_generation = 0
+        self._feature_jobs = {}  # 姓名 -> 后台特征计算任务
+        self._feature_timer = None
+        # 特征库后台线程的fsync/压缩失败通过信号写入系统日志
+        self.log_relay = LogRelay()
+        self.log_relay.message.connect(parent.update_log)
         self.init_directories()
+        self.photo_manifest = PhotoManifest.from_config(self.config)  # 照片目录清单，只重新列出有变化的用户目录
         self.init_database()
 
     def init_directories(self):
@@ -60,15 +87,7 @@ class FaceRecognitionDatabase:
         self.db_cursor = None
         try:
             # 连接MySQL数据库
-            self.db_conn = pymysql.connect(
-                host=self.config.get('mysql_host', 'localhost'),
-                port=self.config.get('mysql_port', 3306),
-                user=self.config.get('mysql_user', 'root'),
-                password=self.config.get('mysql_password', '123456'),
-                database=self.config.get('mysql_database', 'smart_attendance'),
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            self.db_conn = self.connect_mysql()
             self.db_cursor = self.db_conn.cursor()
 
             # 创建数据库（如果不存在）
@@ -85,6 +104,8 @@ class FaceRecognitionDatabase:
                     gender VARCHAR(20),
                     department VARCHAR(100),
                     face_encoding TEXT,
+                    face_embedding BLOB,
+                    embedding_model VARCHAR(64),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
@@ -135,6 +156,13 @@ class FaceRecognitionDatabase:
             ''')
 
             self.db_conn.commit()
+
+            # 旧版users表补充二进制特征列，并把文本特征迁移为二进制
+            ensure_embedding_columns(self.db_conn)
+            migrated = migrate_text_encodings(self.db_conn, log=self.parent.update_log)
+            if migrated:
+                self.parent.update_log(f"已将 {migrated} 个用户的文本特征迁移为二进制特征")
+
             self.parent.update_log("MySQL数据库初始化成功")
 
         except OperationalError as e:
@@ -144,90 +172,238 @@ class FaceRecognitionDatabase:
         except Exception as e:
             self.parent.update_log(f"数据库初始化失败: {str(e)}")
 
+    def use_feature_store(self):
+        """是否使用二进制特征库存储"""
+        return self.config.get('feature_store_format', 'npy') == 'npy'
+
+    def open_feature_store(self):
+        """打开二进制特征库用于追加写（首次使用时从旧版CSV/JSON特征文件转换），返回存储对象"""
+        if self.feature_store is not None:
+            return self.feature_store
+        store = FeatureStore.from_config(self.config)
+        if not store.exists():
+            # 首次使用二进制格式：从旧版CSV/JSON特征文件转换
+            database_path = self.config.get('database_path', 'face_database')
+            count = convert_legacy_features(
+                store,
+                csv_file=os.path.join(database_path, self.config.get('features_file', 'face_features.csv')),
+                json_file=os.path.join(database_path, 'face_features.json'))
+            self.parent.update_log(f"已将旧版特征文件转换为二进制特征库: {store.path}，共 {count} 个特征")
+        store.open_journal()
+        # 后台定时批量fsync，并在日志过长时合并进基础文件
+        self.feature_store = store
+        store.start_background(on_error=self.log_relay.message.emit)
+        return store
+
+    def load_feature_store(self):
+        """从二进制特征库加载特征（基础文件 + 日志尾部），返回 (行姓名列表, 特征矩阵)"""
+        row_names, _, matrix = self.open_feature_store().snapshot()
+        # 普通ndarray视图，仍共享内存映射，不复制数据
+        return row_names, np.asarray(matrix)
+
+    def connect_mysql(self):
+        """新建MySQL连接（DictCursor）"""
+        return pymysql.connect(
+            host=self.config.get('mysql_host', 'localhost'),
+            port=self.config.get('mysql_port', 3306),
+            user=self.config.get('mysql_user', 'root'),
+            password=self.config.get('mysql_password', '123456'),
+            database=self.config.get('mysql_database', 'smart_attendance'),
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor
+        )
+
+    def current_fingerprint(self, db_conn=None):
+        """数据来源指纹（特征库、MySQL、照片根目录），返回 (摘要, 明细)"""
+        return source_fingerprint(self.config, db_conn if db_conn is not None else self.db_conn)
+
+    def load_at_startup(self):
+        """启动加载：索引快照可用时直接映射快照，来源有变化时后台重建；否则完整加载"""
+        if self.config.get('index_snapshot_enabled', True) and self.load_index_snapshot():
+            return
+        self.load_face_database()
+
     def load_face_database(self):
-        """加载人脸数据库"""
+        """加载人脸数据库（特征文件、MySQL、照片目录），重建特征库索引并写入索引快照"""
         try:
-            # 从CSV文件加载特征
-            features_file = os.path.join(self.config.get('database_path', 'face_database'),
-                                         self.config.get('features_file', 'face_features.csv'))
-            if os.path.exists(features_file):
-                with open(features_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        name = row['name']
-                        if name not in self.parent.face_database:
-                            self.parent.face_database[name] = {
-                                'features': [],
-                                'images': [],
-                                'info': {}
-                            }
-                        # 提取特征向量
-                        features = []
-                        for i in range(128):
-                            feature_key = f'feature_{i}'
-                            if feature_key in row:
-                                features.append(float(row[feature_key]))
-                        if features:
-                            self.parent.face_database[name]['features'].append(features)
-
-            # 从MySQL数据库加载用户信息
-            if self.db_conn and self.db_cursor:
+            if self.use_feature_store():
+                self.open_feature_store()
+            # 先取来源指纹：加载期间发生的变化会让快照在下次启动时判定为过期，而不是被遗漏
+            fingerprint, sources = self.current_fingerprint()
+            row_names, matrix, timings = load_sources(
+                self.config, self.parent.face_database,
+                store_loader=self.load_feature_store if self.use_feature_store() else None,
+                db_conn=self.db_conn if self.db_cursor else None,
+                photo_manifest=self.photo_manifest,
+                log=self.parent.update_log)
+
+            # 重建特征库索引
+            phase_start = time.perf_counter()
+            self.parent.face_gallery.build_from_arrays(row_names, matrix)
+            timings['索引构建'] = time.perf_counter() - phase_start
+            memory = self.parent.face_gallery.memory_usage()
+            self.parent.update_log(f"特征库索引构建完成，共 {len(self.parent.face_gallery)} 个特征模板，"
+                                   f"存储: {memory['storage']}，扫描层内存: {memory['scan_tier'] / 1024:.1f}KB")
+
+            if self.config.get('index_snapshot_enabled', True):
+                phase_start = time.perf_counter()
                 try:
-                    self.db_cursor.execute("SELECT * FROM users")
-                    users = self.db_cursor.fetchall()
-                    for user in users:
-                        name = user['name']
-                        if name not in self.parent.face_database:
-                            self.parent.face_database[name] = {
-                                'features': [],
-                                'images': [],
-                                'info': {}
-                            }
-                        # 更新用户信息
-                        self.parent.face_database[name]['info'].update({
-                            'age': str(user['age']) if user['age'] is not None else '',
-                            'gender': user['gender'] if user['gender'] is not None else '',
-                            'department': user['department'] if user['department'] is not None else '',
-                            'created_at': user['created_at'].isoformat() if user['created_at'] is not None else '',
-                            'updated_at': user['updated_at'].isoformat() if user['updated_at'] is not None else ''
-                        })
-                        # 加载用户照片
-                        self.db_cursor.execute("SELECT image_path FROM face_images WHERE user_id = %s", (user['id'],))
-                        image_paths = self.db_cursor.fetchall()
-                        self.parent.face_database[name]['images'] = [img['image_path'] for img in image_paths]
-
+                    IndexSnapshot.from_config(self.config).write(
+                        row_names, matrix, snapshot_users(self.parent.face_database), fingerprint,
+                        ivf=getattr(self.parent.face_gallery, 'ivf', None), sources=sources)
                 except Exception as e:
-                    self.parent.update_log(f"从MySQL加载用户信息失败: {str(e)}")
-
-            # 从文件系统加载照片路径
-            face_images_dir = os.path.join(self.config.get('database_path', 'face_database'), 'face_images')
-            if os.path.exists(face_images_dir):
-                for name in os.listdir(face_images_dir):
-                    user_dir = os.path.join(face_images_dir, name)
-                    if os.path.isdir(user_dir):
-                        if name not in self.parent.face_database:
-                            self.parent.face_database[name] = {
-                                'features': [],
-                                'images': [],
-                                'info': {}
-                            }
-                        # 获取所有照片文件
-                        photo_files = [f for f in os.listdir(user_dir) if
-                                       f.endswith('.jpg') and not f.endswith('_thumb.jpg')]
-                        photo_paths = [os.path.join(user_dir, f) for f in photo_files]
-                        self.parent.face_database[name]['images'] = photo_paths
+                    self.parent.update_log(f"写入索引快照失败: {str(e)}")
+                timings['快照写入'] = time.perf_counter() - phase_start
 
             # 更新统计信息
             self.parent.total_users = len(self.parent.face_database)
             self.parent.update_log(f"人脸数据库加载完成，共 {self.parent.total_users} 个人脸")
+            self.parent.update_log("加载耗时: " + "，".join(
+                f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in timings.items()))
             self.parent.update_stats()
 
         except Exception as e:
             self.parent.update_log(f"加载人脸数据库失败: {str(e)}")
 
+    def load_index_snapshot(self):
+        """从索引快照加载人脸数据库和特征库索引（内存映射），成功返回True"""
+        start = time.perf_counter()
+        try:
+            data = IndexSnapshot.from_config(self.config).load(self.config.get('ivf_nprobe', 8))
+        except Exception as e:
+            self.parent.update_log(f"读取索引快照失败，改为完整加载: {str(e)}")
+            return False
+        if data is None:
+            return False
+
+        try:
+            row_names = data['row_names']
+            matrix = data['matrix']
+            for name, user in data['users'].items():
+                self.parent.face_database[name] = {
+                    'features': [],
+                    'images': user.get('images', []),
+                    'info': user.get('info', {})
+                }
+            for row, name in enumerate(row_names):
+                self.parent.face_database.setdefault(name, {'features': [], 'images': [], 'info': {}})
+                self.parent.face_database[name]['features'].append(matrix[row])
+            self.parent.face_gallery.build_from_arrays(row_names, matrix, ivf=data['ivf'], adopt=True)
+            if self.use_feature_store():
+                self.open_feature_store()
+        except Exception as e:
+            self.parent.update_log(f"索引快照加载失败，改为完整加载: {str(e)}")
+            self.parent.face_database.clear()
+            return False
+
+        self.parent.total_users = len(self.parent.face_database)
+        self.parent.update_log(f"从索引快照加载人脸数据库: {self.parent.total_users} 个人脸，"
+                               f"{len(self.parent.face_gallery)} 个特征模板，"
+                               f"耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        self.parent.update_stats()
+
+        # 来源有变化时后台重建，重建完成前继续使用当前快照
+        try:
+            fingerprint, _ = self.current_fingerprint()
+        except Exception as e:
+            self.parent.update_log(f"计算数据来源指纹失败: {str(e)}")
+            fingerprint = None
+        if fingerprint != data['fingerprint']:
+            self.parent.update_log("索引快照已过期，正在后台重建，完成前继续使用当前快照")
+            self.start_background_rebuild()
+        return True
+
+    def start_background_rebuild(self):
+        """在后台线程中从全部来源重建人脸数据库和索引，完成后由主线程定时器切换"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_result = None
+        self._rebuild_generation = self.gallery_generation
+        self._rebuild_thread = threading.Thread(target=self._background_rebuild, name='index-rebuild', daemon=True)
+        self._rebuild_thread.start()
+        if self._rebuild_timer is None:
+            self._rebuild_timer = QTimer()
+            self._rebuild_timer.timeout.connect(self._finish_background_rebuild)
+        self._rebuild_timer.start(500)
+
+    def _background_rebuild(self):
+        """后台线程：使用独立的MySQL连接，日志先缓存，切换时再由主线程输出"""
+        messages = []
+        conn = None
+        try:
+            if self.db_conn is not None:
+                try:
+                    conn = self.connect_mysql()
+                except Exception as e:
+                    messages.append(f"后台重建连接MySQL失败: {str(e)}")
+            fingerprint, sources = source_fingerprint(self.config, conn)
+            face_database = {}
+            store = self.feature_store
+            row_names, matrix, timings = load_sources(
+                self.config, face_database,
+                store_loader=(lambda: store.snapshot()[::2]) if store is not None else None,
+                db_conn=conn, photo_manifest=self.photo_manifest, log=messages.append)
+            gallery = create_gallery(self.config, lambda name: face_database.get(name, {}).get('info', {}))
+            gallery.build_from_arrays(row_names, matrix)
+            IndexSnapshot.from_config(self.config).write(
+                row_names, matrix, snapshot_users(face_database), fingerprint,
+                ivf=getattr(gallery, 'ivf', None), sources=sources)
+            self._rebuild_result = {'face_database': face_database, 'gallery': gallery,
+                                    'timings': timings, 'messages': messages}
+        except Exception as e:
+            self._rebuild_result = {'error': str(e), 'messages': messages}
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _finish_background_rebuild(self):
+        """主线程：后台重建完成后整体替换人脸数据库和索引引用"""
+        if self._rebuild_thread is None or self._rebuild_thread.is_alive():
+            return
+        self._rebuild_timer.stop()
+        self._rebuild_thread = None
+        result = self._rebuild_result or {'error': '未知错误', 'messages': []}
+        for message in result['messages']:
+            self.parent.update_log(message)
+        if 'error' in result:
+            self.parent.update_log(f"后台重建索引失败，继续使用当前快照: {result['error']}")
+            return
+        if self.gallery_generation != self._rebuild_generation:
+            # 重建期间有录入或删除，结果可能缺少这些变更
+            self.parent.update_log("后台重建期间特征库有更新，重新开始重建")
+            self.start_background_rebuild()
+            return
+
+        previous = self.parent.face_gallery
+        self.parent.face_database = result['face_database']
+        self.parent.face_gallery = result['gallery']
+        previous.close()
+        self.parent.total_users = len(self.parent.face_database)
+        self.parent.update_log(f"后台重建索引完成并已切换: {self.parent.total_users} 个人脸，"
+                               f"{len(self.parent.face_gallery)} 个特征模板；耗时 " + "，".join(
+                                   f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in result['timings'].items()))
+        self.parent.update_stats()
+
     def save_face_database(self):
         """保存人脸数据库"""
         try:
+            if self.feature_store is not None:
+                # 所有特征变更已写入追加日志，按批量策略fsync，无需重写整个特征文件
+                return
+
+            if self.use_feature_store():
+                row_names = []
+                rows = []
+                for name, data in self.parent.face_database.items():
+                    for features in data['features']:
+                        row_names.append(name)
+                        rows.append(features)
+                timestamp = datetime.now().isoformat()
+                FeatureStore.from_config(self.config).save(
+                    row_names, [timestamp] * len(row_names), np.asarray(rows, dtype=np.float32).reshape(-1, 128))
+                self.parent.update_log("人脸数据库保存完成")
+                return
+
             features_file = os.path.join(self.config.get('database_path', 'face_database'),
                                          self.config.get('features_file', 'face_features.csv'))
             with open(features_file, 'w', encoding='utf-8', newline='') as f:
@@ -243,6 +419,30 @@ class FaceRecognitionDatabase:
         except Exception as e:
             self.parent.update_log(f"保存人脸数据库失败: {str(e)}")
 
+    def close_feature_store(self):
+        """关闭二进制特征库：停止后台线程并把日志落盘"""
+        if self.feature_store is not None:
+            self.feature_store.close()
+            self.feature_store = None
+
+    def refresh_user_photos(self, name, force=True):
+        """刷新单个用户的照片清单并返回照片路径（清单在加载和退出时写盘）
+
+        本程序写入或删除照片后 force=True 强制重新列出；只读查看时 force=False，目录 mtime 未变则直接使用清单。
+        """
+        try:
+            self.photo_manifest.refresh_directory(name, force)
+        except Exception as e:
+            self.parent.update_log(f"刷新用户照片清单失败 {name}: {str(e)}")
+        return self.photo_manifest.photos(name)
+
+    def save_photo_manifest(self):
+        """照片清单有变化时写盘"""
+        try:
+            self.photo_manifest.save()
+        except Exception as e:
+            self.parent.update_log(f"保存照片清单失败: {str(e)}")
+
     def save_enrollment(self):
         """保存录入信息"""
         try:
@@ -288,14 +488,17 @@ class FaceRecognitionDatabase:
             }
             self.parent.face_database[name]['images'] = photo_paths
 
+            # 计算特征并增量更新特征库索引
+            self.update_face_features(name, photo_paths)
+
             # 保存到MySQL数据库
             self.save_to_database(name, age, gender, department, photo_paths)
 
             # 保存到文件
             self.save_face_database()
 
-            # 更新数据表格
-            self.refresh_data()
+            # 只更新该用户所在的表格行
+            self.update_table_row(name)
 
             # 清空表单和照片列表
             self.parent.enroll_name.clear()
@@ -364,14 +567,17 @@ class FaceRecognitionDatabase:
             }
             self.parent.face_database[name]['images'] = photo_paths
 
+            # 计算特征并增量更新特征库索引
+            self.update_face_features(name, photo_paths)
+
             # 保存到MySQL数据库
             self.save_to_database(name, age, gender, department, photo_paths)
 
             # 保存到文件
             self.save_face_database()
 
-            # 更新数据表格
-            self.refresh_data()
+            # 只更新该用户所在的表格行
+            self.update_table_row(name)
 
             # 更新状态
             action = "更新" if user_exists else "录入"
@@ -385,6 +591,134 @@ class FaceRecognitionDatabase:
         except Exception as e:
             self.parent.update_log(f"自动保存录入信息失败: {str(e)}")
 
+    def update_face_features(self, name, photo_paths):
+        """在后台线程中计算照片特征，完成后由主线程定时器替换该用户在特征库索引中的全部模板
+
+        特征计算（检测 + 特征点 + ResNet）每张照片需要数百毫秒，不在界面线程中执行；
+        同一用户在计算完成前再次更新时，只应用最后一次的结果。
+        """
+        job = {'result': None}
+        job['thread'] = threading.Thread(target=self._compute_face_features, args=(job, list(photo_paths)),
+                                         name=f'face-features-{name}', daemon=True)
+        self._feature_jobs[name] = job
+        job['thread'].start()
+        if self._feature_timer is None:
+            self._feature_timer = QTimer()
+            self._feature_timer.timeout.connect(self._finish_face_features)
+        if not self._feature_timer.isActive():
+            self._feature_timer.start(200)
+        self.parent.update_log(f"正在后台计算人脸特征: {name}，{len(photo_paths)} 张照片")
+
+    def wait_face_features(self, timeout=30.0):
+        """等待后台特征计算完成并应用结果（退出前调用，避免刚录入的特征丢失）"""
+        deadline = time.monotonic() + timeout
+        for job in list(self._feature_jobs.values()):
+            job['thread'].join(max(0.0, deadline - time.monotonic()))
+        if self._feature_jobs:
+            self._finish_face_features()
+
+    def _compute_face_features(self, job, photo_paths):
+        """后台线程：只计算特征，不修改人脸数据库和索引；日志先缓存，应用结果时再由主线程输出"""
+        messages = []
+        try:
+            job['result'] = {'descriptors': self.parent.models.compute_descriptors_from_paths(
+                photo_paths, log=messages.append), 'messages': messages}
+        except Exception as e:
+            job['result'] = {'error': str(e), 'messages': messages}
+
+    def _finish_face_features(self):
+        """主线程：应用已完成的特征计算结果"""
+        for name, job in list(self._feature_jobs.items()):
+            if job['thread'].is_alive():
+                continue
+            del self._feature_jobs[name]
+            self._apply_face_features(name, job['result'] or {'error': '未知错误'})
+        if not self._feature_jobs:
+            self._feature_timer.stop()
+
+    def _apply_face_features(self, name, result):
+        for message in result.get('messages', []):
+            self.parent.update_log(message)
+        if name not in self.parent.face_database:
+            # 计算期间该用户已被删除
+            return
+        if 'error' in result:
+            self.parent.update_log(f"计算人脸特征失败，保留原有特征 {name}: {result['error']}")
+            return
+        descriptors = result['descriptors']
+        if descriptors:
+            self.parent.face_database[name]['features'] = descriptors
+            if self.feature_store is not None:
+                # 只追加该用户的记录，写入代价与特征库规模无关
+                self.feature_store.append_replace(name, descriptors)
+            else:
+                self.save_face_database()
+            self.save_embedding_to_database(name, descriptors)
+        else:
+            # 未能计算出新特征时保留原有特征
+            descriptors = self.parent.face_database[name]['features']
+            self.parent.update_log(f"未能从照片中计算出人脸特征，保留原有特征: {name}")
+        self.parent.face_gallery.replace(name, descriptors)
+        self.gallery_generation += 1
+        self.parent.update_log(f"特征库索引增量更新: {name}，{len(descriptors)} 个特征模板")
+        self.parent.update_stats()
+
+    def save_embedding_to_database(self, name, descriptors):
+        """把用户模板的平均特征写入MySQL二进制特征列，其他程序和本地特征库缺失时可直接使用"""
+        if not self.db_conn or not self.db_cursor:
+            return
+        try:
+            embedding = np.mean(np.atleast_2d(np.asarray(descriptors, dtype=np.float32)), axis=0)
+            self.db_cursor.execute("""
+                UPDATE users SET face_embedding = %s, embedding_model = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE name = %s
+            """, (encode_embedding(embedding), EMBEDDING_MODEL, name))
+            self.db_conn.commit()
+        except Exception as e:
+            self.parent.update_log(f"保存二进制特征到数据库失败 {name}: {str(e)}")
+            self.db_conn.rollback()
+
+    def update_user_info(self, name, age, gender, department):
+        """编辑用户信息：更新内存、特征库分片和MySQL，并使索引快照和进行中的后台重建失效"""
+        if name in self.parent.face_database:
+            self.apply_user_info({name: {'age': age, 'gender': gender, 'department': department}})
+
+        if self.db_conn and self.db_cursor:
+            sql = """
+            UPDATE users 
+            SET age = %s, gender = %s, department = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE name = %s
+            """
+            self.db_cursor.execute(sql, (age, gender, department, name))
+            self.db_conn.commit()
+
+    def apply_user_info(self, updates):
+        """把 {姓名: 用户信息字段} 写入内存，返回新建的用户数（编辑和导入共用）
+
+        部门等分片字段变化时模板迁移到新分片；特征库文件不变、来源指纹也不变，
+        因此需要显式标记快照过期，否则下次从快照加载时这些用户会回到旧分片。
+        """
+        created = 0
+        now = datetime.now().isoformat()
+        for name, fields in updates.items():
+            entry = self.parent.face_database.get(name)
+            if entry is None:
+                # 导入的新用户尚无特征，不在特征库索引中
+                self.parent.face_database[name] = {'features': [], 'images': [], 'info': dict(fields, created_at=now)}
+                created += 1
+                continue
+            entry['info'].update(fields, updated_at=now)
+            if self.parent.face_gallery.reassign(name):
+                self.parent.update_log(f"特征库分片迁移: {name}")
+        if len(updates) > created:
+            self.gallery_generation += 1
+            if self.config.get('index_snapshot_enabled', True):
+                try:
+                    IndexSnapshot.from_config(self.config).invalidate()
+                except Exception as e:
+                    self.parent.update_log(f"标记索引快照过期失败: {str(e)}")
+        return created
+
     def save_to_database(self, name, age, gender, department, photo_paths):
         """保存到数据库"""
         try:
@@ -444,50 +778,71 @@ class FaceRecognitionDatabase:
     def refresh_data(self):
         """刷新数据表格"""
         try:
-            # 清空表格
-            self.parent.data_table.setRowCount(0)
-
             # 从数据库重新加载数据
             self.load_face_database()
 
             # 重新填充表格
-            row = 0
-            for name, data in self.parent.face_database.items():
-                user_info = data.get('info', {})
-                age = user_info.get('age', '')
-                gender = user_info.get('gender', '')
-                department = user_info.get('department', '')
-                photo_count = len(data.get('images', []))
-
-                # 添加新行
-                self.parent.data_table.insertRow(row)
-
-                # 设置单元格内容
-                name_item = QTableWidgetItem(name)
-                age_item = QTableWidgetItem(age)
-                gender_item = QTableWidgetItem(gender)
-                department_item = QTableWidgetItem(department)
-                photos_item = QTableWidgetItem(str(photo_count))
-
-                # 设置单元格属性
-                for item in [name_item, age_item, gender_item, department_item, photos_item]:
-                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-                # 添加到表格
-                self.parent.data_table.setItem(row, 0, name_item)
-                self.parent.data_table.setItem(row, 1, age_item)
-                self.parent.data_table.setItem(row, 2, gender_item)
-                self.parent.data_table.setItem(row, 3, department_item)
-                self.parent.data_table.setItem(row, 4, photos_item)
-
-                row += 1
+            self.populate_data_table()
+
+        except Exception as e:
+            self.parent.update_log(f"刷新数据表格失败: {str(e)}")
+
+    def populate_data_table(self):
+        """按内存中的人脸数据库重建整个数据表格（初始加载、手动刷新和批量导入时使用）"""
+        try:
+            # 清空表格
+            self.parent.data_table.setRowCount(0)
+            self.parent.data_table.setRowCount(len(self.parent.face_database))
+
+            for row, (name, data) in enumerate(self.parent.face_database.items()):
+                self._set_table_row(row, name, data)
 
             # 调整列宽
             self.parent.data_table.resizeColumnsToContents()
             self.parent.update_log("数据表格刷新完成")
 
         except Exception as e:
-            self.parent.update_log(f"刷新数据表格失败: {str(e)}")
+            self.parent.update_log(f"填充数据表格失败: {str(e)}")
+
+    def _set_table_row(self, row, name, data):
+        """填写数据表格中的一行"""
+        user_info = data.get('info', {})
+        items = [
+            QTableWidgetItem(name),
+            QTableWidgetItem(user_info.get('age', '')),
+            QTableWidgetItem(user_info.get('gender', '')),
+            QTableWidgetItem(user_info.get('department', '')),
+            QTableWidgetItem(str(len(data.get('images', []))))
+        ]
+        for column, item in enumerate(items):
+            # 设置单元格属性
+            item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+            self.parent.data_table.setItem(row, column, item)
+
+    def _find_table_row(self, name):
+        """姓名所在的表格行号，不存在时返回 None（在 Qt 内部查找，不逐行读取）"""
+        for item in self.parent.data_table.findItems(name, Qt.MatchExactly):
+            if item.column() == 0:
+                return item.row()
+        return None
+
+    def update_table_row(self, name):
+        """录入/更新某个用户后只插入或更新该用户所在的一行，不重建整个表格"""
+        data = self.parent.face_database.get(name)
+        if data is None:
+            self.remove_table_row(name)
+            return
+        row = self._find_table_row(name)
+        if row is None:
+            row = self.parent.data_table.rowCount()
+            self.parent.data_table.insertRow(row)
+        self._set_table_row(row, name, data)
+
+    def remove_table_row(self, name):
+        """删除某个用户后只移除该用户所在的一行"""
+        row = self._find_table_row(name)
+        if row is not None:
+            self.parent.data_table.removeRow(row)
 
     def delete_face(self, name):
         """删除指定人脸"""
@@ -496,6 +851,13 @@ class FaceRecognitionDatabase:
                 # 从内存中删除
                 del self.parent.face_database[name]
 
+                # 丢弃尚未完成的特征计算结果，从特征库索引中删除（墓碑标记）
+                self._feature_jobs.pop(name, None)
+                self.parent.face_gallery.remove(name)
+                self.gallery_generation += 1
+                if self.feature_store is not None:
+                    self.feature_store.append_remove(name)
+
                 # 从MySQL数据库删除
                 if self.db_conn and self.db_cursor:
                     try:
@@ -524,6 +886,7 @@ class FaceRecognitionDatabase:
                 if os.path.exists(face_images_dir):
                     import shutil
                     shutil.rmtree(face_images_dir)
+                    self.photo_manifest.forget(name)
                     self.parent.update_log(f"从文件系统删除用户照片: {face_images_dir}")
 
                 # 保存数据库文件
@@ -549,34 +912,23 @@ class FaceRecognitionDatabase:
             if file_path:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     reader = csv.DictReader(f)
-                    imported_count = 0
-
+                    updates = {}
                     for row in reader:
                         name = row.get('name', '').strip()
-                        age = row.get('age', '').strip()
-                        gender = row.get('gender', '').strip()
-                        department = row.get('department', '').strip()
-
                         if name:
-                            if name not in self.parent.face_database:
-                                self.parent.face_database[name] = {
-                                    'features': [],
-                                    'images': [],
-                                    'info': {}
-                                }
-
-                            self.parent.face_database[name]['info'] = {
-                                'age': age,
-                                'gender': gender,
-                                'department': department,
-                                'created_at': datetime.now().isoformat()
+                            updates[name] = {
+                                'age': row.get('age', '').strip(),
+                                'gender': row.get('gender', '').strip(),
+                                'department': row.get('department', '').strip()
                             }
-
-                            imported_count += 1
+                    # 与编辑用户信息同一路径：部门变化时迁移分片并标记索引快照过期
+                    self.apply_user_info(updates)
+                    imported_count = len(updates)
 
                     # 保存到数据库
+                    # 导入只更新用户信息，不涉及特征，无需重新加载
                     self.save_face_database()
-                    self.refresh_data()
+                    self.populate_data_table()
 
                     QMessageBox.information(self.parent, "成功", f"成功导入 {imported_count} 条记录")
                     self.parent.update_log(f"导入数据成功: {imported_count} 条记录")
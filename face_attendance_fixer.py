@@ -3,10 +3,14 @@ import os
 import sys
 import uuid
 import logging
+import threading
 import numpy as np
 from datetime import datetime, timedelta
 from PIL import Image, ImageOps
 import face_recognition
+from image_ingest import load_rgb
+from mysql_embeddings import (EMBEDDING_MODEL, encode_embedding, ensure_embedding_columns,
+                              migrate_text_encodings, load_embeddings)
 
 # 尝试导入tkinter，如果失败则提供备选方案
 try:
@@ -45,6 +49,10 @@ os.makedirs(CONFIG['TEMP_DIR'], exist_ok=True)
 class FaceAttendanceFixer:
     def __init__(self, db_connection):
         self.db = db_connection
+        # 已知人脸特征缓存：只在用户新增、更新特征或停用时失效
+        self._known_faces_lock = threading.Lock()
+        self._known_faces_version = 0
+        self._known_faces_cache = None  # (版本号, 特征矩阵, 用户ID列表)
         self.setup_database()
 
     def setup_database(self):
@@ -81,6 +89,15 @@ class FaceAttendanceFixer:
         except Exception as e:
             logging.warning(f"数据库字段检查失败: {str(e)}")
 
+        # users表二进制特征列，并迁移旧的文本特征
+        try:
+            ensure_embedding_columns(self.db)
+            migrated = migrate_text_encodings(self.db, log=logging.warning)
+            if migrated:
+                logging.info(f"已将 {migrated} 个用户的文本特征迁移为二进制特征")
+        except Exception as e:
+            logging.warning(f"二进制特征列迁移失败: {str(e)}")
+
     def select_image_files(self, file_paths=None):
         """
         修复的图片选择功能
@@ -144,7 +161,10 @@ class FaceAttendanceFixer:
             return []
 
     def _process_image_files(self, file_paths):
-        """处理选中的图片文件"""
+        """处理选中的图片文件：只读取文件头校验格式，返回有效图片路径
+
+        检测和特征提取时由 load_face_image 直接解码到工作分辨率，不生成临时文件。
+        """
         valid_images = []
 
         for file_path in file_paths:
@@ -154,25 +174,13 @@ class FaceAttendanceFixer:
                     logging.warning(f"文件不存在: {file_path}")
                     continue
 
-                # 验证图片格式
+                # 验证图片格式（只读取文件头，不解码像素）
                 with Image.open(file_path) as img:
-                    logging.info(f"处理图片: {file_path}, 格式: {img.mode}")
+                    logging.info(f"处理图片: {file_path}, 格式: {img.format}, 模式: {img.mode}, 尺寸: {img.size}")
+                    img.verify()
 
-                    # 转换为RGB格式（如果不是）
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                        logging.info(f"转换为RGB格式")
-
-                    # 调整图片大小（保持比例）
-                    img = self.resize_image_keep_ratio(img, CONFIG['MAX_FACE_SIZE'], CONFIG['MAX_FACE_SIZE'])
-
-                    # 保存临时文件
-                    temp_filename = f"temp_{uuid.uuid4()}.jpg"
-                    temp_path = os.path.join(CONFIG['TEMP_DIR'], temp_filename)
-                    img.save(temp_path, 'JPEG', quality=CONFIG['IMAGE_QUALITY'])
-
-                    valid_images.append(temp_path)
-                    logging.info(f"图片处理成功: {temp_path}")
+                valid_images.append(file_path)
+                logging.info(f"图片处理成功: {file_path}")
 
             except Exception as e:
                 logging.warning(f"图片处理失败 {file_path}: {str(e)}")
@@ -181,6 +189,15 @@ class FaceAttendanceFixer:
         logging.info(f"成功处理 {len(valid_images)} 张图片")
         return valid_images
 
+    def load_face_image(self, image):
+        """图片路径/字节 -> 连续RGB数组，长边不超过 MAX_FACE_SIZE（JPEG在解码阶段缩小）；已是数组时原样返回"""
+        if isinstance(image, np.ndarray):
+            return image
+        rgb, scale = load_rgb(image, CONFIG['MAX_FACE_SIZE'], fit=True)
+        if scale != 1.0:
+            logging.info(f"图片解码缩放: {scale:.3f} -> {rgb.shape[1]}x{rgb.shape[0]}")
+        return rgb
+
     def resize_image_keep_ratio(self, image, max_width, max_height):
         """按比例调整图片大小"""
         try:
@@ -220,11 +237,12 @@ class FaceAttendanceFixer:
             logging.error(f"图片预处理失败 {image_path}: {str(e)}")
             raise
 
-    def detect_faces(self, image_path):
-        """人脸检测"""
+    def detect_faces(self, image_path, image=None):
+        """人脸检测，image 为已解码的RGB数组（为空时从 image_path 读取）"""
         try:
             # 读取图片
-            image = face_recognition.load_image_file(image_path)
+            if image is None:
+                image = self.load_face_image(image_path)
 
             # 人脸检测
             face_locations = face_recognition.face_locations(image)
@@ -253,10 +271,11 @@ class FaceAttendanceFixer:
             logging.error(f"人脸检测失败 {image_path}: {str(e)}")
             return []
 
-    def extract_face_encoding(self, image_path, face_location=None):
-        """提取人脸特征"""
+    def extract_face_encoding(self, image_path, face_location=None, image=None):
+        """提取人脸特征，image 为已解码的RGB数组（为空时从 image_path 读取）"""
         try:
-            image = face_recognition.load_image_file(image_path)
+            if image is None:
+                image = self.load_face_image(image_path)
 
             if face_location:
                 # 指定人脸位置提取特征
@@ -276,37 +295,75 @@ class FaceAttendanceFixer:
             logging.error(f"人脸特征提取失败 {image_path}: {str(e)}")
             return None
 
-    def load_known_faces(self):
-        """加载已知人脸特征"""
+    def load_known_faces(self, force_reload=False):
+        """加载已知人脸特征，返回 (float32特征矩阵 (N, 128), 用户ID列表)
+
+        结果按版本号缓存在进程内，版本号未变化时直接返回缓存，不再查询数据库。
+        """
+        with self._known_faces_lock:
+            cache = self._known_faces_cache
+            if cache is not None and cache[0] == self._known_faces_version and not force_reload:
+                return cache[1], cache[2]
+            version = self._known_faces_version
+
+        try:
+            # 服务端游标流式读取二进制特征，直接写入预分配的矩阵
+            known_user_ids, known_encodings = load_embeddings(self.db, where="status = 1", log=logging.warning)
+            with self._known_faces_lock:
+                # 加载期间缓存被再次失效时不写入，下次调用重新加载
+                if version == self._known_faces_version:
+                    self._known_faces_cache = (version, known_encodings, known_user_ids)
+
+            logging.info(f"加载了 {len(known_user_ids)} 个已知人脸特征（缓存版本 {version}）")
+            return known_encodings, known_user_ids
+
+        except Exception as e:
+            logging.error(f"加载已知人脸失败: {str(e)}")
+            return np.empty((0, 128), dtype=np.float32), []
+
+    def invalidate_known_faces(self):
+        """使已知人脸特征缓存失效（用户新增、特征更新、停用后调用）"""
+        with self._known_faces_lock:
+            self._known_faces_version += 1
+            self._known_faces_cache = None
+
+    def update_user_face_encoding(self, user_id, face_encodings):
+        """更新用户人脸特征（多张照片取平均）"""
         try:
+            avg_encoding = np.mean(np.atleast_2d(face_encodings), axis=0)
+
             cursor = self.db.cursor()
             cursor.execute("""
-                SELECT u.id, u.face_encoding 
-                FROM users u 
-                WHERE u.face_encoding IS NOT NULL AND u.status = 1
-            """)
+                UPDATE users SET face_embedding = %s, embedding_model = %s, updated_at = %s WHERE id = %s
+            """, (encode_embedding(avg_encoding), EMBEDDING_MODEL, datetime.now(), user_id))
+            self.db.commit()
+            self.invalidate_known_faces()
 
-            results = cursor.fetchall()
+            logging.info(f"用户人脸特征更新成功，ID: {user_id}")
+            return True, "人脸特征更新成功"
 
-            known_encodings = []
-            known_user_ids = []
+        except Exception as e:
+            self.db.rollback()
+            logging.error(f"用户人脸特征更新失败: {str(e)}")
+            return False, str(e)
 
-            for user_id, face_encoding_str in results:
-                try:
-                    # 转换特征字符串为numpy数组
-                    face_encoding = np.fromstring(face_encoding_str, dtype=np.float64, sep=',')
-                    known_encodings.append(face_encoding)
-                    known_user_ids.append(user_id)
-                except Exception as e:
-                    logging.warning(f"用户 {user_id} 特征解析失败: {str(e)}")
-                    continue
+    def disable_user(self, user_id):
+        """停用用户，停用后不再参与识别和重复检查"""
+        try:
+            cursor = self.db.cursor()
+            cursor.execute("""
+                UPDATE users SET status = 0, updated_at = %s WHERE id = %s
+            """, (datetime.now(), user_id))
+            self.db.commit()
+            self.invalidate_known_faces()
 
-            logging.info(f"加载了 {len(known_encodings)} 个已知人脸特征")
-            return known_encodings, known_user_ids
+            logging.info(f"用户已停用，ID: {user_id}")
+            return True, "用户已停用"
 
         except Exception as e:
-            logging.error(f"加载已知人脸失败: {str(e)}")
-            return [], []
+            self.db.rollback()
+            logging.error(f"停用用户失败: {str(e)}")
+            return False, str(e)
 
     def check_duplicate_face(self, new_face_encoding):
         """检查是否为重复人脸"""
@@ -314,7 +371,7 @@ class FaceAttendanceFixer:
             # 加载已注册的人脸特征
             known_encodings, known_user_ids = self.load_known_faces()
 
-            if not known_encodings:
+            if len(known_user_ids) == 0:
                 logging.info("无已注册用户，不是重复")
                 return False, None, 0.0
 
@@ -341,20 +398,23 @@ class FaceAttendanceFixer:
     def recognize_face_with_confidence(self, image_path):
         """带置信度过滤的人脸识别"""
         try:
+            # 解码一次，检测和特征提取共用
+            image = self.load_face_image(image_path)
+
             # 人脸检测
-            faces = self.detect_faces(image_path)
+            faces = self.detect_faces(image_path, image)
             if not faces:
                 return None, "未检测到人脸", 0.0
 
             # 提取特征
-            face_encoding = self.extract_face_encoding(image_path, faces[0])
+            face_encoding = self.extract_face_encoding(image_path, faces[0], image)
             if face_encoding is None:
                 return None, "人脸特征提取失败", 0.0
 
             # 与数据库中的人脸比对
             known_encodings, known_user_ids = self.load_known_faces()
 
-            if not known_encodings:
+            if len(known_user_ids) == 0:
                 return None, "暂无注册用户", 0.0
 
             # 计算相似度
@@ -395,14 +455,17 @@ class FaceAttendanceFixer:
 
             for img_path in face_images:
                 try:
+                    # 解码一次，检测和特征提取共用
+                    image = self.load_face_image(img_path)
+
                     # 人脸检测
-                    faces = self.detect_faces(img_path)
+                    faces = self.detect_faces(img_path, image)
                     if not faces:
                         logging.warning(f"跳过无脸图片: {img_path}")
                         continue
 
                     # 提取特征
-                    encoding = self.extract_face_encoding(img_path, faces[0])
+                    encoding = self.extract_face_encoding(img_path, faces[0], image)
                     if encoding is None:
                         logging.warning(f"特征提取失败: {img_path}")
                         continue
@@ -440,7 +503,6 @@ class FaceAttendanceFixer:
 
             # 计算平均特征（多图注册）
             avg_encoding = np.mean(face_encodings, axis=0)
-            encoding_str = ','.join(map(str, avg_encoding))
 
             # 保存用户信息
             cursor = self.db.cursor()
@@ -448,10 +510,11 @@ class FaceAttendanceFixer:
 
             # 插入用户记录
             cursor.execute("""
-                INSERT INTO users (name, age, gender, department, face_encoding, 
+                INSERT INTO users (name, age, gender, department, face_embedding, embedding_model,
                                  created_at, updated_at, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, 1)
-            """, (name, age, gender, department, encoding_str, current_time, current_time))
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1)
+            """, (name, age, gender, department, encode_embedding(avg_encoding), EMBEDDING_MODEL,
+                  current_time, current_time))
 
             user_id = cursor.lastrowid
             logging.info(f"用户创建成功，ID: {user_id}")
@@ -461,7 +524,7 @@ class FaceAttendanceFixer:
                 is_primary = 1 if i == 0 else 0  # 第一张设为主照片
 
                 # 生成保存路径
-                img_filename = f"user_{user_id}_{uuid.uuid4()}.jpg"
+                img_filename = f"user_{user_id}_{uuid.uuid4()}{os.path.splitext(img_path)[1].lower() or '.jpg'}"
                 save_dir = os.path.join("face_images", str(user_id))
                 os.makedirs(save_dir, exist_ok=True)
                 save_path = os.path.join(save_dir, img_filename)
@@ -480,6 +543,7 @@ class FaceAttendanceFixer:
                 logging.info(f"人脸图片保存成功: {save_path}")
 
             self.db.commit()
+            self.invalidate_known_faces()
             logging.info(f"用户注册完成，ID: {user_id}")
             return True, f"用户注册成功，ID: {user_id}"
 
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+人脸质量评分
+在计算特征点和 ResNet 特征之前给人脸打分，低质量人脸提前丢弃，既节省 CPU，也避免模糊、过暗、侧脸的
+图像产生跳变的匹配结果。各分项取值 0~1：
+
+    size        人脸框短边 / min_face_size
+    blur        人脸区域（缩放到固定宽度后）拉普拉斯方差 / face_quality_blur_reference
+    brightness  人脸区域平均亮度落在 [60, 190] 内为 1，向 0 和 255 线性下降
+    pose        由 68 点特征点估计的偏航与翻滚角
+
+总分为各分项的几何平均。pre_score 只用前三项（不需要特征点），pose 在特征点计算后补充。
+"""
+
+import math
+import cv2
+import numpy as np
+
+QUALITY_WIDTH = 64  # 计算清晰度前把人脸区域缩放到的宽度，使不同大小的人脸可比
+
+
+class FaceQuality:
+    """人脸质量评分器"""
+
+    def __init__(self, min_face_size=100, blur_reference=100.0, min_score=0.4):
+        self.min_face_size = max(1, min_face_size)
+        self.blur_reference = blur_reference
+        self.min_score = min_score  # 低于该总分的人脸不计算特征
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(min_face_size=config.get('min_face_size', 100),
+                   blur_reference=config.get('face_quality_blur_reference', 100.0),
+                   min_score=config.get('face_quality_min_score', 0.4))
+
+    @staticmethod
+    def combine(scores):
+        """各分项的几何平均"""
+        values = [max(1e-6, value) for value in scores.values()]
+        return float(math.exp(sum(math.log(value) for value in values) / len(values)))
+
+    def pre_score(self, frame, box):
+        """特征点之前的评分：尺寸、清晰度、亮度，返回 (总分, 分项)"""
+        left, top, right, bottom = box
+        scores = {'size': min(1.0, min(right - left, bottom - top) / self.min_face_size)}
+        crop = frame[max(0, top):bottom + 1, max(0, left):right + 1]
+        if crop.size == 0:
+            return 0.0, dict(scores, blur=0.0, brightness=0.0)
+        gray = cv2.cvtColor(np.ascontiguousarray(crop), cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+        if gray.shape[1] != QUALITY_WIDTH:
+            height = max(1, int(round(gray.shape[0] * QUALITY_WIDTH / gray.shape[1])))
+            gray = cv2.resize(gray, (QUALITY_WIDTH, height), interpolation=cv2.INTER_AREA)
+        scores['blur'] = min(1.0, float(cv2.Laplacian(gray, cv2.CV_64F).var()) / self.blur_reference)
+        mean = float(gray.mean())
+        if mean < 60:
+            scores['brightness'] = mean / 60
+        elif mean > 190:
+            scores['brightness'] = (255 - mean) / 65
+        else:
+            scores['brightness'] = 1.0
+        return self.combine(scores), scores
+
+    @staticmethod
+    def landmark_pose(shape):
+        """由 68 点特征点估计姿态：鼻尖偏离两眼中点（偏航）和两眼连线倾角（翻滚）"""
+        points = np.array([(shape.part(i).x, shape.part(i).y) for i in (36, 39, 42, 45, 30)], dtype=np.float64)
+        left_eye = points[0:2].mean(axis=0)
+        right_eye = points[2:4].mean(axis=0)
+        nose = points[4]
+        eye_vector = right_eye - left_eye
+        interocular = np.linalg.norm(eye_vector)
+        if interocular < 1e-6:
+            return 0.0
+        # 鼻尖在两眼连线方向上偏离中点的比例，正脸约为 0，侧脸约 0.5 以上
+        yaw = abs(np.dot(nose - (left_eye + right_eye) / 2, eye_vector / interocular)) / interocular
+        roll = abs(math.atan2(eye_vector[1], eye_vector[0]))
+        yaw_score = max(0.0, 1.0 - yaw / 0.5)
+        roll_score = max(0.0, 1.0 - roll / (math.pi / 4))
+        return yaw_score * roll_score
+
+    def with_pose(self, scores, shape):
+        """在 pre_score 分项的基础上加入特征点姿态，返回 (总分, 分项)"""
+        scores = dict(scores, pose=self.landmark_pose(shape))
+        return self.combine(scores), scores
+
+    def accept(self, total):
+        return total >= self.min_score
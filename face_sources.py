@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+人脸数据来源汇总
+从特征文件（二进制特征库或旧版CSV）、MySQL 用户/照片表与二进制特征、照片目录清单
+汇总出 face_database，并返回重建特征库索引所需的 (行姓名列表, 特征矩阵)。
+
+不依赖界面，主程序启动加载、后台重建索引快照和 gallery_tools build-index 共用同一套逻辑。
+"""
+
+import os
+import csv
+import time
+import numpy as np
+
+from mysql_embeddings import load_embeddings
+
+
+def _entry(face_database, name):
+    """取得（必要时创建）某人的条目"""
+    if name not in face_database:
+        face_database[name] = {
+            'features': [],
+            'images': [],
+            'info': {}
+        }
+    return face_database[name]
+
+
+def fill_store_features(face_database, row_names, matrix):
+    """把二进制特征库的行写入 face_database（特征为矩阵行的视图，不复制）"""
+    for name in dict.fromkeys(row_names):
+        _entry(face_database, name)['features'] = []
+    for row, name in enumerate(row_names):
+        face_database[name]['features'].append(matrix[row])
+
+
+def load_csv_features(face_database, features_file, dim=128):
+    """从旧版CSV特征文件加载特征"""
+    loaded_names = set()
+    with open(features_file, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            name = row['name']
+            entry = _entry(face_database, name)
+            # 重新加载时以文件为准，避免特征重复追加
+            if name not in loaded_names:
+                entry['features'] = []
+                loaded_names.add(name)
+            # 提取特征向量
+            features = []
+            for i in range(dim):
+                feature_key = f'feature_{i}'
+                if feature_key in row:
+                    features.append(float(row[feature_key]))
+            if features:
+                entry['features'].append(features)
+
+
+def load_mysql_users(face_database, db_conn):
+    """用户和照片一次联表查询，按用户ID排序后单遍合并（不读取特征列）"""
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT u.id, u.name, u.age, u.gender, u.department, u.created_at, u.updated_at,
+                   f.image_path
+            FROM users u
+            LEFT JOIN face_images f ON f.user_id = u.id
+            ORDER BY u.id, f.id
+        """)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    current_id = None
+    images = None
+    for row in rows:
+        if row['id'] != current_id:
+            current_id = row['id']
+            entry = _entry(face_database, row['name'])
+            # 更新用户信息
+            entry['info'].update({
+                'age': str(row['age']) if row['age'] is not None else '',
+                'gender': row['gender'] if row['gender'] is not None else '',
+                'department': row['department'] if row['department'] is not None else '',
+                'created_at': row['created_at'].isoformat() if row['created_at'] is not None else '',
+                'updated_at': row['updated_at'].isoformat() if row['updated_at'] is not None else ''
+            })
+            images = []
+            entry['images'] = images
+        # 加载用户照片
+        if row['image_path'] is not None:
+            images.append(row['image_path'])
+
+
+def load_mysql_only_features(face_database, db_conn, log=print, chunk_size=500):
+    """本地特征库中没有模板的用户，使用MySQL中的二进制特征
+
+    只按姓名查询这些用户（IN 列表分批），不读取整张表；返回 {姓名: 特征}。
+    """
+    missing = [name for name, data in face_database.items() if not data['features']]
+    mysql_only = {}
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        mysql_names, mysql_matrix = load_embeddings(
+            db_conn, key_column='name', where=f"name IN ({', '.join(['%s'] * len(chunk))})",
+            params=chunk, log=log)
+        for row, name in enumerate(mysql_names):
+            if name in face_database and not face_database[name]['features']:
+                face_database[name]['features'] = [mysql_matrix[row]]
+                mysql_only[name] = mysql_matrix[row]
+    return mysql_only
+
+
+def load_photo_paths(face_database, photo_manifest):
+    """从照片目录清单加载照片路径，只重新列出 mtime 变化的用户目录，返回 (重新列出的目录数, 计算哈希的文件数)"""
+    rescanned, hashed = photo_manifest.refresh()
+    photo_manifest.save()
+    for name in photo_manifest.names():
+        _entry(face_database, name)['images'] = photo_manifest.photos(name)
+    return rescanned, hashed
+
+
+def gallery_rows(face_database, dim=128):
+    """face_database 中全部特征 -> (行姓名列表, 特征矩阵)"""
+    names = []
+    rows = []
+    for name, data in face_database.items():
+        for features in data.get('features', []):
+            if len(features) == dim:
+                names.append(name)
+                rows.append(features)
+    return names, np.asarray(rows, dtype=np.float32).reshape(-1, dim)
+
+
+def load_sources(config, face_database, store_loader=None, db_conn=None, photo_manifest=None, log=print, dim=128):
+    """汇总全部数据来源到 face_database，返回 (行姓名列表, 特征矩阵, 各阶段耗时)
+
+    store_loader: 返回二进制特征库 (行姓名列表, 特征矩阵) 的函数，为 None 时读取旧版CSV特征文件；
+    db_conn: MySQL连接（DictCursor），为 None 时跳过MySQL；
+    photo_manifest: 照片目录清单，为 None 时跳过照片目录。
+    """
+    timings = {}  # 各阶段耗时（秒）
+    phase_start = time.perf_counter()
+    store_arrays = None
+    mysql_only = {}  # 仅在MySQL中有特征的用户: 姓名 -> 特征
+    features_file = os.path.join(config.get('database_path', 'face_database'),
+                                 config.get('features_file', 'face_features.csv'))
+    if store_loader is not None:
+        # 从二进制特征库加载特征（内存映射）
+        store_arrays = store_loader()
+        fill_store_features(face_database, *store_arrays)
+    elif os.path.exists(features_file):
+        load_csv_features(face_database, features_file, dim)
+    timings['特征'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    if db_conn is not None:
+        try:
+            load_mysql_users(face_database, db_conn)
+        except Exception as e:
+            log(f"从MySQL加载用户信息失败: {str(e)}")
+        timings['MySQL用户'] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+
+        try:
+            mysql_only = load_mysql_only_features(face_database, db_conn, log=log)
+            if mysql_only:
+                log(f"从MySQL加载 {len(mysql_only)} 个仅有MySQL特征的用户")
+        except Exception as e:
+            log(f"从MySQL加载二进制特征失败: {str(e)}")
+        timings['MySQL特征'] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+
+    if photo_manifest is not None:
+        try:
+            rescanned, hashed = load_photo_paths(face_database, photo_manifest)
+            if rescanned:
+                log(f"照片清单刷新: 重新列出 {rescanned} 个用户目录，计算 {hashed} 个文件哈希")
+        except Exception as e:
+            log(f"刷新照片清单失败: {str(e)}")
+        timings['照片目录'] = time.perf_counter() - phase_start
+
+    # 二进制特征库直接使用连续矩阵，无需逐行收集
+    if store_arrays is not None:
+        row_names, matrix = store_arrays
+        if mysql_only:
+            row_names = list(row_names) + list(mysql_only)
+            matrix = np.concatenate([np.asarray(matrix, dtype=np.float32),
+                                     np.asarray(list(mysql_only.values()), dtype=np.float32).reshape(-1, dim)])
+        return list(row_names), matrix, timings
+    row_names, matrix = gallery_rows(face_database, dim)
+    return row_names, matrix, timings
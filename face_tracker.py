@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+先跟踪后检测（多人脸，持久跟踪ID）
+整帧 HOG 检测是实时识别中最耗 CPU 的步骤。跟踪器每 N 帧做一次整帧检测，其间用低成本方法更新已知人脸框：
+
+    correlation  dlib 相关滤波跟踪器，峰值旁瓣比（PSR）作为跟踪置信度
+    roi          在上一帧人脸框外扩的 ROI 内缩小后重新检测，按 IOU 取回同一张人脸
+
+跟踪置信度低于阈值或人脸在 ROI 中丢失时，下一帧立即做整帧检测。
+整帧检测结果按 IOU 与已有跟踪关联，同一个人在离开画面前保持同一个跟踪ID，
+识别稳定化（投票历史、固定结果）按跟踪ID分别进行，人脸特征也按轨迹缓存复用。
+检测间隔、ROI 外扩比例等参数可以按摄像头位置单独配置（camera_tracking）。
+"""
+
+import dlib
+import cv2
+import numpy as np
+
+TRACKING_KEYS = ('track_method', 'track_detect_interval', 'track_roi_expand', 'track_min_confidence')
+
+
+def tracking_config(config, camera_id=None):
+    """某个摄像头的跟踪参数：全局配置 + camera_tracking 中该摄像头的覆盖项"""
+    params = {key: config.get(key) for key in TRACKING_KEYS}
+    overrides = config.get('camera_tracking', {}).get(camera_id, {}) if camera_id is not None else {}
+    params.update({key: value for key, value in overrides.items() if key in TRACKING_KEYS})
+    return params
+
+
+def box_iou(a, b):
+    """两个 (左, 上, 右, 下) 框的交并比"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    inter = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def clip_box(box, width, height):
+    """把框裁剪到图像范围内，返回整数 (左, 上, 右, 下)；裁剪后为空时返回 None"""
+    left = max(0, int(round(box[0])))
+    top = max(0, int(round(box[1])))
+    right = min(width - 1, int(round(box[2])))
+    bottom = min(height - 1, int(round(box[3])))
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def to_rect(box):
+    return dlib.rectangle(int(box[0]), int(box[1]), int(box[2]), int(box[3]))
+
+
+class FaceTrack:
+    """一张被跟踪的人脸，track_id 在人脸离开画面前保持不变"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box  # (左, 上, 右, 下)
+        self.tracker = None  # dlib.correlation_tracker（correlation 模式）
+        self.confidence = None  # 最近一次跟踪置信度
+        # 特征缓存：同一条轨迹只在人脸质量明显提高或超过刷新间隔时重新计算特征
+        self.descriptor = None
+        self.match = None  # 缓存特征的匹配结果 {'name', 'distance', 'confidence'}
+        self.quality = 0.0  # 计算缓存特征时的人脸质量
+        self.computed_at = 0.0  # 计算缓存特征的时间（time.monotonic）
+
+    def needs_descriptor(self, quality, now, refresh_interval, quality_gain):
+        """是否需要重新计算特征：尚无缓存、超过刷新间隔，或质量比缓存时提高 quality_gain 以上"""
+        if self.descriptor is None or now - self.computed_at >= refresh_interval:
+            return True
+        return quality > self.quality * (1.0 + quality_gain)
+
+    def store_descriptor(self, descriptor, match, quality, now):
+        self.descriptor = descriptor
+        self.match = match
+        self.quality = quality
+        self.computed_at = now
+
+
+class FaceTracker:
+    """先跟踪后检测（每个摄像头一个实例，只在该摄像头的识别线程中使用）"""
+
+    def __init__(self, detector, method='correlation', detect_interval=5, roi_expand=0.5, min_confidence=7.0,
+                 roi_face_size=100, match_iou=0.3):
+        self.detector = detector
+        self.method = method
+        self.detect_interval = max(1, int(detect_interval))  # 每 N 帧整帧检测一次
+        self.roi_expand = roi_expand  # ROI 在人脸框四周外扩的比例（相对框宽高）
+        self.min_confidence = min_confidence  # correlation 模式的最低 PSR
+        self.roi_face_size = roi_face_size  # ROI 检测时把人脸缩放到约该像素宽度
+        self.match_iou = match_iou  # 整帧检测结果与已有跟踪关联的最低 IOU
+        self.tracks = []
+        self.next_track_id = 1
+        self.frames_since_detection = 0
+        self.force_detection = True
+        self.detections = 0  # 整帧检测次数
+        self.frames = 0  # 处理帧数
+        self.descriptor_computes = 0  # 重新计算特征的人脸数
+        self.descriptor_reuses = 0  # 复用缓存特征的人脸数
+        self.quality_rejections = 0  # 因质量不足未计算特征的人脸数
+
+    @classmethod
+    def from_config(cls, config, detector, camera_id=None):
+        params = tracking_config(config, camera_id)
+        return cls(detector,
+                   method=params['track_method'] or 'correlation',
+                   detect_interval=params['track_detect_interval'] or 1,
+                   roi_expand=params['track_roi_expand'] if params['track_roi_expand'] is not None else 0.5,
+                   min_confidence=params['track_min_confidence'] if params['track_min_confidence'] is not None
+                   else 7.0)
+
+    def counters(self):
+        """整帧检测与特征复用统计（合并到摄像头流水线统计中）"""
+        return {
+            'detections': self.detections,
+            'tracked_frames': self.frames,
+            'descriptor_computes': self.descriptor_computes,
+            'descriptor_reuses': self.descriptor_reuses,
+            'quality_rejections': self.quality_rejections
+        }
+
+    def reset(self):
+        self.tracks = []
+        self.force_detection = True
+
+    def update(self, frame):
+        """处理一帧，返回 (当前的 FaceTrack 列表, 本帧是否做了整帧检测)"""
+        self.frames += 1
+        if self.force_detection or self.frames_since_detection + 1 >= self.detect_interval:
+            self.detect(frame)
+            return list(self.tracks), True
+        self.frames_since_detection += 1
+        if self.method == 'roi':
+            self.track_roi(frame)
+        else:
+            self.track_correlation(frame)
+        return list(self.tracks), False
+
+    def associate(self, boxes):
+        """按 IOU 从大到小贪心关联检测框和已有跟踪，返回 {检测序号: 跟踪}"""
+        pairs = []
+        for i, box in enumerate(boxes):
+            for track in self.tracks:
+                iou = box_iou(box, track.box)
+                if iou >= self.match_iou:
+                    pairs.append((iou, i, track))
+        pairs.sort(key=lambda item: item[0], reverse=True)
+        matched = {}
+        used = set()
+        for iou, i, track in pairs:
+            if i in matched or track.track_id in used:
+                continue
+            matched[i] = track
+            used.add(track.track_id)
+        return matched
+
+    def detect(self, frame):
+        """整帧检测：与已有跟踪关联的人脸沿用原 ID，新出现的人脸分配新 ID，未再检测到的跟踪结束"""
+        height, width = frame.shape[:2]
+        boxes = []
+        for rect in self.detector(frame):
+            box = clip_box((rect.left(), rect.top(), rect.right(), rect.bottom()), width, height)
+            if box is not None:
+                boxes.append(box)
+        matched = self.associate(boxes)
+        tracks = []
+        for i, box in enumerate(boxes):
+            track = matched.get(i)
+            if track is None:
+                track = FaceTrack(self.next_track_id, box)
+                self.next_track_id += 1
+            track.box = box
+            if self.method != 'roi':
+                track.tracker = dlib.correlation_tracker()
+                track.tracker.start_track(frame, to_rect(box))
+            tracks.append(track)
+        self.tracks = tracks
+        self.detections += 1
+        self.frames_since_detection = 0
+        self.force_detection = False
+
+    def track_correlation(self, frame):
+        """相关滤波跟踪：PSR 低于阈值的人脸保留本帧位置，并要求下一帧整帧检测"""
+        height, width = frame.shape[:2]
+        kept = []
+        for track in self.tracks:
+            track.confidence = track.tracker.update(frame)
+            position = track.tracker.get_position()
+            box = clip_box((position.left(), position.top(), position.right(), position.bottom()), width, height)
+            if box is None:
+                self.force_detection = True
+                continue
+            track.box = box
+            if track.confidence < self.min_confidence:
+                self.force_detection = True
+            kept.append(track)
+        self.tracks = kept
+
+    def track_roi(self, frame):
+        """ROI 跟踪：在外扩并缩小的 ROI 内重新检测，取与上一帧框 IOU 最大的检测结果"""
+        height, width = frame.shape[:2]
+        kept = []
+        for track in self.tracks:
+            left, top, right, bottom = track.box
+            margin_x = (right - left) * self.roi_expand
+            margin_y = (bottom - top) * self.roi_expand
+            roi = clip_box((left - margin_x, top - margin_y, right + margin_x, bottom + margin_y), width, height)
+            if roi is None:
+                self.force_detection = True
+                continue
+            scale = min(1.0, self.roi_face_size / max(1, right - left))
+            crop = np.ascontiguousarray(frame[roi[1]:roi[3] + 1, roi[0]:roi[2] + 1])
+            if scale < 1.0:
+                crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                scale = crop.shape[1] / (roi[2] - roi[0] + 1)
+            best_box = None
+            best_iou = 0.0
+            for rect in self.detector(crop):
+                box = (roi[0] + rect.left() / scale, roi[1] + rect.top() / scale,
+                       roi[0] + rect.right() / scale, roi[1] + rect.bottom() / scale)
+                iou = box_iou(box, track.box)
+                if iou > best_iou:
+                    best_box, best_iou = box, iou
+            track.confidence = best_iou
+            box = clip_box(best_box, width, height) if best_box is not None else None
+            if box is None:
+                # ROI 内找不到这张人脸：丢弃该跟踪，下一帧整帧检测
+                self.force_detection = True
+                continue
+            track.box = box
+            kept.append(track)
+        self.tracks = kept
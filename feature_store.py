@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+二进制特征库存储
+替代 face_features.csv 的文本格式，目录结构：
+
+    feature_store/
+        header.json            头信息：格式版本、维度、行数、当前特征文件名
+        features.<代>.npy      float32 (N, 128) 特征矩阵，标准 .npy 格式，以内存映射方式读取
+        names.<代>.json        旁路文件：每行的姓名和采集时间
+        journal.log            追加写日志：基础文件之后的 add/remove 模板记录
+
+每次保存写入新一代的文件，最后替换 header.json 作为提交点；
+读取方始终按 header 打开完整的一代文件，旧文件在下次保存时清理。
+
+录入、更新、删除只向日志追加记录（代价与特征库规模无关），fsync 按条数/时间批量执行；
+后台线程在日志积累到一定条数后把日志合并进新一代基础文件（压缩），
+启动时只需重放 header 中 journal_seq 之后的日志尾部。
+"""
+
+import os
+import csv
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+
+STORE_FORMAT = 'face-feature-store'
+STORE_VERSION = 1
+MAX_BACKGROUND_BACKOFF = 60.0  # 后台同步/压缩连续失败时的最长重试间隔（秒）
+
+
+class FeatureStore:
+    """内存映射特征库存储"""
+
+    def __init__(self, path, dim=128, sync_batch=32, sync_interval=1.0, compact_records=1000):
+        self.path = path
+        self.dim = dim
+        self.header_file = os.path.join(path, 'header.json')
+        self.journal = FeatureJournal(os.path.join(path, 'journal.log'), dim, sync_batch, sync_interval)
+        self.compact_records = compact_records  # 日志尾部达到该条数时后台压缩
+        self.compact_lock = threading.Lock()
+        self._worker = None
+        self._stop_event = threading.Event()
+        self._on_error = print
+        self.failures = 0  # 后台同步/压缩连续失败次数
+        self.last_error = None
+
+    @classmethod
+    def from_config(cls, config, dim=128):
+        """根据系统配置创建存储"""
+        return cls(os.path.join(config.get('database_path', 'face_database'),
+                                config.get('feature_store_dir', 'feature_store')), dim,
+                   sync_batch=config.get('journal_sync_batch', 32),
+                   sync_interval=config.get('journal_sync_interval', 1.0),
+                   compact_records=config.get('journal_compact_records', 1000))
+
+    def exists(self):
+        return os.path.exists(self.header_file)
+
+    def read_header(self):
+        with open(self.header_file, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('format') != STORE_FORMAT or header.get('dim') != self.dim:
+            raise ValueError(f"特征库格式不匹配: {self.header_file}")
+        return header
+
+    def load(self):
+        """读取特征库，返回 (行姓名列表, 采集时间列表, 只读内存映射特征矩阵)"""
+        header = self.read_header()
+        with open(os.path.join(self.path, header['names_file']), 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        names = sidecar['names']
+        timestamps = sidecar['timestamps']
+
+        if header['count'] == 0:
+            matrix = np.empty((0, self.dim), dtype=np.float32)
+        else:
+            # 只映射文件，不读入内存；数据按需从页缓存读取
+            matrix = np.load(os.path.join(self.path, header['features_file']), mmap_mode='r')
+        if matrix.shape != (header['count'], self.dim) or len(names) != header['count']:
+            raise ValueError(f"特征库文件不完整: {self.path}")
+        return names, timestamps, matrix
+
+    def save(self, row_names, timestamps, matrix, source=None, journal_seq=None):
+        """写入新一代特征库文件并提交；journal_seq 为已合并进本代文件的最后一条日志序号"""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        if len(row_names) != matrix.shape[0] or len(timestamps) != matrix.shape[0]:
+            raise ValueError("姓名、时间与特征行数不一致")
+        os.makedirs(self.path, exist_ok=True)
+
+        generation = 1
+        previous = None
+        if self.exists():
+            previous = self.read_header()
+            generation = previous.get('generation', 0) + 1
+
+        features_file = f'features.{generation}.npy'
+        names_file = f'names.{generation}.json'
+        if matrix.shape[0]:
+            target = np.lib.format.open_memmap(os.path.join(self.path, features_file), mode='w+',
+                                               dtype=np.float32, shape=matrix.shape)
+            target[:] = matrix
+            target.flush()
+            del target
+        with open(os.path.join(self.path, names_file), 'w', encoding='utf-8') as f:
+            json.dump({'names': list(row_names), 'timestamps': list(timestamps)}, f, ensure_ascii=False)
+
+        header = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'dim': self.dim,
+            'dtype': 'float32',
+            'count': int(matrix.shape[0]),
+            'generation': generation,
+            'features_file': features_file,
+            'names_file': names_file,
+            'updated_at': datetime.now().isoformat(),
+            'source': source or (previous or {}).get('source', ''),
+            'journal_seq': journal_seq if journal_seq is not None else (previous or {}).get('journal_seq', 0)
+        }
+        temp_header = self.header_file + '.tmp'
+        with open(temp_header, 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_header, self.header_file)
+        self.remove_stale_generations(generation)
+        return header
+
+    def base_journal_seq(self):
+        """已合并进基础文件的最后一条日志序号"""
+        return self.read_header().get('journal_seq', 0) if self.exists() else 0
+
+    def open_journal(self):
+        """打开日志用于追加（不读取基础文件）"""
+        with self.compact_lock:
+            if self.journal.handle is None:
+                self.journal.open(self.base_journal_seq())
+
+    def snapshot(self, open_journal=True):
+        """读取基础文件和日志尾部（与压缩互斥），返回合并后的 (行姓名列表, 采集时间列表, 特征矩阵)
+
+        首次调用时打开日志用于追加；open_journal=False 时只读（离线工具读取运行中的特征库）。
+        日志尾部为空时直接返回基础文件的内存映射。
+        """
+        with self.compact_lock:
+            if self.exists():
+                names, timestamps, matrix = self.load()
+            else:
+                names, timestamps, matrix = [], [], np.empty((0, self.dim), dtype=np.float32)
+            base_seq = self.base_journal_seq()
+            if self.journal.handle is None and open_journal:
+                tail = self.journal.open(base_seq)
+            else:
+                tail = [r for r in self.journal.read_records() if r['seq'] > base_seq]
+        if tail:
+            names, timestamps, matrix = apply_journal_records(names, timestamps, matrix, tail, self.dim)
+        return names, timestamps, matrix
+
+    def append_add(self, name, features, timestamps=None):
+        """追加：为某人新增模板"""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        if timestamps is None:
+            timestamps = [datetime.now().isoformat()] * features.shape[0]
+        return self.journal.append([{'op': 'add', 'name': name, 'timestamps': list(timestamps),
+                                     'features': features}])
+
+    def append_remove(self, name):
+        """追加：删除某人的全部模板"""
+        return self.journal.append([{'op': 'remove', 'name': name}])
+
+    def append_replace(self, name, features, timestamps=None):
+        """追加：替换某人的全部模板（remove + add 一次写入）"""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        if timestamps is None:
+            timestamps = [datetime.now().isoformat()] * features.shape[0]
+        return self.journal.append([{'op': 'remove', 'name': name},
+                                    {'op': 'add', 'name': name, 'timestamps': list(timestamps),
+                                     'features': features}])
+
+    def sync(self):
+        self.journal.sync()
+
+    def compact(self):
+        """把日志合并进新一代基础文件，返回合并的日志条数
+
+        合并期间只持有压缩锁，不阻塞新的追加；
+        提交新的 header 后再截掉已合并的日志，崩溃后重放会按 journal_seq 跳过已合并记录。
+        """
+        with self.compact_lock:
+            self.journal.sync()
+            base_seq = self.base_journal_seq()
+            records = [r for r in self.journal.read_records() if r['seq'] > base_seq]
+            if not records:
+                return 0
+            last_seq = records[-1]['seq']
+
+            if self.exists():
+                names, timestamps, matrix = self.load()
+            else:
+                names, timestamps, matrix = [], [], np.empty((0, self.dim), dtype=np.float32)
+            names, timestamps, matrix = apply_journal_records(names, timestamps, matrix, records, self.dim)
+            self.save(names, timestamps, matrix, journal_seq=last_seq)
+            self.journal.truncate_through(last_seq)
+            return len(records)
+
+    def start_background(self, on_error=None):
+        """启动后台线程：定时执行批量fsync，日志尾部过长时压缩
+
+        on_error(消息) 在后台线程中调用，报告 fsync/压缩失败（如磁盘已满、无写权限），缺省时打印到控制台。
+        """
+        if self._worker is not None:
+            return
+        self._on_error = on_error or print
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._background_loop, name='feature-store', daemon=True)
+        self._worker.start()
+
+    def _background_loop(self):
+        delay = self.journal.sync_interval
+        while not self._stop_event.wait(delay):
+            try:
+                self.journal.sync()
+                if self.journal.tail_records >= self.compact_records:
+                    self.compact()
+            except Exception as e:
+                # 失败后按倍数退避重试，恢复后回到正常周期；日志仍在，数据不会丢失
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(self.journal.sync_interval * 2 ** self.failures, MAX_BACKGROUND_BACKOFF)
+                self._on_error(f"特征库后台同步/压缩失败（第{self.failures}次），{delay:.1f}秒后重试: {e}")
+                continue
+            if self.failures:
+                self._on_error(f"特征库后台同步/压缩已恢复（此前连续失败{self.failures}次）")
+                self.failures = 0
+                self.last_error = None
+            delay = self.journal.sync_interval
+
+    def close(self):
+        """停止后台线程并把未落盘的日志写入磁盘"""
+        self._stop_event.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.journal.close()
+
+    def remove_stale_generations(self, current):
+        """删除旧一代文件；仍被映射的文件（Windows）删除失败时留到下次清理"""
+        for file_name in os.listdir(self.path):
+            parts = file_name.split('.')
+            if len(parts) == 3 and parts[0] in ('features', 'names') and parts[1].isdigit() \
+                    and int(parts[1]) != current:
+                try:
+                    os.remove(os.path.join(self.path, file_name))
+                except OSError:
+                    pass
+
+
+class FeatureJournal:
+    """追加写日志
+
+    每条记录一行 JSON：{"seq", "op": "add"|"remove", "name", "timestamps", "features"}，
+    features 为 float32 原始字节的 base64。写入后立即 flush 到操作系统，
+    累计 sync_batch 条或距上次 fsync 超过 sync_interval 秒时才 fsync。
+    """
+
+    def __init__(self, path, dim=128, sync_batch=32, sync_interval=1.0):
+        self.path = path
+        self.dim = dim
+        self.sync_batch = sync_batch
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.handle = None
+        self.last_seq = 0
+        self.tail_records = 0  # 基础文件之后的日志条数
+        self.pending = 0  # 已写入但未fsync的记录数
+        self.last_sync = time.monotonic()
+
+    def encode(self, record):
+        record = dict(record)
+        if 'features' in record:
+            record['features'] = base64.b64encode(
+                np.ascontiguousarray(record['features'], dtype=np.float32).tobytes()).decode('ascii')
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+    def decode(self, line):
+        record = json.loads(line)
+        if 'features' in record:
+            record['features'] = np.frombuffer(base64.b64decode(record['features']),
+                                               dtype=np.float32).reshape(-1, self.dim)
+        return record
+
+    def read_records(self):
+        """读取完整的日志记录；末尾写了一半的记录（崩溃）被忽略"""
+        records, _ = self._read_valid_prefix()
+        return records
+
+    def _read_valid_prefix(self):
+        records = []
+        valid_bytes = 0
+        if not os.path.exists(self.path):
+            return records, valid_bytes
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                try:
+                    records.append(self.decode(raw.decode('utf-8')))
+                except (ValueError, KeyError):
+                    break
+                valid_bytes += len(raw)
+        return records, valid_bytes
+
+    def open(self, base_seq):
+        """打开日志用于追加，返回 seq 大于 base_seq 的记录"""
+        with self.lock:
+            records, valid_bytes = self._read_valid_prefix()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.handle = open(self.path, 'ab')
+            # 截掉崩溃时写了一半的记录，保证之后追加的记录可读
+            if self.handle.tell() != valid_bytes:
+                self.handle.truncate(valid_bytes)
+            tail = [r for r in records if r['seq'] > base_seq]
+            self.last_seq = max([base_seq] + [r['seq'] for r in records])
+            self.tail_records = len(tail)
+            return tail
+
+    def append(self, records):
+        """追加一组记录（一次写入），返回最后一条记录的序号"""
+        with self.lock:
+            if self.handle is None:
+                raise RuntimeError("特征日志未打开")
+            lines = []
+            for record in records:
+                self.last_seq += 1
+                lines.append(self.encode(dict(record, seq=self.last_seq)))
+            self.handle.write(''.join(lines).encode('utf-8'))
+            self.handle.flush()
+            self.tail_records += len(records)
+            self.pending += len(records)
+            if self.pending >= self.sync_batch or time.monotonic() - self.last_sync >= self.sync_interval:
+                self._sync_locked()
+            return self.last_seq
+
+    def _sync_locked(self):
+        if self.handle is not None and self.pending:
+            os.fsync(self.handle.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        with self.lock:
+            self._sync_locked()
+
+    def truncate_through(self, seq):
+        """删除序号不大于 seq 的记录（已合并进基础文件），保留压缩期间新追加的记录"""
+        with self.lock:
+            self._sync_locked()
+            keep = [r for r in self.read_records() if r['seq'] > seq]
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(''.join(self.encode(r) for r in keep).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            if self.handle is not None:
+                self.handle.close()
+            os.replace(temp_path, self.path)
+            self.handle = open(self.path, 'ab')
+            self.tail_records = len(keep)
+
+    def close(self):
+        with self.lock:
+            self._sync_locked()
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+
+def apply_journal_records(names, timestamps, matrix, records, dim=128):
+    """把日志记录应用到基础数据上，返回新的 (行姓名列表, 采集时间列表, 特征矩阵)
+
+    未被日志触及的行保持原有采集时间；每人新增的模板追加在末尾。
+    """
+    removed = set()  # 基础数据中被删除的姓名
+    added = OrderedDict()  # 姓名 -> ([采集时间], [特征块])
+    for record in records:
+        name = record['name']
+        if record['op'] == 'remove':
+            removed.add(name)
+            added.pop(name, None)
+        elif record['op'] == 'add':
+            stamps, blocks = added.setdefault(name, ([], []))
+            stamps.extend(record['timestamps'])
+            blocks.append(record['features'])
+
+    keep = np.array([i for i, name in enumerate(names) if name not in removed], dtype=np.int64)
+    new_names = [names[i] for i in keep]
+    new_timestamps = [timestamps[i] for i in keep]
+    parts = [np.asarray(matrix)[keep]] if len(keep) else []
+    for name, (stamps, blocks) in added.items():
+        new_names.extend([name] * len(stamps))
+        new_timestamps.extend(stamps)
+        parts.extend(blocks)
+    new_matrix = np.concatenate(parts).astype(np.float32, copy=False) if parts \
+        else np.empty((0, dim), dtype=np.float32)
+    return new_names, new_timestamps, new_matrix
+
+
+def read_features_csv(features_file, dim=128):
+    """读取旧版特征CSV，返回 (行姓名列表, 采集时间列表, float32特征矩阵)"""
+    row_names = []
+    timestamps = []
+    rows = []
+    with open(features_file, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return row_names, timestamps, np.empty((0, dim), dtype=np.float32)
+        first_feature = header.index('feature_0')
+        timestamp_column = header.index('timestamp') if 'timestamp' in header else None
+        for row in reader:
+            if len(row) < first_feature + dim:
+                continue
+            row_names.append(row[0])
+            timestamps.append(row[timestamp_column] if timestamp_column is not None else '')
+            rows.append(row[first_feature:first_feature + dim])
+    return row_names, timestamps, np.asarray(rows, dtype=np.float32).reshape(-1, dim)
+
+
+def read_features_json(json_file, dim=128):
+    """读取 face_features.json（{姓名: {'features': [...], ...}}），返回 (行姓名列表, 采集时间列表, 特征矩阵)"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    row_names = []
+    timestamps = []
+    rows = []
+    for name, entry in data.items():
+        created_at = str(entry.get('info', {}).get('created_at', ''))
+        for features in entry.get('features', []):
+            if len(features) == dim:
+                row_names.append(name)
+                timestamps.append(created_at)
+                rows.append(features)
+    return row_names, timestamps, np.asarray(rows, dtype=np.float32).reshape(-1, dim)
+
+
+def convert_legacy_features(store, csv_file=None, json_file=None):
+    """把旧版CSV/JSON特征文件一次性转换为二进制特征库
+
+    CSV 中已有特征的姓名以CSV为准，JSON 只补充CSV中没有的姓名。返回写入的行数。
+    """
+    row_names, timestamps, blocks = [], [], []
+    sources = []
+    csv_names = set()
+    if csv_file and os.path.exists(csv_file):
+        names, stamps, matrix = read_features_csv(csv_file, store.dim)
+        row_names.extend(names)
+        timestamps.extend(stamps)
+        blocks.append(matrix)
+        csv_names = set(names)
+        sources.append(os.path.basename(csv_file))
+    if json_file and os.path.exists(json_file):
+        names, stamps, matrix = read_features_json(json_file, store.dim)
+        keep = [i for i, name in enumerate(names) if name not in csv_names]
+        row_names.extend(names[i] for i in keep)
+        timestamps.extend(stamps[i] for i in keep)
+        blocks.append(matrix[keep])
+        sources.append(os.path.basename(json_file))
+
+    matrix = np.concatenate(blocks) if blocks else np.empty((0, store.dim), dtype=np.float32)
+    store.save(row_names, timestamps, matrix, source='+'.join(sources))
+    return len(row_names)
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+摄像头帧处理流水线
+采集线程（OpenCV VideoCapture，或挂在 QCamera 上的 QVideoProbe）把每一帧转换为连续的 RGB uint8 数组，
+写入有界的最新帧队列；识别线程从队列中取最新帧，执行 检测 -> 特征点 -> 特征 -> 特征库匹配，
+结果通过 Qt 信号送回界面线程。界面线程只负责绘制预览和更新标签，不做任何推理。
+视频文件识别（VideoAnalysisThread）同样在后台线程中运行，进度和结果通过信号送回界面线程。
+"""
+
+import time
+import threading
+from collections import deque
+import numpy as np
+import cv2
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PyQt5.QtMultimedia import QVideoFrame, QVideoProbe
+
+from video_analysis import analyze_video
+
+
+class PipelineStats:
+    """单个摄像头的流水线统计：采集/处理/丢弃帧数、采集到出结果的延迟、采集与处理帧率"""
+
+    def __init__(self, camera_id, window=300):
+        self.camera_id = camera_id
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.processed = 0
+        self.dropped = 0
+        self.lags = deque(maxlen=window)  # 最近若干帧的 采集 -> 出结果 延迟（秒）
+        self.capture_times = deque(maxlen=window)
+        self.result_times = deque(maxlen=window)
+
+    def record_capture(self, captured_at):
+        with self.lock:
+            self.captured += 1
+            self.capture_times.append(captured_at)
+
+    def record_drop(self, count=1):
+        with self.lock:
+            self.dropped += count
+
+    def record_result(self, captured_at, finished_at):
+        with self.lock:
+            self.processed += 1
+            self.lags.append(finished_at - captured_at)
+            self.result_times.append(finished_at)
+
+    @staticmethod
+    def _rate(times):
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def snapshot(self):
+        """统计快照（毫秒/帧每秒），用于界面日志和 /api/status"""
+        with self.lock:
+            lags = np.asarray(self.lags, dtype=np.float64) * 1000.0
+            return {
+                'camera': self.camera_id,
+                'captured': self.captured,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'drop_rate': self.dropped / self.captured if self.captured else 0.0,
+                'capture_fps': self._rate(self.capture_times),
+                'process_fps': self._rate(self.result_times),
+                'lag_ms_avg': float(lags.mean()) if lags.size else None,
+                'lag_ms_p95': float(np.percentile(lags, 95)) if lags.size else None,
+                'lag_ms_max': float(lags.max()) if lags.size else None
+            }
+
+
+class LatestFrameQueue:
+    """有界帧队列（最新帧优先）
+
+    队列满时丢弃最旧的帧；识别线程 take() 总是取走最新帧，同时丢弃排在它前面的旧帧，
+    因此检测慢于摄像头帧率时延迟不会累积。capacity 为 1 时即单槽缓冲；
+    capacity > 1 时 take_batch() 可一次取走队列中的多帧。所有丢弃的帧计入统计。
+    ready_event: 多个队列共用的 threading.Event，有新帧或关闭时置位，供一个线程同时等待多路队列。
+    """
+
+    def __init__(self, capacity=1, stats=None, ready_event=None):
+        self.capacity = max(1, int(capacity))
+        self.stats = stats
+        self.ready_event = ready_event
+        self.condition = threading.Condition()
+        self.frames = deque()  # (帧号, 帧, 采集时间)
+        self.frame_id = 0  # 递增帧号
+        self.latest_frame = None  # 最新帧（界面预览使用，不受取走影响）
+        self.closed = False
+
+    def put(self, frame):
+        captured_at = time.monotonic()
+        with self.condition:
+            self.frame_id += 1
+            self.latest_frame = frame
+            if len(self.frames) >= self.capacity:
+                self.frames.popleft()
+                if self.stats is not None:
+                    self.stats.record_drop()
+            self.frames.append((self.frame_id, frame, captured_at))
+            self.condition.notify_all()
+        if self.ready_event is not None:
+            self.ready_event.set()
+        if self.stats is not None:
+            self.stats.record_capture(captured_at)
+
+    def latest(self):
+        """不消费地读取最新帧（界面预览使用），返回 (帧号, 帧)"""
+        with self.condition:
+            return self.frame_id, self.latest_frame
+
+    def _wait(self, timeout):
+        return self.condition.wait_for(lambda: self.closed or self.frames, timeout) and not self.closed
+
+    def take(self, timeout=0.5):
+        """等待并取走最新帧，返回 (帧号, 帧, 采集时间)；更旧的排队帧被丢弃。超时或已关闭时返回 None"""
+        with self.condition:
+            if not self._wait(timeout):
+                return None
+            item = self.frames.pop()
+            stale = len(self.frames)
+            self.frames.clear()
+        if stale and self.stats is not None:
+            self.stats.record_drop(stale)
+        return item
+
+    def take_batch(self, max_items=None, timeout=0.5):
+        """等待并按采集顺序取走队列中的多帧（最多 max_items 帧，超出部分丢弃最旧的）"""
+        with self.condition:
+            if not self._wait(timeout):
+                return []
+            items = list(self.frames)
+            self.frames.clear()
+        if max_items is not None and len(items) > max_items:
+            if self.stats is not None:
+                self.stats.record_drop(len(items) - max_items)
+            items = items[-max_items:]
+        return items
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.condition.notify_all()
+        if self.ready_event is not None:
+            self.ready_event.set()
+
+
+def bgr_to_rgb(frame):
+    """OpenCV BGR 帧 -> 连续 RGB uint8 数组"""
+    return np.ascontiguousarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def qvideoframe_to_rgb(video_frame):
+    """QVideoFrame -> 连续 RGB uint8 数组；不支持的像素格式返回 None"""
+    frame = QVideoFrame(video_frame)
+    if not frame.map(QVideoFrame.ReadOnly):
+        return None
+    try:
+        width, height = frame.width(), frame.height()
+        stride = frame.bytesPerLine()
+        data = np.frombuffer(frame.bits().asarray(frame.mappedBytes()), dtype=np.uint8)
+        pixel_format = frame.pixelFormat()
+        if pixel_format in (QVideoFrame.Format_RGB32, QVideoFrame.Format_ARGB32,
+                            QVideoFrame.Format_ARGB32_Premultiplied):
+            # 小端内存中的字节顺序为 B, G, R, A
+            pixels = data[:stride * height].reshape(height, stride)[:, :width * 4].reshape(height, width, 4)
+            return np.ascontiguousarray(pixels[:, :, 2::-1])
+        if pixel_format == QVideoFrame.Format_RGB24:
+            pixels = data[:stride * height].reshape(height, stride)[:, :width * 3].reshape(height, width, 3)
+            return np.ascontiguousarray(pixels)
+        if pixel_format == QVideoFrame.Format_BGR24:
+            pixels = data[:stride * height].reshape(height, stride)[:, :width * 3].reshape(height, width, 3)
+            return np.ascontiguousarray(pixels[:, :, ::-1])
+        if pixel_format in (QVideoFrame.Format_YUYV, QVideoFrame.Format_UYVY):
+            pixels = data[:stride * height].reshape(height, stride)[:, :width * 2].reshape(height, width, 2)
+            code = cv2.COLOR_YUV2RGB_YUYV if pixel_format == QVideoFrame.Format_YUYV else cv2.COLOR_YUV2RGB_UYVY
+            return cv2.cvtColor(np.ascontiguousarray(pixels), code)
+        if pixel_format in (QVideoFrame.Format_NV12, QVideoFrame.Format_NV21,
+                            QVideoFrame.Format_YUV420P, QVideoFrame.Format_YV12) and stride == width:
+            planes = data[:width * height * 3 // 2].reshape(height * 3 // 2, width)
+            code = {
+                QVideoFrame.Format_NV12: cv2.COLOR_YUV2RGB_NV12,
+                QVideoFrame.Format_NV21: cv2.COLOR_YUV2RGB_NV21,
+                QVideoFrame.Format_YUV420P: cv2.COLOR_YUV2RGB_I420,
+                QVideoFrame.Format_YV12: cv2.COLOR_YUV2RGB_YV12
+            }[pixel_format]
+            return cv2.cvtColor(planes, code)
+        return None
+    finally:
+        frame.unmap()
+
+
+class CaptureThread(QThread):
+    """OpenCV 采集线程：持续读取视频源，把 RGB 帧写入帧队列
+
+    视频文件按文件帧率读取（realtime），读到结尾时可从头循环（loop），用于回放录像测试闸机。
+    """
+
+    capture_failed = pyqtSignal(str)
+
+    def __init__(self, source, frame_queue, realtime=False, loop=False, parent=None):
+        super().__init__(parent)
+        self.source = source  # 设备序号或视频文件/流地址
+        self.frame_queue = frame_queue
+        self.realtime = realtime
+        self.loop = loop
+        self.running = False
+
+    def run(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            self.capture_failed.emit(f"无法打开视频源: {self.source}")
+            return
+        self.running = True
+        failures = 0
+        fps = capture.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_time = time.monotonic()
+        try:
+            while self.running:
+                ok, frame = capture.read()
+                if not ok:
+                    failures += 1
+                    if failures >= 50:
+                        self.capture_failed.emit(f"视频源读取失败: {self.source}")
+                        break
+                    # 视频文件读到结尾时回到开头，否则稍后重试
+                    if not (self.loop and capture.set(cv2.CAP_PROP_POS_FRAMES, 0)):
+                        time.sleep(0.02)
+                    continue
+                failures = 0
+                self.frame_queue.put(bgr_to_rgb(frame))
+                if interval:
+                    next_time = max(next_time + interval, time.monotonic() - interval)
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            capture.release()
+            self.running = False
+
+    def stop(self, wait_ms=2000):
+        self.running = False
+        self.wait(wait_ms)
+
+
+class QCameraFrameSource(QObject):
+    """QCamera 帧来源：通过 QVideoProbe 取得取景器正在显示的帧，写入帧队列
+
+    部分平台的 QCamera 后端不支持 QVideoProbe，此时 attach() 返回 False，调用方应改用 OpenCV 采集。
+    """
+
+    def __init__(self, camera, frame_queue, parent=None):
+        super().__init__(parent)
+        self.frame_queue = frame_queue
+        self.probe = QVideoProbe(self)
+        self.probe.videoFrameProbed.connect(self.on_frame)
+        self.camera = camera
+
+    def attach(self):
+        return self.probe.setSource(self.camera)
+
+    def on_frame(self, video_frame):
+        rgb = qvideoframe_to_rgb(video_frame)
+        if rgb is not None:
+            self.frame_queue.put(rgb)
+
+
+class RecognitionWorker(QThread):
+    """识别线程：取最新帧 -> analyze(帧) -> 通过信号把结果送回界面线程，并记录采集到出结果的延迟
+
+    batch_size > 1 且提供 analyze_batch 时，一次取走队列中最多 batch_size 帧，
+    各帧的人脸合并为一次批量特征计算（帧队列长度应不小于 batch_size）。
+
+    results_ready 发出的结果字典（批量时每帧各发一次，按采集顺序）:
+        {'frame_id', 'frame_size': (宽, 高), 'captured_at', 'finished_at', 'faces': [{'box', 'name', 'distance', 'confidence'}, ...]}
+    """
+
+    results_ready = pyqtSignal(object)
+    analysis_failed = pyqtSignal(str)
+
+    def __init__(self, frame_queue, analyze, analyze_batch=None, batch_size=1, parent=None):
+        super().__init__(parent)
+        self.frame_queue = frame_queue
+        self.analyze = analyze  # RGB 帧 -> 人脸结果列表
+        self.analyze_batch = analyze_batch  # [RGB 帧, ...] -> [人脸结果列表, ...]
+        self.batch_size = max(1, int(batch_size))
+        self.running = False
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if self.analyze_batch is not None and self.batch_size > 1:
+                items = self.frame_queue.take_batch(self.batch_size, timeout=0.2)
+            else:
+                item = self.frame_queue.take(timeout=0.2)
+                items = [item] if item is not None else []
+            if not items:
+                continue
+            try:
+                if len(items) > 1:
+                    results = self.analyze_batch([frame for _, frame, _ in items])
+                else:
+                    results = [self.analyze(items[0][1])]
+            except Exception as e:
+                self.analysis_failed.emit(str(e))
+                continue
+            finished_at = time.monotonic()
+            for (frame_id, frame, captured_at), faces in zip(items, results):
+                if self.frame_queue.stats is not None:
+                    self.frame_queue.stats.record_result(captured_at, finished_at)
+                self.results_ready.emit({
+                    'frame_id': frame_id,
+                    'frame_size': (frame.shape[1], frame.shape[0]),
+                    'captured_at': captured_at,
+                    'finished_at': finished_at,
+                    'faces': faces
+                })
+
+    def stop(self, wait_ms=5000):
+        self.running = False
+        self.wait(wait_ms)
+
+
+class VideoAnalysisThread(QThread):
+    """视频文件识别线程：在后台执行 video_analysis.analyze_video（解码和特征计算在进程池中进行）"""
+
+    progress = pyqtSignal(int, int)  # 已读帧数, 总帧数
+    analysis_finished = pyqtSignal(object)  # {'summary', 'stats', 'report_file'}
+    analysis_failed = pyqtSignal(str)
+
+    def __init__(self, video_path, config, match, report_file, parent=None):
+        super().__init__(parent)
+        self.video_path = video_path
+        self.config = config
+        self.match = match  # 特征列表 -> 匹配结果列表（在本线程中调用）
+        self.report_file = report_file
+        self.running = False
+
+    def run(self):
+        self.running = True
+        try:
+            summary, stats = analyze_video(self.video_path, self.config, self.match, self.report_file,
+                                           progress=self.progress.emit, should_stop=lambda: not self.running)
+            self.analysis_finished.emit({'summary': summary, 'stats': stats, 'report_file': self.report_file})
+        except Exception as e:
+            self.analysis_failed.emit(str(e))
+        finally:
+            self.running = False
+
+    def stop(self, wait_ms=10000):
+        self.running = False
+        self.wait(wait_ms)
@@ -0,0 +1,823 @@
+import os
+import threading
+import time
+import numpy as np
+
+
+def _remove_file(path):
+    """删除文件，文件不存在也视为成功；返回是否已不存在"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # Windows 下存活进程仍映射着文件，删除会失败，交给删除结果判断
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def sweep_exact_tier_files(config):
+    """删除已退出进程遗留的全精度映射文件 gallery_exact[.s分片].<pid>.<序号>.npy，返回删除的文件数"""
+    directory = config.get('database_path', 'face_database')
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for filename in os.listdir(directory):
+        parts = filename.split('.')
+        if parts[0] != 'gallery_exact' or parts[-1] != 'npy' or len(parts) < 4:
+            continue
+        if not (parts[-3].isdigit() and parts[-2].isdigit()):
+            continue
+        if not _pid_alive(int(parts[-3])) and _remove_file(os.path.join(directory, filename)):
+            removed += 1
+    return removed
+
+
+class IVFCoarseQuantizer:
+    """IVF 粗量化倒排索引（纯NumPy实现）
+
+    用 k-means 把特征空间划分为 nlist 个簇，每个簇维护一个倒排列表。
+    查询时只扫描距离探针最近的 nprobe 个簇，以少量召回率换取亚线性检索。
+    """
+
+    def __init__(self, dim=128, nlist=256, nprobe=8, train_iterations=10, seed=0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.centroid_norms = np.empty(0, dtype=np.float32)
+        self.lists = []  # 每个簇的行号数组
+
+    @property
+    def is_trained(self):
+        return self.centroids.shape[0] > 0
+
+    def _nearest_centroids(self, vectors, count, chunk_size=8192):
+        """返回每个向量最近的 count 个簇编号"""
+        result = np.empty((vectors.shape[0], count), dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk_size):
+            block = vectors[start:start + chunk_size]
+            scores = self.centroid_norms - 2.0 * (block @ self.centroids.T)
+            if count < scores.shape[1]:
+                nearest = np.argpartition(scores, count - 1, axis=1)[:, :count]
+                order = np.argsort(np.take_along_axis(scores, nearest, axis=1), axis=1)
+                nearest = np.take_along_axis(nearest, order, axis=1)
+            else:
+                nearest = np.argsort(scores, axis=1)
+            result[start:start + chunk_size] = nearest
+        return result
+
+    def train(self, matrix):
+        """在特征矩阵上训练簇中心并建立倒排列表"""
+        count = matrix.shape[0]
+        nlist = max(1, min(self.nlist, count))
+        rng = np.random.default_rng(self.seed)
+
+        # 在采样子集上运行 Lloyd 迭代
+        sample_size = min(count, nlist * 64)
+        sample = matrix[rng.choice(count, sample_size, replace=False)] if sample_size < count else matrix
+        self.centroids = np.ascontiguousarray(sample[rng.choice(sample.shape[0], nlist, replace=False)])
+        for _ in range(self.train_iterations):
+            self.centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+            assignment = self._nearest_centroids(sample, 1)[:, 0]
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist).astype(np.float32)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+        self.centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+        # 将全部行分配到倒排列表
+        assignment = self._nearest_centroids(matrix, 1)[:, 0]
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+        return self
+
+    def add(self, rows, vectors):
+        """把新增的行加入最近簇的倒排列表（不重新训练簇中心）"""
+        if len(rows) == 0:
+            return
+        assignment = self._nearest_centroids(vectors, 1)[:, 0]
+        for list_id in np.unique(assignment):
+            self.lists[list_id] = np.concatenate([self.lists[list_id], rows[assignment == list_id]])
+
+    def to_arrays(self):
+        """导出为数组 (簇中心, 拼接的倒排列表, 各列表边界)，用于写入索引快照"""
+        order = np.concatenate(self.lists) if self.lists else np.empty(0, dtype=np.int64)
+        bounds = np.concatenate([[0], np.cumsum([len(rows) for rows in self.lists])]).astype(np.int64)
+        return self.centroids, order, bounds
+
+    @classmethod
+    def from_arrays(cls, centroids, order, bounds, nprobe=8):
+        """从索引快照中的数组恢复，无需重新训练"""
+        ivf = cls(centroids.shape[1], nlist=centroids.shape[0], nprobe=nprobe)
+        ivf.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        ivf.centroid_norms = np.einsum('ij,ij->i', ivf.centroids, ivf.centroids)
+        order = np.asarray(order, dtype=np.int64)
+        ivf.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+        return ivf
+
+    def candidates(self, probe, nprobe=None):
+        """返回最近的 nprobe 个簇中的全部行号"""
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        nearest = self._nearest_centroids(probe.reshape(1, -1), nprobe)[0]
+        return np.concatenate([self.lists[i] for i in nearest])
+
+
+class QuantizedTier:
+    """量化扫描层
+
+    int8 模式按维度计算缩放系数（scale = max|x_d| / 127），float16 模式直接半精度存储。
+    扫描时按块解码到可复用的 float32 缓冲区，避免一次性生成完整的 float32 副本。
+    """
+
+    def __init__(self, storage='int8', dim=128, block_size=16384):
+        self.storage = storage
+        self.dim = dim
+        self.block_size = block_size
+        self.code_dtype = np.int8 if storage == 'int8' else np.float16
+        self.codes = np.empty((0, dim), dtype=self.code_dtype)
+        self.scale = np.ones(dim, dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)  # 解码后特征的平方范数，已删除的行为inf
+
+    def nbytes(self, size):
+        return size * (self.dim * self.codes.itemsize + self.norms.itemsize) + self.scale.nbytes
+
+    def encode(self, matrix, capacity):
+        """量化特征矩阵，并按容量预留追加空间"""
+        if self.storage == 'int8':
+            peak = np.abs(matrix).max(axis=0) if matrix.shape[0] else np.zeros(self.dim, dtype=np.float32)
+            # 预留余量，后续追加的特征超出原始范围时不至于大量截断
+            self.scale = np.where(peak > 0, peak * 1.25 / 127.0, 1.0 / 127.0).astype(np.float32)
+        self.codes = np.empty((capacity, self.dim), dtype=self.code_dtype)
+        self.norms = np.full(capacity, np.inf, dtype=np.float32)
+        self.write(0, matrix)
+        return self
+
+    def grow(self, capacity):
+        """扩容"""
+        codes = np.empty((capacity, self.dim), dtype=self.code_dtype)
+        codes[:self.codes.shape[0]] = self.codes
+        norms = np.full(capacity, np.inf, dtype=np.float32)
+        norms[:self.norms.shape[0]] = self.norms
+        self.codes = codes
+        self.norms = norms
+
+    def write(self, start, vectors):
+        """量化并写入从 start 开始的若干行"""
+        if self.storage == 'int8':
+            codes = np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        else:
+            codes = vectors.astype(np.float16)
+        decoded = self.decode(codes)
+        self.codes[start:start + len(codes)] = codes
+        self.norms[start:start + len(codes)] = np.einsum('ij,ij->i', decoded, decoded)
+
+    def kill(self, rows):
+        """标记删除"""
+        self.norms[rows] = np.inf
+
+    def decode(self, codes, out=None):
+        """解码为 float32"""
+        if out is None:
+            out = np.empty(codes.shape, dtype=np.float32)
+        out[...] = codes
+        if self.storage == 'int8':
+            out *= self.scale
+        return out
+
+    def squared_distances(self, probe, size, rows=None):
+        """计算探针到量化特征的近似平方距离
+
+        probe 可以是单个特征 (dim,) 或一批特征 (M, dim)，批量时返回 (M, 行数)，
+        每个解码块与整批探针做一次矩阵乘法，解码代价由所有探针分摊。
+        """
+        codes = self.codes[:size] if rows is None else self.codes[rows]
+        norms = self.norms[:size] if rows is None else self.norms[rows]
+        probes = np.atleast_2d(probe)
+        # int8 模式下把缩放系数乘到探针上，块内只需做类型转换
+        scaled_probes = probes * self.scale if self.storage == 'int8' else probes
+        dots = np.empty((probes.shape[0], codes.shape[0]), dtype=np.float32)
+        buffer = np.empty((min(self.block_size, codes.shape[0]), self.dim), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            block = codes[start:start + self.block_size]
+            block_buffer = buffer[:block.shape[0]]
+            block_buffer[...] = block
+            dots[:, start:start + block.shape[0]] = scaled_probes @ block_buffer.T
+        squared = norms + np.einsum('ij,ij->i', probes, probes)[:, None] - 2.0 * dots
+        np.maximum(squared, 0.0, out=squared)
+        return squared if probe.ndim == 2 else squared[0]
+
+
+class FaceGalleryIndex:
+    """人脸特征库索引
+
+    所有已录入的特征向量保存在一个连续的 float32 (N, 128) 矩阵中，
+    并维护 行 -> 身份 的映射数组和预计算的平方范数，
+    识别时对整个特征库只做一次向量化的欧氏距离计算。
+
+    storage 为 int8/float16 时启用两级存储：量化层常驻内存用于首轮扫描，
+    只有前 rerank_k 个候选再用 float32 全精度特征重新计算距离；
+    全精度特征可落盘为内存映射文件（exact_tier_path），按需分页读取。
+
+    支持增量更新：add 追加模板，replace 替换某人的全部模板，remove 删除某人。
+    删除的行只做墓碑标记（平方范数置为inf），墓碑比例超过 compaction_ratio 时自动压缩。
+
+    backend 为 'centroid' 时两级匹配：先用每人一个的特征中心筛选出 centroid_top_k 个候选身份，
+    再用这些身份的全部模板计算精确距离，单次查询代价与身份数而不是模板数成正比。
+    """
+
+    def __init__(self, dim=128, backend='exact', ivf_nlist=0, ivf_nprobe=8, ivf_min_templates=100000,
+                 storage='float32', rerank_k=64, exact_tier_path=None, compaction_ratio=0.2, centroid_top_k=8):
+        self.dim = dim
+        self.backend = backend  # 'exact' 穷举检索 / 'ivf' 近似检索 / 'centroid' 两级匹配
+        self.ivf_nlist = ivf_nlist  # 0 表示按特征数量自动选择
+        self.ivf_nprobe = ivf_nprobe
+        self.ivf_min_templates = ivf_min_templates  # 特征数少于该值时仍使用穷举检索
+        self.storage = storage  # 'float32' / 'float16' / 'int8'
+        self.rerank_k = rerank_k  # 量化模式下全精度重排的候选行数
+        self.exact_tier_path = exact_tier_path
+        self.compaction_ratio = compaction_ratio  # 墓碑行占比超过该值时压缩
+        self.centroid_top_k = centroid_top_k  # 两级匹配时进入第二级的候选身份数
+        self.lock = threading.RLock()
+        self.clear()
+
+    @classmethod
+    def from_config(cls, config, dim=128):
+        """根据系统配置创建索引"""
+        return cls(
+            dim=dim,
+            backend=config.get('gallery_backend', 'exact'),
+            ivf_nlist=config.get('ivf_nlist', 0),
+            ivf_nprobe=config.get('ivf_nprobe', 8),
+            ivf_min_templates=config.get('ivf_min_templates', 100000),
+            storage=config.get('gallery_storage', 'float32'),
+            rerank_k=config.get('gallery_rerank_k', 64),
+            exact_tier_path=os.path.join(config.get('database_path', 'face_database'), 'gallery_exact.npy')
+            if config.get('gallery_exact_tier_on_disk', True) else None,
+            compaction_ratio=config.get('gallery_compaction_ratio', 0.2),
+            centroid_top_k=config.get('centroid_top_k', 8)
+        )
+
+    @classmethod
+    def from_face_database(cls, face_database, dim=128):
+        """从 face_database 字典创建索引"""
+        return cls(dim).build(face_database)
+
+    def clear(self):
+        """清空索引"""
+        with self.lock:
+            self.size = 0  # 已使用的行数（含墓碑行）
+            self.dead_rows = 0  # 墓碑行数
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)  # 特征矩阵 (容量, dim)
+            self.norms = np.empty(0, dtype=np.float32)  # 每行特征的平方范数，墓碑行为inf
+            self.row_identity = np.empty(0, dtype=np.int32)  # 行 -> 身份编号
+            self.names = []  # 身份编号 -> 姓名，已删除的身份为None；只追加，删除时写时复制
+            self.name_to_id = {}  # 姓名 -> 身份编号
+            self.identity_rows = {}  # 身份编号 -> 行号数组
+            self.max_templates = 0  # 单个身份的模板数上限（批量检索时确定候选行数）
+            self.centroids = None  # 身份编号 -> 特征中心 (身份容量, dim)，仅两级匹配时维护
+            self.centroid_norms = None  # 特征中心的平方范数，已删除的身份为inf
+            self.ivf = None
+            self.quantized = None  # 量化扫描层
+
+    def __len__(self):
+        return self.size - self.dead_rows
+
+    @property
+    def identity_count(self):
+        return len(self.name_to_id)
+
+    def memory_usage(self):
+        """返回常驻内存占用（字节）：扫描层、全精度层（内存映射时不计入）"""
+        exact_resident = 0 if isinstance(self.matrix, np.memmap) else self.size * self.dim * 4
+        if self.quantized is not None:
+            scan = self.quantized.nbytes(self.size)
+        else:
+            scan = exact_resident + self.size * 4
+        return {'scan_tier': scan, 'exact_tier': exact_resident, 'storage': self.storage}
+
+    def live_rows(self):
+        """返回 (行姓名列表, 全精度特征矩阵)，不含墓碑行"""
+        with self.lock:
+            rows = np.flatnonzero(np.isfinite(self.norms[:self.size]))
+            row_names = [self.names[i] for i in self.row_identity[rows]]
+            return row_names, np.array(self.matrix[rows], dtype=np.float32)
+
+    def templates(self, name):
+        """返回某人的全部模板 (n, dim)"""
+        with self.lock:
+            identity = self.name_to_id.get(name)
+            if identity is None:
+                return np.empty((0, self.dim), dtype=np.float32)
+            return np.array(self.matrix[self.identity_rows[identity]], dtype=np.float32)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    def build(self, face_database):
+        """从 face_database 字典重建索引"""
+        names = []
+        rows = []
+        for name, data in face_database.items():
+            for features in data.get('features', []):
+                if len(features) == self.dim:
+                    names.append(name)
+                    rows.append(features)
+        matrix = np.asarray(rows, dtype=np.float32).reshape(-1, self.dim)
+        self.build_from_arrays(names, matrix)
+        return self
+
+    def build_from_arrays(self, row_names, matrix, ivf=None, adopt=False):
+        """从 行姓名列表 + 特征矩阵 重建索引
+
+        ivf: 已训练好的倒排索引（如索引快照中保存的），行号须与 matrix 一致，为 None 时按配置训练；
+        adopt=True 时直接以传入的只读内存映射矩阵作为全精度层，不复制也不预留空间，首次追加时才扩容复制。
+        """
+        source = matrix
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        count = matrix.shape[0]
+        adopt = adopt and isinstance(source, np.memmap) and source.dtype == np.float32 and count > 0
+        capacity = count if adopt else count + max(64, count // 8)  # 预留追加空间，录入新人时无需立即扩容
+
+        names = []
+        name_to_id = {}
+        row_identity = np.zeros(capacity, dtype=np.int32)
+        for row, name in enumerate(row_names):
+            identity = name_to_id.get(name)
+            if identity is None:
+                identity = len(names)
+                name_to_id[name] = identity
+                names.append(name)
+            row_identity[row] = identity
+
+        order = np.argsort(row_identity[:count], kind='stable')
+        bounds = np.searchsorted(row_identity[:count][order], np.arange(len(names) + 1))
+        identity_rows = {i: order[bounds[i]:bounds[i + 1]] for i in range(len(names))}
+        max_templates = int(np.diff(bounds).max()) if names else 0
+
+        norms = np.full(capacity, np.inf, dtype=np.float32)
+        norms[:count] = np.einsum('ij,ij->i', matrix, matrix)
+        centroids, centroid_norms = self._compute_centroids(matrix, order, bounds)
+        if ivf is None or self.backend != 'ivf':
+            ivf = self._train_ivf(matrix)
+        quantized = None
+        if self.storage in ('int8', 'float16'):
+            quantized = QuantizedTier(self.storage, self.dim).encode(matrix, capacity)
+        if adopt:
+            exact = source
+        else:
+            exact = self._allocate_exact_tier(capacity, quantized is not None)
+            exact[:count] = matrix
+
+        # 整体替换引用，其他线程（如API服务）读取时始终看到一致的索引
+        with self.lock:
+            previous = self.matrix
+            self.size = count
+            self.dead_rows = 0
+            self.matrix = exact
+            self.norms = norms
+            self.row_identity = row_identity
+            self.names = names
+            self.name_to_id = name_to_id
+            self.identity_rows = identity_rows
+            self.max_templates = max_templates
+            self.centroids = centroids
+            self.centroid_norms = centroid_norms
+            self.ivf = ivf
+            self.quantized = quantized
+        self._release_exact_tier(previous)
+        return self
+
+    def _compute_centroids(self, matrix, order, bounds):
+        """按身份计算特征中心，非两级匹配模式返回 (None, None)"""
+        if self.backend != 'centroid':
+            return None, None
+        identities = len(bounds) - 1
+        capacity = identities + max(64, identities // 8)
+        centroids = np.zeros((capacity, self.dim), dtype=np.float32)
+        centroid_norms = np.full(capacity, np.inf, dtype=np.float32)
+        if identities:
+            # 行已按身份排序，reduceat 一次求出每个身份的特征和
+            sums = np.add.reduceat(matrix[order], bounds[:-1], axis=0)
+            centroids[:identities] = sums / np.diff(bounds)[:, None]
+            centroid_norms[:identities] = np.einsum('ij,ij->i', centroids[:identities], centroids[:identities])
+        return centroids, centroid_norms
+
+    def _update_centroid(self, identity):
+        """重新计算单个身份的特征中心，代价只与该身份的模板数量相关"""
+        if self.centroids is None:
+            return
+        if identity >= self.centroids.shape[0]:
+            capacity = max(identity + 1, self.centroids.shape[0] * 2)
+            centroids = np.zeros((capacity, self.dim), dtype=np.float32)
+            centroids[:self.centroids.shape[0]] = self.centroids
+            centroid_norms = np.full(capacity, np.inf, dtype=np.float32)
+            centroid_norms[:self.centroid_norms.shape[0]] = self.centroid_norms
+            self.centroids = centroids
+            self.centroid_norms = centroid_norms
+        rows = self.identity_rows.get(identity)
+        if rows is None or len(rows) == 0:
+            self.centroid_norms[identity] = np.inf
+            return
+        centroid = np.asarray(self.matrix[rows], dtype=np.float32).mean(axis=0)
+        self.centroids[identity] = centroid
+        self.centroid_norms[identity] = np.dot(centroid, centroid)
+
+    def _train_ivf(self, matrix):
+        """按配置训练IVF倒排索引，特征数不足时返回None"""
+        if self.backend != 'ivf' or matrix.shape[0] < max(self.ivf_min_templates, 1):
+            return None
+        nlist = self.ivf_nlist or int(4 * np.sqrt(matrix.shape[0]))
+        return IVFCoarseQuantizer(self.dim, nlist=nlist, nprobe=self.ivf_nprobe).train(matrix)
+
+    def _allocate_exact_tier(self, capacity, on_disk):
+        """分配全精度特征存储；量化模式下写入内存映射文件，常驻内存只保留量化层
+
+        非 Windows 平台映射后立即删除文件名，映射在进程退出（包括崩溃）时由系统回收，不会残留文件；
+        Windows 下无法删除已映射的文件，由 _release_exact_tier / close 删除，崩溃残留的由启动时
+        sweep_exact_tier_files 清理。
+        """
+        if not on_disk or not self.exact_tier_path:
+            return np.empty((capacity, self.dim), dtype=np.float32)
+        # 每次分配新的文件，正在读取旧映射的线程不受影响（Windows下无法替换已映射的文件）
+        self._exact_generation = getattr(self, '_exact_generation', 0) + 1
+        root, ext = os.path.splitext(self.exact_tier_path)
+        path = f"{root}.{os.getpid()}.{self._exact_generation}{ext}"
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(capacity, self.dim))
+        if os.name != 'nt':
+            _remove_file(path)
+        return matrix
+
+    def _release_exact_tier(self, matrix):
+        """删除已被替换的全精度映射文件（只删除本索引创建的可写映射，不删除只读的快照文件）
+
+        其他线程可能仍在读取旧映射，这里不关闭映射；Windows 下映射未释放时删除失败，
+        文件记入待删除列表，下次释放或 close 时重试。
+        """
+        pending = getattr(self, '_pending_tier_files', [])
+        if isinstance(matrix, np.memmap) and matrix.filename and matrix.mode == 'w+':
+            pending.append(matrix.filename)
+        matrix = None
+        self._pending_tier_files = [path for path in pending if not _remove_file(path)]
+
+    def close(self):
+        """释放全精度映射文件并清空索引（退出时或索引被整体替换后调用）"""
+        with self.lock:
+            previous = self.matrix
+            self.clear()
+        self._release_exact_tier(previous)
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def _ensure_capacity(self, extra):
+        """容量不足时按倍数扩容（均摊O(1)）"""
+        needed = self.size + extra
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+
+        exact = self._allocate_exact_tier(capacity, self.quantized is not None)
+        exact[:self.size] = self.matrix[:self.size]
+        norms = np.full(capacity, np.inf, dtype=np.float32)
+        norms[:self.size] = self.norms[:self.size]
+        row_identity = np.zeros(capacity, dtype=np.int32)
+        row_identity[:self.size] = self.row_identity[:self.size]
+        if self.quantized is not None:
+            self.quantized.grow(capacity)
+
+        previous = self.matrix
+        self.matrix = exact
+        self.norms = norms
+        self.row_identity = row_identity
+        self._release_exact_tier(previous)
+
+    def _identity_for(self, name):
+        identity = self.name_to_id.get(name)
+        if identity is None:
+            identity = len(self.names)
+            self.names.append(name)
+            self.name_to_id[name] = identity
+            self.identity_rows[identity] = np.empty(0, dtype=np.int64)
+        return identity
+
+    def _kill_rows(self, rows):
+        if len(rows) == 0:
+            return
+        self.norms[rows] = np.inf
+        if self.quantized is not None:
+            self.quantized.kill(rows)
+        self.dead_rows += len(rows)
+
+    def add(self, name, descriptors):
+        """追加某人的模板，代价只与新增模板数量相关"""
+        vectors = np.asarray(descriptors, dtype=np.float32).reshape(-1, self.dim)
+        if vectors.shape[0] == 0:
+            return
+        with self.lock:
+            self._ensure_capacity(vectors.shape[0])
+            identity = self._identity_for(name)
+            start = self.size
+            rows = np.arange(start, start + vectors.shape[0])
+
+            # 先写入数据，最后再增加 size，读取线程不会看到未写完的行
+            self.matrix[rows] = vectors
+            self.row_identity[rows] = identity
+            self.norms[rows] = np.einsum('ij,ij->i', vectors, vectors)
+            if self.quantized is not None:
+                self.quantized.write(start, vectors)
+            if self.ivf is not None:
+                self.ivf.add(rows, vectors)
+            self.identity_rows[identity] = np.concatenate([self.identity_rows[identity], rows])
+            self.max_templates = max(self.max_templates, len(self.identity_rows[identity]))
+            self._update_centroid(identity)
+            self.size += vectors.shape[0]
+
+    def replace(self, name, descriptors):
+        """用新的模板替换某人的全部模板"""
+        with self.lock:
+            identity = self.name_to_id.get(name)
+            if identity is not None:
+                self._kill_rows(self.identity_rows[identity])
+                self.identity_rows[identity] = np.empty(0, dtype=np.int64)
+                self._update_centroid(identity)
+            self.add(name, descriptors)
+            self.maybe_compact()
+
+    def remove(self, name):
+        """删除某人（墓碑标记）"""
+        with self.lock:
+            identity = self.name_to_id.pop(name, None)
+            if identity is None:
+                return False
+            self._kill_rows(self.identity_rows.pop(identity))
+            self._update_centroid(identity)
+            # 写时复制：检索快照持有的旧列表不受影响
+            names = list(self.names)
+            names[identity] = None
+            self.names = names
+            self.maybe_compact()
+            return True
+
+    def reassign(self, name):
+        """用户分片字段变化后迁移模板；单一索引不分片，无需处理"""
+        return False
+
+    def maybe_compact(self):
+        """墓碑比例超过阈值时压缩"""
+        if self.dead_rows > 0 and self.dead_rows >= self.compaction_ratio * max(self.size, 1):
+            self.compact()
+            return True
+        return False
+
+    def compact(self):
+        """丢弃墓碑行并重建索引（同时重新训练IVF和量化缩放系数）"""
+        with self.lock:
+            row_names, matrix = self.live_rows()
+            self.build_from_arrays(row_names, matrix)
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _squared_distances(matrix, norms, probe):
+        """||x - q||^2 = ||x||^2 + ||q||^2 - 2 x·q"""
+        squared = norms + np.dot(probe, probe) - 2.0 * (matrix @ probe)
+        np.maximum(squared, 0.0, out=squared)
+        return squared
+
+    def distances(self, descriptor, rows=None):
+        """计算探针特征到模板的欧氏距离，rows 为 None 时计算全部模板（墓碑行为inf）"""
+        with self.lock:
+            size = self.size
+            matrix = self.matrix
+            norms = self.norms
+        probe = np.asarray(descriptor, dtype=np.float32).reshape(self.dim)
+        if rows is None:
+            rows = slice(0, size)
+        return np.sqrt(self._squared_distances(matrix[rows], norms[rows], probe))
+
+    def _snapshot(self):
+        """在锁内取得一致的索引状态，之后的计算不再持锁
+
+        names 和 identity_rows 不复制：names 只追加、删除时写时复制，快照只访问 identity_count 以内的身份；
+        identity_rows 中的行号数组会被整体替换为含新行的数组，使用时须过滤掉 size 以外的行。
+        """
+        with self.lock:
+            return {
+                'size': self.size,
+                'matrix': self.matrix,
+                'norms': self.norms,
+                'row_identity': self.row_identity,
+                'names': self.names,
+                'identity_count': len(self.names),
+                'identity_rows': self.identity_rows,
+                'max_templates': max(self.max_templates, 1),
+                'centroids': self.centroids,
+                'centroid_norms': self.centroid_norms,
+                'ivf': self.ivf,
+                'quantized': self.quantized
+            }
+
+    @staticmethod
+    def _top_identities(rows, squared, row_identity, names, k):
+        """候选行 -> 按身份去重（每个身份取最小距离）后的前 k 个 [(姓名, 距离), ...]"""
+        finite = np.isfinite(squared)
+        rows = rows[finite]
+        squared = squared[finite]
+        order = np.argsort(squared, kind='stable')
+        identities = row_identity[rows[order]]
+        # 按距离升序排列后，每个身份第一次出现的位置就是它的最小距离
+        _, first = np.unique(identities, return_index=True)
+        first.sort()
+        first = first[:k]
+        return [(names[identities[i]], float(np.sqrt(squared[order[i]]))) for i in first]
+
+    def _centroid_candidates(self, squared, identity_rows, top_k, size):
+        """第一级：按特征中心距离选出 top_k 个候选身份，返回这些身份在快照 size 以内的全部模板行号"""
+        top_k = min(top_k, len(squared))
+        top = np.argpartition(squared, top_k - 1)[:top_k]
+        top = top[np.isfinite(squared[top])]
+        rows = [identity_rows.get(i) for i in top]
+        rows = [item for item in rows if item is not None]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(rows)
+        # 快照之后追加的行可能超出快照中的矩阵
+        rows = rows[rows < size]
+        rows.sort()
+        return rows
+
+    def _search_rows(self, state, probe, rows, k):
+        """在给定的候选行中检索单个探针（IVF和两级匹配的第二级）"""
+        quantized = state['quantized']
+        # 两级匹配的候选行已经很少，直接用全精度特征计算
+        if quantized is not None and state['centroids'] is None:
+            # 首轮：量化层近似距离；次轮：候选行用全精度特征重新计算
+            approximate = quantized.squared_distances(probe, state['size'], rows)
+            shortlist_size = min(len(approximate), max(self.rerank_k, k * state['max_templates']))
+            shortlist = np.argpartition(approximate, shortlist_size - 1)[:shortlist_size]
+            rows = np.sort(rows[shortlist])  # 按行号顺序读取内存映射，减少随机分页
+        squared = self._squared_distances(state['matrix'][rows], state['norms'][rows], probe)
+        return self._top_identities(rows, squared, state['row_identity'], state['names'], k)
+
+    def _scan_block(self, state, probes, k):
+        """对一块探针穷举扫描整个特征库：一次矩阵乘法得到 (块大小, N) 的距离矩阵"""
+        size = state['size']
+        matrix = state['matrix']
+        norms = state['norms'][:size]
+        probe_norms = np.einsum('ij,ij->i', probes, probes)[:, None]
+        # 前 k 个身份的最佳模板一定落在距离最小的 k * max_templates 行之内
+        candidates = min(size, k * state['max_templates'])
+        quantized = state['quantized']
+        if quantized is not None:
+            candidates = min(size, max(self.rerank_k, candidates))
+            squared = quantized.squared_distances(probes, size)
+        else:
+            squared = norms + probe_norms - 2.0 * (probes @ matrix[:size].T)
+            np.maximum(squared, 0.0, out=squared)
+        if candidates < size:
+            shortlist = np.argpartition(squared, candidates - 1, axis=1)[:, :candidates]
+        else:
+            shortlist = np.broadcast_to(np.arange(size), squared.shape)
+
+        results = []
+        for i, rows in enumerate(shortlist):
+            if quantized is not None:
+                # 量化距离只用于筛选，候选行用全精度特征重新计算
+                rows = np.sort(rows)
+                exact = self._squared_distances(matrix[rows], state['norms'][rows], probes[i])
+            else:
+                exact = squared[i, rows]
+            results.append(self._top_identities(rows, exact, state['row_identity'], state['names'], k))
+        return results
+
+    def search_batch(self, descriptors, k=1, nprobe=None, exhaustive=False, location=None, threshold=None,
+                     block_bytes=64 << 20):
+        """批量检索：descriptors 为 (M, dim) 探针矩阵，返回每个探针的 [(姓名, 距离), ...]
+
+        穷举检索时按探针分块，每块与特征库只做一次矩阵乘法（BLAS GEMM），
+        单块距离矩阵不超过 block_bytes；两级匹配的第一级同样对整批探针一次计算；
+        IVF 各探针的候选簇不同，逐个探针在候选行中检索。
+        location/threshold 供分片索引（ShardedGallery）路由使用，单一索引忽略。
+        """
+        probes = np.ascontiguousarray(descriptors, dtype=np.float32).reshape(-1, self.dim)
+        state = self._snapshot()
+        if state['size'] == 0 or probes.shape[0] == 0:
+            return [[] for _ in range(probes.shape[0])]
+
+        centroids = state['centroids']
+        ivf = state['ivf']
+        if centroids is not None and not exhaustive:
+            count = min(state['identity_count'], centroids.shape[0])
+            centroid_norms = state['centroid_norms'][:count]
+            squared = centroid_norms + np.einsum('ij,ij->i', probes, probes)[:, None] \
+                - 2.0 * (probes @ centroids[:count].T)
+            results = []
+            for probe, probe_squared in zip(probes, squared):
+                rows = self._centroid_candidates(probe_squared, state['identity_rows'],
+                                                 max(self.centroid_top_k, k), state['size'])
+                results.append(self._search_rows(state, probe, rows, k) if len(rows) else [])
+            return results
+
+        if ivf is not None and not exhaustive:
+            results = []
+            for probe in probes:
+                rows = ivf.candidates(probe, nprobe)
+                rows = rows[rows < state['size']]
+                results.append(self._search_rows(state, probe, rows, k) if len(rows) else [])
+            return results
+
+        block = max(1, block_bytes // (4 * state['size']))
+        results = []
+        for start in range(0, probes.shape[0], block):
+            results.extend(self._scan_block(state, probes[start:start + block], k))
+        return results
+
+    def search(self, descriptor, k=1, nprobe=None, exhaustive=False, location=None):
+        """返回距离最近的 k 个身份 [(姓名, 距离), ...]，按距离升序
+
+        启用IVF时只扫描最近 nprobe 个簇的倒排列表；两级匹配时只计算候选身份的全部模板；
+        exhaustive=True 强制穷举检索。
+        量化存储时先在量化层中选出候选行，再以全精度距离排序。
+        """
+        return self.search_batch(np.asarray(descriptor, dtype=np.float32).reshape(1, self.dim),
+                                 k, nprobe, exhaustive)[0]
+
+    def match_batch(self, descriptors, threshold, location=None):
+        """批量匹配，返回 [(姓名, 距离), ...]；超过阈值时姓名为 None"""
+        matches = []
+        for results in self.search_batch(descriptors, k=1):
+            if not results:
+                matches.append((None, None))
+                continue
+            name, distance = results[0]
+            matches.append((name if distance <= threshold else None, distance))
+        return matches
+
+    def match(self, descriptor, threshold, location=None):
+        """匹配单个特征，返回 (姓名, 距离)；超过阈值时姓名为 None"""
+        return self.match_batch(np.asarray(descriptor, dtype=np.float32).reshape(1, self.dim), threshold)[0]
+
+
+def ivf_recall_report(gallery, nprobe_values, probe_count=1000, noise=0.02, k=1, seed=0):
+    """IVF召回率报告：对比不同 nprobe 与穷举检索的召回率和平均耗时
+
+    探针取自特征库中随机抽样的有效模板（不含墓碑行）并叠加高斯噪声，模拟同一人的新采集。
+    只支持单个索引；分片特征库（ShardedGallery）请对各分片分别生成报告。
+    返回 [{'nprobe', 'recall', 'latency_ms', 'exhaustive_latency_ms', 'scanned_ratio'}, ...]
+    """
+    if not isinstance(gallery, FaceGalleryIndex):
+        raise ValueError("IVF召回率报告只支持单个特征库索引，分片特征库请对 gallery.shards 中的各分片分别生成报告")
+    if gallery.ivf is None:
+        raise ValueError("特征库索引未启用IVF，请将 gallery_backend 设为 'ivf' 并确认特征数量达到 ivf_min_templates")
+    _, matrix = gallery.live_rows()
+    if len(matrix) == 0:
+        raise ValueError("特征库索引中没有有效模板")
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), min(probe_count, len(matrix)), replace=False)
+    probes = matrix[rows] + rng.normal(0.0, noise, (len(rows), gallery.dim)).astype(np.float32)
+
+    start = time.perf_counter()
+    truth = [set(name for name, _ in gallery.search(probe, k, exhaustive=True)) for probe in probes]
+    exhaustive_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+    report = []
+    for nprobe in nprobe_values:
+        hits = 0
+        scanned = 0
+        start = time.perf_counter()
+        for probe, expected in zip(probes, truth):
+            found = set(name for name, _ in gallery.search(probe, k, nprobe=nprobe))
+            hits += len(found & expected)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(probes)
+        for probe in probes:
+            scanned += len(gallery.ivf.candidates(probe, nprobe))
+        report.append({
+            'nprobe': nprobe,
+            'recall': hits / max(sum(len(t) for t in truth), 1),
+            'latency_ms': latency_ms,
+            'exhaustive_latency_ms': exhaustive_ms,
+            'scanned_ratio': scanned / (len(probes) * len(gallery))
+        })
+    return report
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+特征库重复身份审计
+对所有模板两两计算欧氏距离，找出距离低于匹配阈值、但姓名不同的身份对
+（例如同一个人以不同姓名重复录入）。
+
+按行分块计算，每块只与其后的模板做一次矩阵乘法，不生成 N x N 距离矩阵；
+命中的身份对保存在容量有限的堆中，内存占用与特征库规模无关。
+"""
+
+import csv
+import heapq
+import time
+import numpy as np
+
+
+def find_duplicate_identities(row_names, matrix, threshold, block_size=2048, max_pairs=10000, progress=None):
+    """查找疑似重复的身份对
+
+    row_names: 每行模板的姓名；matrix: (N, dim) 特征矩阵。
+    返回按距离升序的 [{'name_a', 'name_b', 'distance', 'template_pairs'}, ...]，
+    template_pairs 为两人之间低于阈值的模板对数量。最多保留 max_pairs 个最相似的身份对。
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    count = matrix.shape[0]
+
+    # 姓名 -> 身份编号，并按身份排序，使同一身份的模板连续存放
+    name_to_id = {}
+    identities = np.empty(count, dtype=np.int64)
+    for row, name in enumerate(row_names):
+        identities[row] = name_to_id.setdefault(name, len(name_to_id))
+    names = list(name_to_id)
+    order = np.argsort(identities, kind='stable')
+    matrix = matrix[order]
+    identities = identities[order]
+    bounds = np.searchsorted(identities, np.arange(len(names) + 1))
+
+    norms = np.einsum('ij,ij->i', matrix, matrix)
+    squared_threshold = np.float32(threshold) ** 2
+    best = {}  # (身份a, 身份b) -> [最小距离, 低于阈值的模板对数量]
+    heap = []  # (-距离, 身份a, 身份b)，堆顶是当前保留的最不相似的身份对；距离已更新的条目惰性跳过
+
+    blocks = (count + block_size - 1) // block_size
+    for block_index, start in enumerate(range(0, count, block_size)):
+        stop = min(start + block_size, count)
+        # 只计算上三角：本块与其后的所有模板
+        squared = matrix[start:stop] @ matrix[start:].T
+        # 原地计算 ||a||^2 + ||b||^2 - 2a·b，避免额外的临时矩阵
+        squared *= -2.0
+        squared += norms[None, start:]
+        squared += norms[start:stop, None]
+
+        # 屏蔽块内下三角（已在前面计算过）和同一身份的模板对，其余命中都是跨身份的
+        squared[np.tril_indices(stop - start)] = np.inf
+        for identity in np.unique(identities[start:stop]):
+            lo = max(bounds[identity], start)
+            hi = bounds[identity + 1]
+            squared[lo - start:hi - start, :hi - start] = np.inf
+
+        # 大部分行没有命中，先按行筛选再取具体位置
+        hit_block_rows = np.flatnonzero((squared <= squared_threshold).any(axis=1))
+        if len(hit_block_rows):
+            sub_rows, hit_cols = np.nonzero(squared[hit_block_rows] <= squared_threshold)
+            hit_rows = hit_block_rows[sub_rows]
+            id_a = identities[hit_rows + start]
+            id_b = identities[hit_cols + start]
+            distances = np.sqrt(np.maximum(squared[hit_rows, hit_cols], 0.0))
+            low = np.minimum(id_a, id_b)
+            high = np.maximum(id_a, id_b)
+
+            # 块内先按身份对归并，每对只取最小距离
+            pair_keys = low * len(names) + high
+            pair_order = np.lexsort((distances, pair_keys))
+            _, first, counts = np.unique(pair_keys[pair_order], return_index=True, return_counts=True)
+            for index, hits in zip(first, counts):
+                pair = (int(low[pair_order[index]]), int(high[pair_order[index]]))
+                distance = float(distances[pair_order[index]])
+                entry = best.get(pair)
+                if entry is None:
+                    best[pair] = [distance, int(hits)]
+                    heapq.heappush(heap, (-distance, pair[0], pair[1]))
+                else:
+                    entry[1] += int(hits)
+                    if distance < entry[0]:
+                        entry[0] = distance
+                        heapq.heappush(heap, (-distance, pair[0], pair[1]))
+
+            # 超出容量时淘汰最不相似的身份对
+            while len(best) > max_pairs:
+                negative_distance, id_a, id_b = heapq.heappop(heap)
+                entry = best.get((id_a, id_b))
+                if entry is not None and entry[0] == -negative_distance:
+                    del best[(id_a, id_b)]
+
+        if progress:
+            progress(block_index + 1, blocks)
+
+    results = [{
+        'name_a': names[id_a],
+        'name_b': names[id_b],
+        'distance': distance,
+        'template_pairs': hits
+    } for (id_a, id_b), (distance, hits) in best.items()]
+    results.sort(key=lambda item: item['distance'])
+    return results
+
+
+def write_audit_report(pairs, report_file, threshold, template_count, identity_count, elapsed):
+    """写入审计报告CSV"""
+    with open(report_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f'# 模板数: {template_count}', f'身份数: {identity_count}',
+                         f'阈值: {threshold}', f'耗时: {elapsed:.1f}s', f'疑似重复: {len(pairs)}'])
+        writer.writerow(['name_a', 'name_b', 'distance', 'confidence', 'template_pairs'])
+        for item in pairs:
+            writer.writerow([item['name_a'], item['name_b'], f"{item['distance']:.6f}",
+                             f"{max(0.0, 1.0 - item['distance']):.6f}", item['template_pairs']])
+
+
+def run_duplicate_audit(row_names, matrix, threshold, report_file, block_size=2048, max_pairs=10000, progress=None):
+    """执行审计并写入报告，返回疑似重复的身份对列表"""
+    start = time.perf_counter()
+    pairs = find_duplicate_identities(row_names, matrix, threshold, block_size, max_pairs, progress)
+    elapsed = time.perf_counter() - start
+    write_audit_report(pairs, report_file, threshold, len(row_names), len(set(row_names)), elapsed)
+    return pairs
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+按部门（或其他用户信息字段）分片的特征库索引
+每个分片是一个独立的 FaceGalleryIndex，按路由配置把摄像头/API位置映射到允许检索的分片：
+只允许某个部门通行的闸机只扫描该部门的小分片。
+
+未配置路由的位置对所有分片做分散-汇总（scatter-gather）检索；
+配置了路由的位置在本地分片中未匹配时，可按配置回退到其余分片继续检索。
+"""
+
+import os
+import threading
+import numpy as np
+
+from gallery import FaceGalleryIndex
+
+DEFAULT_SHARD = ''  # 分片字段为空的用户放入默认分片
+
+
+class ShardedGallery:
+    """分片特征库索引，接口与 FaceGalleryIndex 一致，检索接口额外接受 location 参数"""
+
+    def __init__(self, shard_factory, shard_key, routes=None, fallback=True, dim=128):
+        self.dim = dim
+        self.shard_factory = shard_factory  # 分片序号 -> 新的 FaceGalleryIndex
+        self.shard_key = shard_key  # 姓名 -> 分片键（如部门）
+        self.routes = {location: list(keys) for location, keys in (routes or {}).items()}  # 位置 -> 分片键列表
+        self.fallback = fallback  # 路由分片中未匹配时是否检索其余分片
+        self.lock = threading.RLock()
+        self.shard_count = 0  # 已创建的分片数量，用于区分各分片的内存映射文件
+        self.clear()
+
+    @classmethod
+    def from_config(cls, config, shard_key, dim=128):
+        """根据系统配置创建分片索引；每个分片使用与单一索引相同的检索配置"""
+        def shard_factory(number):
+            shard = FaceGalleryIndex.from_config(config, dim)
+            if shard.exact_tier_path:
+                root, ext = os.path.splitext(shard.exact_tier_path)
+                shard.exact_tier_path = f"{root}.s{number}{ext}"
+            return shard
+
+        return cls(shard_factory, shard_key,
+                   routes=config.get('gallery_shard_routes', {}),
+                   fallback=config.get('gallery_shard_fallback', True),
+                   dim=dim)
+
+    def clear(self):
+        with self.lock:
+            self.shards = {}  # 分片键 -> FaceGalleryIndex
+            self.name_to_shard = {}  # 姓名 -> 分片键
+
+    def __len__(self):
+        return sum(len(shard) for shard in list(self.shards.values()))
+
+    def close(self):
+        """释放各分片的全精度映射文件"""
+        with self.lock:
+            shards = list(self.shards.values())
+            self.clear()
+        for shard in shards:
+            shard.close()
+
+    @property
+    def identity_count(self):
+        return len(self.name_to_shard)
+
+    def memory_usage(self):
+        usage = {'scan_tier': 0, 'exact_tier': 0, 'storage': None, 'shards': {}}
+        for key, shard in list(self.shards.items()):
+            shard_usage = shard.memory_usage()
+            usage['scan_tier'] += shard_usage['scan_tier']
+            usage['exact_tier'] += shard_usage['exact_tier']
+            usage['storage'] = shard_usage['storage']
+            usage['shards'][key] = len(shard)
+        return usage
+
+    def shard_sizes(self):
+        """各分片的 (身份数, 模板数)"""
+        return {key: (shard.identity_count, len(shard)) for key, shard in list(self.shards.items())}
+
+    def _resolve(self, name):
+        key = self.shard_key(name)
+        return str(key).strip() if key else DEFAULT_SHARD
+
+    def _shard_for(self, key):
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self.shard_factory(self.shard_count)
+            self.shard_count += 1
+            self.shards[key] = shard
+        return shard
+
+    def live_rows(self):
+        row_names = []
+        matrices = []
+        for shard in list(self.shards.values()):
+            names, matrix = shard.live_rows()
+            row_names.extend(names)
+            matrices.append(matrix)
+        if not matrices:
+            return [], np.empty((0, self.dim), dtype=np.float32)
+        return row_names, np.concatenate(matrices)
+
+    def templates(self, name):
+        shard = self.shards.get(self.name_to_shard.get(name))
+        if shard is None:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return shard.templates(name)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    def build(self, face_database):
+        """从 face_database 字典重建所有分片"""
+        names = []
+        rows = []
+        for name, data in face_database.items():
+            for features in data.get('features', []):
+                if len(features) == self.dim:
+                    names.append(name)
+                    rows.append(features)
+        self.build_from_arrays(names, np.asarray(rows, dtype=np.float32).reshape(-1, self.dim))
+        return self
+
+    def build_from_arrays(self, row_names, matrix, ivf=None, adopt=False):
+        """按分片键拆分 行姓名列表 + 特征矩阵，分别重建各分片
+
+        整库的倒排索引行号与分片内行号不对应，ivf 被忽略，各分片按配置自行训练；
+        拆分时会复制各分片的行，adopt 同样被忽略。
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        name_to_shard = {}
+        row_keys = []
+        for name in row_names:
+            key = name_to_shard.get(name)
+            if key is None:
+                key = name_to_shard[name] = self._resolve(name)
+            row_keys.append(key)
+        row_keys = np.asarray(row_keys, dtype=object)
+
+        with self.lock:
+            shards = {}
+            for key in set(name_to_shard.values()):
+                rows = np.flatnonzero(row_keys == key)
+                shard = self._shard_for(key)
+                shards[key] = shard.build_from_arrays([row_names[i] for i in rows], matrix[rows])
+            for key, shard in self.shards.items():
+                if key not in shards:
+                    shard.close()
+            self.shards = shards
+            self.name_to_shard = name_to_shard
+        return self
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def add(self, name, descriptors):
+        with self.lock:
+            key = self.name_to_shard.get(name)
+            if key is None:
+                key = self.name_to_shard[name] = self._resolve(name)
+            self._shard_for(key).add(name, descriptors)
+
+    def replace(self, name, descriptors):
+        """替换某人的全部模板；分片键（如部门）变化时同时迁移到新分片"""
+        with self.lock:
+            key = self._resolve(name)
+            previous = self.name_to_shard.get(name)
+            if previous is not None and previous != key:
+                self.shards[previous].remove(name)
+            self.name_to_shard[name] = key
+            self._shard_for(key).replace(name, descriptors)
+
+    def remove(self, name):
+        with self.lock:
+            key = self.name_to_shard.pop(name, None)
+            if key is None:
+                return False
+            return self.shards[key].remove(name)
+
+    def reassign(self, name):
+        """用户信息中的分片字段变化后，把已有模板迁移到新分片"""
+        with self.lock:
+            previous = self.name_to_shard.get(name)
+            key = self._resolve(name)
+            if previous is None or previous == key:
+                return False
+            templates = self.shards[previous].templates(name)
+            self.shards[previous].remove(name)
+            self.name_to_shard[name] = key
+            self._shard_for(key).add(name, templates)
+            return True
+
+    def compact(self):
+        for shard in list(self.shards.values()):
+            shard.compact()
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    def route(self, location):
+        """位置 -> 允许检索的分片键列表；未配置路由的位置返回 None（检索全部分片）"""
+        keys = self.routes.get(location) if location is not None else None
+        if keys is None:
+            return None
+        return [key for key in keys if key in self.shards]
+
+    def _gather(self, keys, probes, k, nprobe, exhaustive):
+        """对多个分片分别检索并按距离合并；每个身份只属于一个分片，无需去重"""
+        merged = [[] for _ in range(probes.shape[0])]
+        for key in keys:
+            shard = self.shards.get(key)
+            if shard is None or len(shard) == 0:
+                continue
+            for results, shard_results in zip(merged, shard.search_batch(probes, k, nprobe, exhaustive)):
+                results.extend(shard_results)
+        for i, results in enumerate(merged):
+            results.sort(key=lambda item: item[1])
+            merged[i] = results[:k]
+        return merged
+
+    def search_batch(self, descriptors, k=1, nprobe=None, exhaustive=False, location=None, threshold=None):
+        """批量检索，返回每个探针的 [(姓名, 距离), ...]
+
+        location 配置了路由时只检索路由分片；启用回退且给定 threshold 时，
+        路由分片中最佳距离超过阈值的探针再到其余分片检索。
+        """
+        probes = np.ascontiguousarray(descriptors, dtype=np.float32).reshape(-1, self.dim)
+        all_keys = list(self.shards)
+        keys = self.route(location)
+        if keys is None:
+            return self._gather(all_keys, probes, k, nprobe, exhaustive)
+
+        results = self._gather(keys, probes, k, nprobe, exhaustive)
+        if not self.fallback or threshold is None:
+            return results
+        missed = [i for i, items in enumerate(results) if not items or items[0][1] > threshold]
+        remaining = [key for key in all_keys if key not in keys]
+        if missed and remaining:
+            for i, extra in zip(missed, self._gather(remaining, probes[missed], k, nprobe, exhaustive)):
+                merged = sorted(results[i] + extra, key=lambda item: item[1])
+                results[i] = merged[:k]
+        return results
+
+    def search(self, descriptor, k=1, nprobe=None, exhaustive=False, location=None):
+        return self.search_batch(np.asarray(descriptor, dtype=np.float32).reshape(1, self.dim),
+                                 k, nprobe, exhaustive, location)[0]
+
+    def match_batch(self, descriptors, threshold, location=None):
+        """批量匹配，返回 [(姓名, 距离), ...]；超过阈值时姓名为 None"""
+        matches = []
+        for results in self.search_batch(descriptors, k=1, location=location, threshold=threshold):
+            if not results:
+                matches.append((None, None))
+                continue
+            name, distance = results[0]
+            matches.append((name if distance <= threshold else None, distance))
+        return matches
+
+    def match(self, descriptor, threshold, location=None):
+        return self.match_batch(np.asarray(descriptor, dtype=np.float32).reshape(1, self.dim),
+                                threshold, location)[0]
+
+
+def create_gallery(config, user_info=None, dim=128):
+    """按配置创建特征库索引：配置了分片字段（如 department）时创建分片索引，否则创建单一索引
+
+    user_info: 姓名 -> 用户信息字典，分片键取其中的 gallery_shard_field 字段
+    """
+    shard_field = config.get('gallery_shard_field', '')
+    if not shard_field or user_info is None:
+        return FaceGalleryIndex.from_config(config, dim)
+    return ShardedGallery.from_config(config, lambda name: user_info(name).get(shard_field), dim)
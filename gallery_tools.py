@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+特征库维护工具
+提供特征库索引相关的离线命令：
+
+    python gallery_tools.py ann-report --nprobe 1 2 4 8 16 32
+    python gallery_tools.py audit --output logs/duplicate_audit.csv
+    python gallery_tools.py convert-store
+    python gallery_tools.py build-index
+    python gallery_tools.py analyze-video clip.mp4 --sample-fps 2 --workers 8
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+
+from config import FaceRecognitionConfig
+from gallery import FaceGalleryIndex, ivf_recall_report
+from gallery_audit import run_duplicate_audit
+from feature_store import FeatureStore, convert_legacy_features, read_features_csv
+from face_sources import load_sources
+from index_snapshot import IndexSnapshot, snapshot_users, source_fingerprint
+from photo_manifest import PhotoManifest
+from video_analysis import analyze_video, format_time
+
+
+def features_file_path(config):
+    """特征文件路径"""
+    return os.path.join(config.get('database_path', 'face_database'),
+                        config.get('features_file', 'face_features.csv'))
+
+
+def load_features(path, config, dim=128):
+    """读取特征，返回 (行姓名列表, float32特征矩阵)
+
+    path 为 .csv 文件时按旧版CSV读取，为目录时按二进制特征库读取；
+    未指定时按配置 feature_store_format 选择。
+    """
+    if path is None:
+        if config.get('feature_store_format', 'npy') == 'npy':
+            path = FeatureStore.from_config(config, dim).path
+        else:
+            path = features_file_path(config)
+    if os.path.isdir(path):
+        row_names, _, matrix = FeatureStore(path, dim).load()
+        return row_names, np.asarray(matrix)
+    row_names, _, matrix = read_features_csv(path, dim)
+    return row_names, matrix
+
+
+def command_ann_report(args, config):
+    """输出IVF近似检索与穷举检索的召回率对比"""
+    row_names, matrix = load_features(args.features, config)
+    if len(row_names) == 0:
+        print("特征库为空，无法生成报告")
+        return 1
+
+    gallery = FaceGalleryIndex(
+        backend='ivf',
+        ivf_nlist=args.nlist if args.nlist is not None else config.get('ivf_nlist', 0),
+        ivf_nprobe=config.get('ivf_nprobe', 8),
+        ivf_min_templates=0
+    ).build_from_arrays(row_names, matrix)
+
+    print(f"特征数: {len(gallery)} | 身份数: {gallery.identity_count} | 簇数量: {len(gallery.ivf.lists)}")
+    report = ivf_recall_report(gallery, args.nprobe, probe_count=args.probes, noise=args.noise, k=args.k)
+
+    print(f"{'nprobe':>8} {'召回率':>8} {'扫描比例':>10} {'IVF耗时(ms)':>12} {'穷举耗时(ms)':>12}")
+    for item in report:
+        print(f"{item['nprobe']:>8} {item['recall']:>10.4f} {item['scanned_ratio']:>12.4f} "
+              f"{item['latency_ms']:>14.3f} {item['exhaustive_latency_ms']:>14.3f}")
+    return 0
+
+
+def command_audit(args, config):
+    """全库重复身份审计"""
+    row_names, matrix = load_features(args.features, config)
+    if len(row_names) == 0:
+        print("特征库为空，无需审计")
+        return 1
+
+    threshold = args.threshold if args.threshold is not None else config.get('threshold', 0.4)
+    report_file = args.output or os.path.join(
+        'logs', f"duplicate_audit_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+
+    print(f"特征数: {len(row_names)} | 身份数: {len(set(row_names))} | 阈值: {threshold}")
+
+    def progress(done, total):
+        print(f"\r审计进度: {done}/{total} 块", end='', flush=True)
+
+    pairs = run_duplicate_audit(row_names, matrix, threshold, report_file,
+                                block_size=args.block_size, max_pairs=args.max_pairs, progress=progress)
+    print()
+    for item in pairs[:20]:
+        print(f"{item['name_a']} <-> {item['name_b']}  距离: {item['distance']:.4f}  "
+              f"命中模板对: {item['template_pairs']}")
+    print(f"疑似重复身份对: {len(pairs)}，报告已写入: {report_file}")
+    return 0
+
+
+def command_convert_store(args, config):
+    """把旧版CSV/JSON特征文件转换为二进制特征库"""
+    store = FeatureStore(args.output) if args.output else FeatureStore.from_config(config)
+    if store.exists() and not args.force:
+        print(f"二进制特征库已存在: {store.path}，如需覆盖请加 --force")
+        return 1
+
+    database_path = config.get('database_path', 'face_database')
+    csv_file = args.csv or features_file_path(config)
+    json_file = args.json or os.path.join(database_path, 'face_features.json')
+    count = convert_legacy_features(store, csv_file=csv_file, json_file=json_file)
+    print(f"转换完成: {count} 个特征 -> {store.path}")
+    return 0
+
+
+def connect_mysql(config):
+    """连接MySQL（DictCursor），依赖缺失或连接失败时返回None"""
+    try:
+        import pymysql
+        return pymysql.connect(
+            host=config.get('mysql_host', 'localhost'),
+            port=config.get('mysql_port', 3306),
+            user=config.get('mysql_user', 'root'),
+            password=config.get('mysql_password', '123456'),
+            database=config.get('mysql_database', 'smart_attendance'),
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor
+        )
+    except Exception as e:
+        print(f"MySQL不可用，快照不包含MySQL数据（主程序启动时会判定为过期并后台重建）: {str(e)}")
+        return None
+
+
+def command_build_index(args, config):
+    """从全部数据来源构建索引快照，主程序启动时直接内存映射"""
+    start = time.perf_counter()
+    conn = None if args.no_mysql else connect_mysql(config)
+    try:
+        fingerprint, sources = source_fingerprint(config, conn)
+        store = FeatureStore.from_config(config)
+        if config.get('feature_store_format', 'npy') == 'npy' and store.exists():
+            def store_loader():
+                # 只读方式读取，不打开日志，主程序运行时也可以执行
+                return store.snapshot(open_journal=False)[::2]
+        else:
+            store_loader = None
+        face_database = {}
+        row_names, matrix, timings = load_sources(config, face_database, store_loader=store_loader, db_conn=conn,
+                                                  photo_manifest=PhotoManifest.from_config(config))
+    finally:
+        if conn is not None:
+            conn.close()
+
+    # 按配置构建索引（含IVF训练），快照中保存训练结果；全精度层不落盘
+    gallery = FaceGalleryIndex.from_config(config)
+    gallery.exact_tier_path = None
+    gallery.build_from_arrays(row_names, matrix)
+    snapshot = IndexSnapshot(args.output) if args.output else IndexSnapshot.from_config(config)
+    manifest = snapshot.write(row_names, matrix, snapshot_users(face_database), fingerprint,
+                              ivf=gallery.ivf, sources=sources)
+
+    for phase, seconds in timings.items():
+        print(f"{phase}: {seconds * 1000:.1f}ms")
+    print(f"索引快照已写入: {snapshot.path}（第 {manifest['generation']} 代）")
+    print(f"用户数: {manifest['users']} | 特征数: {manifest['count']} | "
+          f"IVF: {'是' if gallery.ivf is not None else '否'} | 耗时: {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+def command_analyze_video(args, config):
+    """视频文件识别：抽帧并行计算特征，输出每人出现区间"""
+    row_names, matrix = load_features(args.features, config)
+    if len(row_names) == 0:
+        print("特征库为空，无法识别")
+        return 1
+    gallery = FaceGalleryIndex.from_config(config)
+    gallery.exact_tier_path = None
+    gallery.build_from_arrays(row_names, matrix)
+
+    for key, value in (('video_sample_fps', args.sample_fps), ('video_workers', args.workers),
+                       ('video_max_side', args.max_side)):
+        if value is not None:
+            config[key] = value
+    threshold = config.get('threshold', 0.4)
+
+    def match(descriptors):
+        return [{'name': name, 'distance': distance,
+                 'confidence': max(0.0, 1.0 - distance) if distance is not None else 0.0}
+                for name, distance in gallery.match_batch(np.asarray(descriptors), threshold, args.location)]
+
+    def progress(done, total):
+        print(f"\r识别进度: {done}/{total} 帧", end='', flush=True)
+
+    report_file = args.output or os.path.join(
+        'logs', f"video_{os.path.splitext(os.path.basename(args.video))[0]}_"
+                f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    summary, stats = analyze_video(args.video, config, match, report_file, progress=progress)
+    print()
+    for name, person in sorted(summary.items(), key=lambda item: item[1]['first']):
+        print(f"{name}: {format_time(person['first'])} - {format_time(person['last'])}  "
+              f"{person['intervals']} 段 / {person['seconds']:.0f}s  最高置信度: {person['best_confidence']:.3f}")
+    print(f"时长: {stats['duration']:.0f}s | 抽样帧: {stats['samples']} | 人脸: {stats['faces']} "
+          f"(未匹配 {stats['unknown']}, 质量不足 {stats['rejected']}) | "
+          f"耗时: {stats['elapsed']:.1f}s ({stats['speed']:.1f}倍速)")
+    print(f"出现区间报告已写入: {report_file}")
+    return 0
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="智能人脸识别系统 - 特征库维护工具")
+    subparsers = parser.add_subparsers(dest='command')
+
+    ann_parser = subparsers.add_parser('ann-report', help="IVF近似检索召回率报告")
+    ann_parser.add_argument('--features', help="特征CSV文件或二进制特征库目录，默认按配置选择")
+    ann_parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help="待评估的nprobe取值")
+    ann_parser.add_argument('--nlist', type=int, default=None, help="簇数量，默认使用配置 ivf_nlist")
+    ann_parser.add_argument('--probes', type=int, default=1000, help="探针数量")
+    ann_parser.add_argument('--noise', type=float, default=0.02, help="探针叠加的噪声标准差")
+    ann_parser.add_argument('-k', type=int, default=1, help="召回率统计的top-k")
+    ann_parser.set_defaults(handler=command_ann_report)
+
+    audit_parser = subparsers.add_parser('audit', help="全库重复身份审计")
+    audit_parser.add_argument('--features', help="特征CSV文件或二进制特征库目录，默认按配置选择")
+    audit_parser.add_argument('--threshold', type=float, default=None, help="距离阈值，默认使用配置 threshold")
+    audit_parser.add_argument('--output', help="报告文件路径，默认 logs/duplicate_audit_<时间>.csv")
+    audit_parser.add_argument('--block-size', type=int, default=2048, help="每块模板数，越大越快但占用内存越多")
+    audit_parser.add_argument('--max-pairs', type=int, default=10000, help="报告中最多保留的身份对数量")
+    audit_parser.set_defaults(handler=command_audit)
+
+    convert_parser = subparsers.add_parser('convert-store', help="旧版CSV/JSON特征文件转换为二进制特征库")
+    convert_parser.add_argument('--csv', help="特征CSV文件路径，默认使用配置中的特征文件")
+    convert_parser.add_argument('--json', help="face_features.json 路径，默认 database_path/face_features.json")
+    convert_parser.add_argument('--output', help="特征库目录，默认 database_path/feature_store")
+    convert_parser.add_argument('--force', action='store_true', help="覆盖已存在的特征库")
+    convert_parser.set_defaults(handler=command_convert_store)
+
+    index_parser = subparsers.add_parser('build-index', help="构建索引快照（特征矩阵、用户信息、IVF）")
+    index_parser.add_argument('--output', help="快照目录，默认 database_path/index_snapshot")
+    index_parser.add_argument('--no-mysql', action='store_true', help="不连接MySQL，只使用本地特征库和照片目录")
+    index_parser.set_defaults(handler=command_build_index)
+
+    video_parser = subparsers.add_parser('analyze-video', help="视频文件识别，输出每人出现区间")
+    video_parser.add_argument('video', help="视频文件路径")
+    video_parser.add_argument('--features', help="特征CSV文件或二进制特征库目录，默认按配置选择")
+    video_parser.add_argument('--sample-fps', type=float, default=None, help="每秒抽取帧数，默认使用配置 video_sample_fps")
+    video_parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认使用配置 video_workers")
+    video_parser.add_argument('--max-side', type=int, default=None, help="抽样帧长边像素，默认使用配置 video_max_side")
+    video_parser.add_argument('--location', default=None, help="识别位置（分片特征库路由）")
+    video_parser.add_argument('--output', help="报告文件路径，默认 logs/video_<文件名>_<时间>.csv")
+    video_parser.set_defaults(handler=command_analyze_video)
+
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    config = FaceRecognitionConfig()
+    return args.handler(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+统一图像读取
+字节、文件路径、文件对象或 PIL 图像直接解码为连续、可写的 RGB uint8 数组，不再经过 BGR 往返和多次整图拷贝。
+大尺寸 JPEG 用 PIL draft() 在解码阶段按 1/2、1/4、1/8 缩小（DCT 域缩放，几乎不增加解码开销），
+其他格式用 Image.reduce() 整数倍缩小，使解码结果落在检测器工作分辨率（max_side）与其两倍之间。
+
+返回 (rgb, scale)，scale 为解码结果相对原图（按 EXIF 方向摆正后）的缩放比例，
+解码图像上的人脸框除以 scale 即为原图坐标（见 box_to_original）。
+"""
+
+import io
+import os
+import numpy as np
+from PIL import Image, ImageOps
+
+# EXIF 方向为 5~8 时图像需要旋转 90 度，摆正后宽高互换
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def open_image(source):
+    """字节 / 路径 / 文件对象 / PIL 图像 -> 尚未解码的 PIL 图像"""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+        return Image.open(source)
+    raise TypeError(f"不支持的图像来源类型: {type(source).__name__}")
+
+
+def _orientation(image):
+    try:
+        return image.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+
+
+def load_rgb(source, max_side=None, fit=False, exif_transpose=True):
+    """解码为连续 RGB uint8 数组，返回 (rgb, scale)
+
+    max_side: 检测器工作分辨率（长边像素），为空或 0 时按原尺寸解码；
+    fit: 缩小解码后仍超过 max_side 时再缩放到 max_side 以内（解码缩放只保证不小于 max_side）；
+    exif_transpose: 按 EXIF 方向摆正（手机照片）。
+    """
+    if isinstance(source, np.ndarray):
+        return np.ascontiguousarray(source), 1.0
+    image = open_image(source)
+    orientation = _orientation(image) if exif_transpose else 1
+    width, height = image.size
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    if max_side and max(width, height) > max_side:
+        ratio = max_side / max(width, height)
+        if image.format == 'JPEG':
+            # draft 只在尚未解码时生效，已解码的图像保持原尺寸
+            image.draft('RGB', (int(image.size[0] * ratio), int(image.size[1] * ratio)))
+        else:
+            factor = int(1 / ratio)
+            if factor >= 2:
+                image = image.reduce(factor)
+
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        # RGBA 丢弃透明通道，灰度、调色板、CMYK 等统一转换为 RGB
+        image = image.convert('RGB')
+    if fit and max_side and max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        image = image.resize((max(1, int(image.size[0] * ratio)), max(1, int(image.size[1] * ratio))),
+                             Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    # np.asarray 得到的是只读数组，dlib/OpenCV 部分接口需要可写内存，这里直接生成可写副本
+    rgb = np.array(image, dtype=np.uint8)
+    return rgb, rgb.shape[1] / width
+
+
+def box_to_original(box, scale):
+    """解码图像上的 (左, 上, 右, 下) 框 -> 原图坐标"""
+    if scale == 1.0:
+        return tuple(int(value) for value in box)
+    return tuple(int(round(value / scale)) for value in box)
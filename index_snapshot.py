@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+特征库索引快照
+把汇总后的特征矩阵、行 -> 姓名表、用户信息和 IVF 倒排索引写入一个目录，启动时以内存映射方式读取，
+不再重新解析特征文件、查询 MySQL 和扫描照片目录：
+
+    index_snapshot/
+        manifest.json          提交点：格式版本、维度、行数、当前代号、来源指纹
+        matrix.<代>.npy        float32 (N, 128) 特征矩阵
+        rows.<代>.json         每行的姓名
+        users.<代>.json        用户信息和照片路径 {姓名: {'info', 'images'}}
+        ivf.<代>.npz           IVF 簇中心和倒排列表（仅 ivf 模式）
+
+来源指纹由特征文件/特征库、MySQL 用户与照片表、各用户照片目录的 mtime 及索引相关配置计算，
+代价只是列出一次照片根目录、若干次 stat 和两条聚合查询；指纹不一致说明快照已过期，由调用方在后台重建。
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+
+from gallery import IVFCoarseQuantizer
+
+SNAPSHOT_FORMAT = 'face-index-snapshot'
+SNAPSHOT_VERSION = 1
+
+# 影响索引结构的配置项，变化后快照视为过期
+INDEX_CONFIG_KEYS = ('gallery_backend', 'ivf_nlist', 'ivf_min_templates', 'feature_store_format')
+
+
+def _file_state(path):
+    """文件或目录的 (大小, 修改时间)，不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _photo_directories_state(root):
+    """照片根目录下各用户目录的 (数量, 姓名与 mtime 的摘要)，根目录不存在时为 None
+
+    目录内新增、删除、重命名照片都会改变该用户目录的 mtime（与照片清单的增量刷新依据相同），
+    只看根目录的 mtime 则发现不了已有用户的照片变化。
+    """
+    try:
+        entries = sorted((entry.name, entry.stat().st_mtime_ns) for entry in os.scandir(root)
+                         if entry.is_dir())
+    except OSError:
+        return None
+    digest = hashlib.sha1(json.dumps(entries, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return [len(entries), digest]
+
+
+def _mysql_state(db_conn):
+    """用户表和照片表的行数与最后修改标记"""
+    cursor = db_conn.cursor()
+    try:
+        state = []
+        for sql in ("SELECT COUNT(*) AS total, MAX(updated_at) AS latest FROM users",
+                    "SELECT COUNT(*) AS total, MAX(id) AS latest FROM face_images"):
+            cursor.execute(sql)
+            row = cursor.fetchone()
+            total, latest = (row['total'], row['latest']) if isinstance(row, dict) else row
+            state.append([int(total), str(latest)])
+        return state
+    finally:
+        cursor.close()
+
+
+def source_fingerprint(config, db_conn=None):
+    """计算数据来源指纹，返回 (十六进制摘要, 各部分明细)"""
+    database_path = config.get('database_path', 'face_database')
+    parts = {'config': {key: config.get(key) for key in INDEX_CONFIG_KEYS}}
+    if config.get('feature_store_format', 'npy') == 'npy':
+        store_path = os.path.join(database_path, config.get('feature_store_dir', 'feature_store'))
+        header_file = os.path.join(store_path, 'header.json')
+        try:
+            with open(header_file, 'rb') as f:
+                parts['feature_store'] = hashlib.sha1(f.read()).hexdigest()
+        except OSError:
+            parts['feature_store'] = None
+        parts['journal'] = _file_state(os.path.join(store_path, 'journal.log'))
+    parts['features_file'] = _file_state(os.path.join(database_path, config.get('features_file', 'face_features.csv')))
+    parts['face_images'] = _photo_directories_state(os.path.join(database_path, 'face_images'))
+    if db_conn is not None:
+        parts['mysql'] = _mysql_state(db_conn)
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return digest, parts
+
+
+def snapshot_users(face_database):
+    """face_database -> 快照中保存的用户信息 {姓名: {'info', 'images'}}"""
+    return {name: {'info': data.get('info', {}), 'images': list(data.get('images', []))}
+            for name, data in face_database.items()}
+
+
+class IndexSnapshot:
+    """索引快照目录"""
+
+    def __init__(self, path, dim=128):
+        self.path = path
+        self.dim = dim
+        self.manifest_file = os.path.join(path, 'manifest.json')
+
+    @classmethod
+    def from_config(cls, config, dim=128):
+        return cls(os.path.join(config.get('database_path', 'face_database'),
+                                config.get('index_snapshot_dir', 'index_snapshot')), dim)
+
+    def exists(self):
+        return os.path.exists(self.manifest_file)
+
+    def read_manifest(self):
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION \
+                or manifest.get('dim') != self.dim:
+            raise ValueError(f"索引快照格式不匹配: {self.manifest_file}")
+        return manifest
+
+    def write(self, row_names, matrix, users, fingerprint, ivf=None, sources=None):
+        """写入新一代快照文件，最后替换 manifest.json 作为提交点，返回 manifest"""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        if len(row_names) != matrix.shape[0]:
+            raise ValueError("姓名与特征行数不一致")
+        os.makedirs(self.path, exist_ok=True)
+        generation = 1
+        if self.exists():
+            try:
+                generation = self.read_manifest().get('generation', 0) + 1
+            except ValueError:
+                pass
+
+        files = {
+            'matrix': f'matrix.{generation}.npy',
+            'rows': f'rows.{generation}.json',
+            'users': f'users.{generation}.json'
+        }
+        if matrix.shape[0]:
+            target = np.lib.format.open_memmap(os.path.join(self.path, files['matrix']), mode='w+',
+                                               dtype=np.float32, shape=matrix.shape)
+            target[:] = matrix
+            target.flush()
+            del target
+        with open(os.path.join(self.path, files['rows']), 'w', encoding='utf-8') as f:
+            json.dump(list(row_names), f, ensure_ascii=False)
+        with open(os.path.join(self.path, files['users']), 'w', encoding='utf-8') as f:
+            json.dump(users, f, ensure_ascii=False)
+        if ivf is not None:
+            files['ivf'] = f'ivf.{generation}.npz'
+            centroids, order, bounds = ivf.to_arrays()
+            np.savez(os.path.join(self.path, files['ivf']), centroids=centroids, order=order, bounds=bounds)
+
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'dim': self.dim,
+            'count': int(matrix.shape[0]),
+            'users': len(users),
+            'generation': generation,
+            'files': files,
+            'fingerprint': fingerprint,
+            'sources': sources or {},
+            'created_at': datetime.now().isoformat()
+        }
+        self._write_manifest(manifest)
+        self.remove_stale_generations(generation)
+        return manifest
+
+    def _write_manifest(self, manifest):
+        temp_manifest = self.manifest_file + '.tmp'
+        with open(temp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_manifest, self.manifest_file)
+
+    def invalidate(self):
+        """标记快照已过期（清空来源指纹），下次启动时仍先映射快照，随即在后台重建
+
+        用于不改变特征库文件、因而不改变来源指纹的修改，如编辑用户部门（影响分片）。
+        """
+        if not self.exists():
+            return False
+        manifest = self.read_manifest()
+        if manifest.get('fingerprint') is None:
+            return False
+        manifest['fingerprint'] = None
+        self._write_manifest(manifest)
+        return True
+
+    def load(self, nprobe=8):
+        """读取快照，返回 {'row_names', 'matrix'(只读内存映射), 'users', 'ivf', 'fingerprint', 'manifest'}；
+        快照不存在时返回 None"""
+        if not self.exists():
+            return None
+        manifest = self.read_manifest()
+        files = manifest['files']
+        with open(os.path.join(self.path, files['rows']), 'r', encoding='utf-8') as f:
+            row_names = json.load(f)
+        with open(os.path.join(self.path, files['users']), 'r', encoding='utf-8') as f:
+            users = json.load(f)
+        if manifest['count'] == 0:
+            matrix = np.empty((0, self.dim), dtype=np.float32)
+        else:
+            matrix = np.load(os.path.join(self.path, files['matrix']), mmap_mode='r')
+        if matrix.shape != (manifest['count'], self.dim) or len(row_names) != manifest['count']:
+            raise ValueError(f"索引快照文件不完整: {self.path}")
+
+        ivf = None
+        if 'ivf' in files:
+            with np.load(os.path.join(self.path, files['ivf'])) as arrays:
+                ivf = IVFCoarseQuantizer.from_arrays(arrays['centroids'], arrays['order'], arrays['bounds'], nprobe)
+        return {
+            'row_names': row_names,
+            'matrix': matrix,
+            'users': users,
+            'ivf': ivf,
+            'fingerprint': manifest['fingerprint'],
+            'manifest': manifest
+        }
+
+    def remove_stale_generations(self, current):
+        """删除旧一代文件；仍被映射的文件（Windows）删除失败时留到下次清理"""
+        for file_name in os.listdir(self.path):
+            parts = file_name.split('.')
+            if len(parts) == 3 and parts[0] in ('matrix', 'rows', 'users', 'ivf') and parts[1].isdigit() \
+                    and int(parts[1]) != current:
+                try:
+                    os.remove(os.path.join(self.path, file_name))
+                except OSError:
+                    pass
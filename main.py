@@ -23,6 +23,8 @@ from database import FaceRecognitionDatabase
 from camera import FaceRecognitionCamera
 from utils import FaceRecognitionUtils
 from config import FaceRecognitionConfig
+from gallery import sweep_exact_tier_files
+from gallery_shards import create_gallery
 
 # API服务导入 - 更健壮的导入方式
 API_AVAILABLE = False
@@ -77,8 +79,8 @@ class FaceRecognitionSystem(QMainWindow):
         self.models = FaceRecognitionModels(self)
         # 初始化摄像头
         self.camera = FaceRecognitionCamera(self)
-        # 加载人脸数据库
-        self.load_face_database()
+        # 加载人脸数据库：优先内存映射索引快照，快照过期时后台重建
+        self.database.load_at_startup()
         # 系统启动信息
         self.update_log("系统启动成功")
         self.update_status("就绪")
@@ -99,13 +101,16 @@ class FaceRecognitionSystem(QMainWindow):
     def init_data_structures(self):
         """初始化数据结构"""
         self.face_database = {}  # 人脸数据库: {name: {'features': [], 'images': [], 'info': {}}}
+        # 特征库索引: 连续float32特征矩阵；配置 gallery_shard_field 时按部门等字段分片
+        sweep_exact_tier_files(self.config)  # 清理异常退出遗留的全精度映射文件
+        self.face_gallery = create_gallery(self.config, lambda name: self.face_database.get(name, {}).get('info', {}))
         self.current_frame = None
         self.current_faces = []
         self.tracking_data = defaultdict(dict)
         self.recognition_history = []
         self.attendance_records = {}
         # 新增：人脸识别稳定性相关
-        self.recognition_results = {}  # {face_id: {'name': '', 'confidence': 0, 'history': deque()}}
+        self.recognition_results = {}  # {track_id: {'name': '', 'confidence': 0, 'history': deque()}}
         self.stable_recognition = {}  # 稳定的识别结果
         self.fixed_recognition = {}  # 固定的识别结果
         # 签退人脸识别相关（修复需求3）
@@ -119,13 +124,8 @@ class FaceRecognitionSystem(QMainWindow):
         self.total_recognitions = 0
         self.total_attendance = 0
         self.total_users = 0
-        # 考勤摄像头相关
-        self.attendance_camera = None
-        self.attendance_viewfinder = None
-        # 修复问题1和2：初始化定时器
-        self.recognition_timer = QTimer()
-        self.recognition_timer.timeout.connect(self.perform_recognition)
-        self.recognition_timer.setInterval(100)  # 10fps
+        # 识别线程送回的最新一帧结果（界面绘制识别框使用）
+        self.latest_recognition = None
 
         # 修复问题3：添加信息数据更新定时器（每10秒更新一次）
         self.info_update_timer = QTimer()
@@ -843,26 +843,26 @@ class FaceRecognitionSystem(QMainWindow):
             if self.is_recognition_paused:
                 # 恢复识别
                 self.is_recognition_paused = False
-                self.recognition_timer.start()
+                self.camera.start_recognition_worker()
                 self.pause_recognition_btn.setText("暂停识别")
                 self.update_status("识别中")
                 self.update_log("恢复人脸识别")
             else:
                 # 暂停识别并固定当前结果
                 self.is_recognition_paused = True
-                self.recognition_timer.stop()
+                self.camera.stop_recognition_worker()
 
                 # 固定当前识别结果
                 if self.fixed_recognition:
-                    for face_id, result in list(self.fixed_recognition.items()):
+                    for track_id, result in list(self.fixed_recognition.items()):
                         # 更新固定时间戳
                         result['fixed_at'] = datetime.now()
                         result['paused'] = True
                     self.update_log(f"已暂停识别并固定当前结果")
                 elif self.stable_recognition:
                     # 如果没有固定结果但有稳定结果，自动固定稳定结果
-                    for face_id, result in list(self.stable_recognition.items()):
-                        self.fixed_recognition[face_id] = {
+                    for track_id, result in list(self.stable_recognition.items()):
+                        self.fixed_recognition[track_id] = {
                             'name': result['name'],
                             'confidence': result['confidence'],
                             'fixed_at': datetime.now(),
@@ -885,8 +885,8 @@ class FaceRecognitionSystem(QMainWindow):
                 self.fixed_recognition.clear()
                 self.update_log(f"已清除固定结果: {', '.join(fixed_names)}")
                 # 如果识别正在进行，重新启动识别
-                if self.is_recognizing and not self.is_recognition_paused:
-                    self.recognition_timer.start()
+                if self.is_recognizing and not getattr(self, 'is_recognition_paused', False):
+                    self.camera.start_recognition_worker()
                 # 更新界面
                 self.fixed_label.setText("状态: 实时")
                 self.fixed_label.setStyleSheet("font-size: 14px; color: blue;")
@@ -895,9 +895,9 @@ class FaceRecognitionSystem(QMainWindow):
         except Exception as e:
             self.update_log(f"清除固定结果失败: {str(e)}")
 
-    def recognize_face_from_image(self, image):
+    def recognize_face_from_image(self, image, location=None):
         """从图像识别人脸"""
-        return self.models.recognize_face_from_image(image)
+        return self.models.recognize_face_from_image(image, location)
 
     def toggle_enroll_camera(self):
         """切换录入摄像头"""
@@ -955,9 +955,16 @@ class FaceRecognitionSystem(QMainWindow):
         """保存到数据库"""
         self.database.save_to_database(name, age, gender, department, photo_paths)
 
-    def perform_recognition(self):
+    def on_recognition_results(self, result):
+        """识别线程送回一帧结果（Qt信号，在界面线程中执行）"""
+        if not self.is_recognizing:
+            return
+        self.latest_recognition = result
+        self.perform_recognition(result)
+
+    def perform_recognition(self, result):
         """执行人脸识别"""
-        self.models.perform_recognition()
+        self.models.perform_recognition(result)
 
     def start_attendance_camera(self):
         """启动考勤摄像头"""
@@ -1000,13 +1007,13 @@ class FaceRecognitionSystem(QMainWindow):
             if reply == QMessageBox.No:
                 return
 
+            # 先取出姓名再删除，删除行后其余行的行号会变化
+            names = [self.data_table.item(row.row(), 0).text() for row in selected_rows]
             deleted_count = 0
-            for row in selected_rows:
-                name = self.data_table.item(row.row(), 0).text()
+            for name in names:
                 if self.database.delete_face(name):
+                    self.database.remove_table_row(name)
                     deleted_count += 1
-
-            self.refresh_data()
             QMessageBox.information(self, "成功", f"成功删除 {deleted_count} 个用户")
         except Exception as e:
             self.update_log(f"删除用户失败: {str(e)}")
@@ -1118,6 +1125,11 @@ class FaceRecognitionSystem(QMainWindow):
             # 5. 更新摄像头状态信息
             camera_status = "开启" if self.is_camera_running else "关闭"
             self.update_log(f"摄像头状态: {camera_status}")
+            for camera_id, stats in self.camera.get_pipeline_stats().items():
+                lag_text = f"{stats['lag_ms_avg']:.0f}ms (p95 {stats['lag_ms_p95']:.0f}ms)" \
+                    if stats['lag_ms_avg'] is not None else "-"
+                self.update_log(f"摄像头[{camera_id}] 采集 {stats['capture_fps']:.1f}fps, 识别 {stats['process_fps']:.1f}fps, "
+                                f"丢帧 {stats['dropped']}/{stats['captured']}, 延迟 {lag_text}")
 
             # 6. 更新识别模式信息
             recognition_mode = "稳定化" if self.stability_control.isChecked() else "实时"
@@ -1367,15 +1379,18 @@ class FaceRecognitionSystem(QMainWindow):
             self.stop_attendance()
             self.stop_api_service()
             self.stop_attendance_camera()
+            self.utils.stop_video_analysis()
 
             # 停止所有定时器
-            if self.recognition_timer.isActive():
-                self.recognition_timer.stop()
             if self.info_update_timer.isActive():
                 self.info_update_timer.stop()
 
             # 保存数据
+            self.database.wait_face_features()
             self.database.save_face_database()
+            self.database.close_feature_store()
+            self.database.save_photo_manifest()
+            self.face_gallery.close()
 
             # 关闭数据库连接
             if hasattr(self.database, 'db_conn') and self.database.db_conn:
@@ -1,14 +1,19 @@
 
 import os
+import time
+import threading
 import numpy as np
 import dlib
 from collections import deque, defaultdict
 from datetime import datetime
 from PIL import Image, ImageDraw
-import cv2
 from PyQt5.QtWidgets import QMessageBox
 import random
 
+from face_tracker import FaceTrack
+from face_quality import FaceQuality
+from image_ingest import load_rgb, box_to_original
+
 
 class FaceRecognitionModels:
     """模型管理类"""
@@ -21,6 +26,10 @@ class FaceRecognitionModels:
         self.face_recognizer = None
         self.emotion_model = None
         self.mask_model = None
+        # 人脸质量评分（识别线程中在特征点和特征之前使用）
+        self.face_quality = FaceQuality.from_config(self.config)
+        # dlib 模型对象不能被多个线程同时调用（识别线程、闸机识别线程、API 请求）
+        self.inference_lock = threading.Lock()
         self.init_models()
 
     def init_models(self):
@@ -93,40 +102,17 @@ class FaceRecognitionModels:
         """检测录入人脸 - 简化版本，直接返回True让流程继续"""
         try:
             # 记录原始图像信息
-            self.parent.update_log(f"图像模式: {image.mode}, 尺寸: {image.size}")
+            if hasattr(image, 'mode'):
+                self.parent.update_log(f"图像模式: {image.mode}, 尺寸: {image.size}")
 
-            # 方法1: 尝试使用OpenCV处理
+            # 方法1: 直接解码为连续RGB数组（dlib需要RGB格式）
             try:
-                import cv2
-                # 将PIL图像转换为numpy数组
-                img_array = np.array(image)
-
-                # 根据图像模式进行正确的颜色转换
-                if image.mode == 'RGBA':
-                    # RGBA转RGB
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-                elif image.mode == 'L':
-                    # 灰度图转RGB
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-                elif image.mode == 'RGB':
-                    # RGB转BGR（OpenCV使用BGR）
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                else:
-                    # 其他模式先转RGB再转BGR
-                    rgb_image = image.convert('RGB')
-                    img_array = np.array(rgb_image)
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-
-                # 确保数据类型是uint8
-                if img_array.dtype != np.uint8:
-                    img_array = img_array.astype(np.uint8)
+                img_array_rgb, _ = load_rgb(image, self.config.get('ingest_max_side', 1600))
 
-                # 将BGR转回RGB（dlib需要RGB格式）
-                img_array_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
-
-                # 检测人脸
+                # 检测人脸（与识别线程共用检测器，串行调用）
                 if self.detector:
-                    faces = self.detector(img_array_rgb)
+                    with self.inference_lock:
+                        faces = self.detector(img_array_rgb)
                     if len(faces) > 0:
                         self.parent.update_log(f"检测到 {len(faces)} 张人脸")
                         return True
@@ -137,8 +123,8 @@ class FaceRecognitionModels:
                     self.parent.update_log("人脸检测器未加载，允许继续")
                     return True
 
-            except Exception as cv_error:
-                self.parent.update_log(f"OpenCV处理失败: {str(cv_error)}")
+            except Exception as decode_error:
+                self.parent.update_log(f"图像解码失败: {str(decode_error)}")
                 # 即使处理失败也允许继续
                 return True
 
@@ -185,8 +171,9 @@ class FaceRecognitionModels:
             self.parent.update_status("识别中")
             self.parent.update_log("开始人脸识别")
 
-            # 启动识别定时器
-            self.parent.recognition_timer.start()
+            # 启动识别线程：推理在线程中进行，结果通过信号送回界面线程
+            if not self.parent.camera.start_recognition_worker():
+                self.parent.update_log("摄像头未提供帧数据，无法启动识别线程")
 
         except Exception as e:
             self.parent.update_log(f"启动识别失败: {str(e)}")
@@ -195,8 +182,8 @@ class FaceRecognitionModels:
         """停止人脸识别"""
         try:
             self.parent.is_recognizing = False
-            # 停止定时器
-            self.parent.recognition_timer.stop()
+            # 停止识别线程
+            self.parent.camera.stop_recognition_worker()
 
             # 重置识别状态
             self.parent.recognition_results = {}
@@ -221,8 +208,11 @@ class FaceRecognitionModels:
         except Exception as e:
             self.parent.update_log(f"停止识别失败: {str(e)}")
 
-    def recognize_face_from_image(self, image):
-        """从图像识别人脸"""
+    def recognize_face_from_image(self, image, location=None):
+        """从图像识别人脸，location 为识别位置（用于分片特征库路由）
+
+        image 可以是 PIL 图像、图片字节、文件路径或 RGB 数组；返回的 boxes 为原图坐标。
+        """
         try:
             # 检查模型状态
             if self.parent.model_status != "完整":
@@ -231,56 +221,253 @@ class FaceRecognitionModels:
             if not self.detector or not self.predictor or not self.face_recognizer:
                 return {'success': False, 'error': 'Model components missing'}
 
-            # 使用与detect_face_for_enrollment相同的图像处理方法
-            # 将PIL图像转换为OpenCV格式
-            img_array = np.array(image)
-
-            # 根据图像模式进行正确的颜色转换
-            if image.mode == 'RGBA':
-                # RGBA转RGB
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-            elif image.mode == 'L':
-                # 灰度图转RGB
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-            elif image.mode == 'RGB':
-                # RGB转BGR（OpenCV使用BGR）
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            else:
-                # 其他模式先转RGB再转BGR
-                rgb_image = image.convert('RGB')
-                img_array = np.array(rgb_image)
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-
-            # 确保数据类型是uint8
-            if img_array.dtype != np.uint8:
-                img_array = img_array.astype(np.uint8)
-
-            # 确保数组是连续的
-            if not img_array.flags['C_CONTIGUOUS']:
-                img_array = np.ascontiguousarray(img_array)
-
-            # 将BGR转回RGB（dlib需要RGB格式）
-            img_array_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
+            # 直接解码为连续RGB数组（大尺寸JPEG在解码阶段缩小到检测分辨率附近）
+            img_array_rgb, scale = load_rgb(image, self.config.get('ingest_max_side', 1600))
 
-            # 检测人脸
-            faces = self.detector(img_array_rgb)
-            if len(faces) == 0:
-                return {'success': False, 'error': 'No face detected'}
-
-            # 提取特征
-            face_descriptors = []
-            for face in faces:
-                shape = self.predictor(img_array_rgb, face)
-                face_descriptor = self.face_recognizer.compute_face_descriptor(img_array_rgb, shape)
-                face_descriptors.append(np.array(face_descriptor))
-
-            return {'success': True, 'descriptors': face_descriptors, 'face_count': len(faces)}
+            with self.inference_lock:
+                # 检测人脸
+                faces = self.detector(img_array_rgb)
+                if len(faces) == 0:
+                    return {'success': False, 'error': 'No face detected'}
+
+                # 提取特征：所有人脸一次批量计算
+                shapes = [self.predictor(img_array_rgb, face) for face in faces]
+                face_descriptors = list(self.compute_descriptors([img_array_rgb], [shapes])[0])
+
+            # 通过特征库索引批量匹配所有人脸（一次矩阵乘法）
+            matches = self.match_descriptors(face_descriptors, location)
+            best = min(matches, key=lambda m: m['distance'] if m['distance'] is not None else np.inf)
+            user_info = self.parent.face_database.get(best['name'], {}).get('info', {}) if best['name'] else {}
+
+            return {
+                'success': True,
+                'descriptors': face_descriptors,
+                'face_count': len(faces),
+                # 人脸框映射回原图坐标 (左, 上, 右, 下)
+                'boxes': [box_to_original((face.left(), face.top(), face.right(), face.bottom()), scale)
+                          for face in faces],
+                'matches': matches,
+                'name': best['name'] or "无该人像",
+                'confidence': best['confidence'],
+                'age': user_info.get('age', ''),
+                'gender': user_info.get('gender', ''),
+                'emotion': None,
+                'mask': None
+            }
 
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def perform_recognition(self):
-        """执行人脸识别 - 优化稳定性，实现快速固定"""
+    def match_descriptor(self, descriptor, location=None):
+        """在特征库索引中匹配单个人脸特征"""
+        return self.match_descriptors([descriptor], location)[0]
+
+    def match_descriptors(self, descriptors, location=None):
+        """在特征库索引中批量匹配多个人脸特征；location 未指定时使用本机摄像头位置"""
+        if len(descriptors) == 0:
+            return []
+        threshold = self.config.get('threshold', 0.4)
+        if location is None:
+            location = self.config.get('camera_location', '默认位置')
+        matches = []
+        for name, distance in self.parent.face_gallery.match_batch(np.asarray(descriptors), threshold, location):
+            confidence = max(0.0, 1.0 - distance) if distance is not None else 0.0
+            matches.append({'name': name, 'distance': distance, 'confidence': confidence})
+        return matches
+
+    def compute_descriptors(self, images, shapes_per_image):
+        """批量计算特征：一次网络调用处理多张图像中的全部人脸
+
+        images[i] 中人脸的特征点为 shapes_per_image[i]，返回每张图像的特征列表（numpy 数组）。
+        单张图像使用 dlib 的多人脸接口，多张图像使用多图像批量接口，摊薄每次调用的固定开销。
+        """
+        batch_images = []
+        batch_shapes = []
+        positions = []
+        for i, (image, shapes) in enumerate(zip(images, shapes_per_image)):
+            if len(shapes) == 0:
+                continue
+            detections = dlib.full_object_detections()
+            for shape in shapes:
+                detections.append(shape)
+            batch_images.append(image)
+            batch_shapes.append(detections)
+            positions.append(i)
+
+        results = [[] for _ in images]
+        if not batch_images:
+            return results
+        if len(batch_images) == 1:
+            batches = [self.face_recognizer.compute_face_descriptor(batch_images[0], batch_shapes[0])]
+        else:
+            batches = self.face_recognizer.compute_face_descriptor(batch_images, batch_shapes)
+        for i, descriptors in zip(positions, batches):
+            results[i] = [np.array(descriptor) for descriptor in descriptors]
+        return results
+
+    def compute_descriptors_from_paths(self, photo_paths, log=None):
+        """计算照片中人脸的特征向量，每张照片取第一张人脸，返回特征列表
+
+        每 descriptor_batch_size 张照片的人脸合并为一次批量特征计算。
+        log: 错误信息输出，缺省为界面日志；在后台线程中调用时须传入线程安全的函数。
+        """
+        log = log or self.parent.update_log
+        descriptors = []
+        if not self.detector or not self.predictor or not self.face_recognizer:
+            return descriptors
+
+        batch_size = max(1, self.config.get('descriptor_batch_size', 16))
+        max_side = self.config.get('ingest_max_side', 1600)
+        for start in range(0, len(photo_paths), batch_size):
+            images = []
+            shapes = []
+            for photo_path in photo_paths[start:start + batch_size]:
+                try:
+                    img_array_rgb, _ = load_rgb(photo_path, max_side)
+                    # 解码不持锁；检测和特征点与识别线程共用模型，串行调用
+                    with self.inference_lock:
+                        faces = self.detector(img_array_rgb)
+                        if len(faces) == 0:
+                            continue
+                        shape = self.predictor(img_array_rgb, faces[0])
+                    images.append(img_array_rgb)
+                    shapes.append([shape])
+                except Exception as e:
+                    log(f"计算照片特征失败 {photo_path}: {str(e)}")
+            try:
+                with self.inference_lock:
+                    batches = self.compute_descriptors(images, shapes)
+                for image_descriptors in batches:
+                    descriptors.extend([float(x) for x in descriptor] for descriptor in image_descriptors)
+            except Exception as e:
+                log(f"批量计算照片特征失败: {str(e)}")
+        return descriptors
+
+    def analyze_frame(self, frame, location=None, tracker=None):
+        """分析一帧 RGB 图像：检测(或跟踪) -> 特征点 -> 特征 -> 特征库批量匹配（在识别线程中调用）
+
+        tracker 为该摄像头的 FaceTracker 时每 N 帧整帧检测一次，其间跟踪已知人脸框，track_id 跨帧保持不变；
+        同一条轨迹的特征只在人脸质量明显提高或超过 embedding_refresh_interval 秒时重新计算，其余帧复用缓存的匹配结果。
+        质量评分低于 face_quality_min_score 的人脸不计算特征（rejected），有未过期的缓存时仍使用缓存结果。
+        不使用跟踪器时 track_id 只是本帧内的序号。
+        返回人脸列表 [{'track_id', 'box': (左, 上, 右, 下), 'detected', 'cached', 'rejected', 'quality',
+                       'name', 'distance', 'confidence'}, ...]，
+        缺少特征点或识别模型时只返回人脸框（name 为 None）。
+        """
+        return self.analyze_frames([(frame, location, tracker)])[0]
+
+    def analyze_frames(self, items):
+        """批量分析多帧（多个排队帧或多路摄像头同一时刻的帧）：items 为 [(帧, 位置, 跟踪器), ...]
+
+        每帧分别检测/跟踪、质量评分和计算特征点，所有帧中需要计算的人脸合并为一次批量特征计算，
+        再按位置分组批量匹配。返回与 items 对应的人脸列表（格式同 analyze_frame）。
+        """
+        if self.detector is None:
+            return [[] for _ in items]
+        now = time.monotonic()
+        results = []
+        frames = []
+        frame_shapes = []
+        frame_computed = []
+        # 主摄像头和多路闸机摄像头的识别线程共用同一套 dlib 模型，推理部分串行执行
+        with self.inference_lock:
+            for frame, location, tracker in items:
+                faces, shapes, computed = self.prepare_frame(frame, tracker, now)
+                results.append(faces)
+                frames.append(frame)
+                frame_shapes.append(shapes)
+                frame_computed.append([(face, track, quality, location) for face, track, quality in computed])
+
+            computed = [item for items_computed in frame_computed for item in items_computed]
+            # 所有帧中需要计算的人脸一次批量计算特征
+            descriptors = [descriptor for image_descriptors in self.compute_descriptors(frames, frame_shapes)
+                           for descriptor in image_descriptors] if computed else []
+        if computed:
+            matches = [None] * len(descriptors)
+            if len(self.parent.face_gallery):
+                by_location = defaultdict(list)
+                for k, item in enumerate(computed):
+                    by_location[item[3]].append(k)
+                for location, positions in by_location.items():
+                    for k, match in zip(positions, self.match_descriptors([descriptors[k] for k in positions],
+                                                                          location)):
+                        matches[k] = match
+            for (face, track, quality, location), descriptor, match in zip(computed, descriptors, matches):
+                track.store_descriptor(descriptor, match, quality, now)
+                if match is not None:
+                    face.update(match)
+
+        for (frame, location, tracker), faces, items_computed in zip(items, results, frame_computed):
+            if tracker is not None:
+                tracker.descriptor_computes += len(items_computed)
+                tracker.descriptor_reuses += sum(1 for face in faces if face['cached'])
+                tracker.quality_rejections += sum(1 for face in faces if face['rejected'])
+        return results
+
+    def prepare_frame(self, frame, tracker, now):
+        """一帧的检测/跟踪、质量评分和特征点，返回 (人脸列表, 待计算特征的特征点, [(人脸, 轨迹, 质量), ...])"""
+        if tracker is not None:
+            tracks, detected = tracker.update(frame)
+        else:
+            tracks = []
+            for i, rect in enumerate(self.detector(frame)):
+                tracks.append(FaceTrack(i, (rect.left(), rect.top(), rect.right(), rect.bottom())))
+            detected = True
+
+        refresh_interval = self.config.get('embedding_refresh_interval', 2.0)
+        quality_gain = self.config.get('embedding_quality_gain', 0.15)
+        faces = []
+        pending = []  # 需要计算特征点的 (人脸, 轨迹, 质量分项)
+        for track in tracks:
+            face = {
+                'track_id': track.track_id,
+                'box': track.box,
+                'detected': detected,
+                'cached': False,
+                'rejected': False,
+                'quality': None,
+                'name': None,
+                'distance': None,
+                'confidence': 0.0
+            }
+            faces.append(face)
+            if not (self.predictor and self.face_recognizer):
+                continue
+            # 质量评分（尺寸/清晰度/亮度）在特征点和特征之前进行，低质量人脸不再计算
+            quality, scores = self.face_quality.pre_score(frame, track.box)
+            face['quality'] = quality
+            accepted = self.face_quality.accept(quality)
+            if accepted and track.needs_descriptor(quality, now, refresh_interval, quality_gain):
+                pending.append((face, track, scores))
+            elif not self.use_cached_match(face, track, now, refresh_interval):
+                face['rejected'] = not accepted
+
+        shapes = []
+        computed = []
+        for face, track, scores in pending:
+            shape = self.predictor(frame, dlib.rectangle(*track.box))
+            # 加入特征点估计的姿态后再判断一次，侧脸不计算特征
+            quality, scores = self.face_quality.with_pose(scores, shape)
+            face['quality'] = quality
+            if not self.face_quality.accept(quality):
+                if not self.use_cached_match(face, track, now, refresh_interval):
+                    face['rejected'] = True
+                continue
+            shapes.append(shape)
+            computed.append((face, track, quality))
+        return faces, shapes, computed
+
+    @staticmethod
+    def use_cached_match(face, track, now, refresh_interval):
+        """轨迹缓存的匹配结果仍在刷新间隔内时用于本帧，返回是否使用了缓存"""
+        if track.match is None or now - track.computed_at >= refresh_interval:
+            return False
+        face.update(track.match)
+        face['cached'] = True
+        return True
+
+    def perform_recognition(self, result):
+        """处理识别线程送回的一帧结果：每条人脸轨迹单独稳定化（一帧一遍），界面显示画面中最大的人脸"""
         if not self.parent.is_recognizing:
             return
 
@@ -292,370 +479,356 @@ class FaceRecognitionModels:
             # 检查模型状态
             if not self.predictor:
                 self.parent.result_label.setText("无法识别：缺少特征点预测器")
-                self.parent.confidence_label.setText("置信度: -")
-                self.parent.stability_label.setText("稳定性: -")
-                self.parent.fixed_label.setText("状态: 实时")
-                self.parent.fixed_label.setStyleSheet("font-size: 14px; color: blue;")
-                self.parent.age_gender_label.setText("年龄/性别: -")
-                self.parent.emotion_label.setText("情绪: -")
-                self.parent.mask_label.setText("口罩: -")
+                self.clear_result_labels()
                 return
 
             # 如果没有摄像头，不进行实时识别
             if not self.parent.is_camera_running:
                 return
 
-            # 修复问题1：优化人脸检测稳定性，减少误判
-            # 使用更智能的人脸检测逻辑，减少频繁丢失
-            # 识别时提高检测概率，减少误判
-            detection_probability = 0.95 if self.parent.is_recognizing else 0.3
-            if random.random() > (1 - detection_probability):  # 95%概率检测到人脸（识别时）
-
+            now = datetime.now()
+            primary = None
+            seen = set()
+            for face in result['faces']:
+                track_id = face.get('track_id')
+                seen.add(track_id)
                 if self.face_recognizer and self.parent.face_database:
-                    # 随机选择一个人脸进行匹配
-                    names = list(self.parent.face_database.keys())
-                    matched_name = random.choice(names)
-                    confidence = random.uniform(0.1, 0.9)
-
-                    # 修复问题4：置信度低于80%显示无该人像
-                    if confidence < 0.8:
-                        display_name = "无该人像"
-                        display_confidence = confidence
+                    if face.get('rejected'):
+                        face['display'] = self.low_quality_display(track_id, face, now)
                     else:
-                        display_name = matched_name
-                        display_confidence = confidence
-
-                    # 应用识别稳定化
-                    if self.parent.stability_control.isChecked():
-                        # 模拟人脸跟踪ID
-                        face_id = 0
-
-                        # 如果已经固定，直接使用固定结果
-                        if face_id in self.parent.fixed_recognition:
-                            fixed_data = self.parent.fixed_recognition[face_id]
-                            # 使用固定结果中的完整用户信息
-                            self.parent.result_label.setText(f"识别结果: <b>{fixed_data['name']}</b>")
-                            self.parent.confidence_label.setText(f"置信度: {fixed_data['confidence']:.3f}")
-                            self.parent.stability_label.setText("稳定性: 固定")
-                            self.parent.fixed_label.setText("状态: 已固定")
-                            self.parent.fixed_label.setStyleSheet("font-size: 14px; color: green;")
-
-                            # 显示固定的年龄、性别和部门信息
-                            if fixed_data.get('age') and fixed_data.get('gender'):
-                                age_text = f"{fixed_data['age']}岁"
-                                gender_text = fixed_data['gender']
-                                dept_text = f" | 部门: {fixed_data['department']}" if fixed_data.get(
-                                    'department') else ""
-                                self.parent.age_gender_label.setText(f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                            else:
-                                # 如果固定结果中没有用户信息，从数据库获取
-                                display_name = fixed_data['name']
-                                if display_name in self.parent.face_database:
-                                    user_info = self.parent.face_database[display_name].get('info', {})
-                                    age = user_info.get('age', '')
-                                    gender = user_info.get('gender', '')
-                                    department = user_info.get('department', '')
-                                    age_text = f"{age}岁" if age and age.isdigit() else ""
-                                    gender_text = gender if gender else ""
-                                    dept_text = f" | 部门: {department}" if department else ""
-                                    if age_text and gender_text:
-                                        self.parent.age_gender_label.setText(
-                                            f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                                    else:
-                                        self.parent.age_gender_label.setText("年龄/性别: -")
-                                else:
-                                    self.parent.age_gender_label.setText("年龄/性别: -")
-
-                            # 其他属性保持不变
-                            self.parent.emotion_label.setText("情绪: - (固定状态)")
-                            self.parent.mask_label.setText("口罩: - (固定状态)")
-
-                            # 记录识别历史
-                            if fixed_data['name'] != "unknown" and fixed_data['name'] != "无该人像":
-                                self.parent.recognition_history.append({
-                                    'name': fixed_data['name'],
-                                    'confidence': fixed_data['confidence'],
-                                    'timestamp': datetime.now().isoformat()
-                                })
-                                self.parent.total_recognitions += 1
-                                self.parent.update_stats()
-
-                            # 如果是考勤模式，设置当前考勤用户
-                            if self.parent.is_attendance_running and fixed_data['name'] != "无该人像":
-                                self.parent.set_current_attendance_user(fixed_data['name'])
-
-                            return
-
-                        # 初始化识别结果
-                        if face_id not in self.parent.recognition_results:
-                            self.parent.recognition_results[face_id] = {
-                                'name': display_name,
-                                'confidence': display_confidence,
-                                'history': deque(maxlen=self.config.get('max_recognition_history', 3))
-                            }
+                        face['display'] = self.stabilize_track(track_id, face, now)
+                    face['label'] = face['display']['name']
+                else:
+                    face['display'] = None
+                if primary is None or self.box_area(face['box']) > self.box_area(primary['box']):
+                    primary = face
+
+            # 离开画面的轨迹：固定结果保留3秒后清除
+            self.expire_tracks(seen, now)
+
+            if primary is None:
+                self.show_face_lost(now)
+            elif primary['display'] is None:
+                # 只有人脸检测功能
+                self.parent.result_label.setText("检测到人脸")
+                self.clear_result_labels()
+                self.parent.fixed_label.setText("状态: 检测模式")
+                self.parent.fixed_label.setStyleSheet("font-size: 14px; color: orange;")
+            else:
+                self.show_track_result(primary['display'])
+
+        except Exception as e:
+            self.parent.update_log(f"人脸识别过程中发生错误: {str(e)}")
+            self.parent.result_label.setText(f"识别错误: {str(e)[:20]}...")
 
-                        # 更新识别历史
-                        history = self.parent.recognition_results[face_id]['history']
-                        history.append((display_name, display_confidence))
-
-                        # 获取用户信息（年龄、性别、部门）- 从数据库读取
-                        age = None
-                        gender = None
-                        department = None
-
-                        if display_name != "无该人像" and display_name in self.parent.face_database:
-                            # 从数据库获取用户信息
-                            user_info = self.parent.face_database[display_name].get('info', {})
-                            age = user_info.get('age', '')
-                            gender = user_info.get('gender', '')
-                            department = user_info.get('department', '')
-
-                            # 如果数据库中没有年龄或性别，使用随机值作为 fallback
-                            if not age or not age.isdigit():
-                                age = random.randint(18, 60)
-                            else:
-                                age = int(age)
-
-                            if not gender:
-                                gender = random.choice(["男", "女"])
-
-                        # 优化：如果置信度足够高，直接固定结果（包含年龄、性别、部门）
-                        if display_confidence > 0.85 and display_name != "无该人像":
+    @staticmethod
+    def box_area(box):
+        return (box[2] - box[0]) * (box[3] - box[1])
+
+    def clear_result_labels(self):
+        """清空除识别结果外的结果标签"""
+        self.parent.confidence_label.setText("置信度: -")
+        self.parent.stability_label.setText("稳定性: -")
+        self.parent.fixed_label.setText("状态: 实时")
+        self.parent.fixed_label.setStyleSheet("font-size: 14px; color: blue;")
+        self.parent.age_gender_label.setText("年龄/性别: -")
+        self.parent.emotion_label.setText("情绪: -")
+        self.parent.mask_label.setText("口罩: -")
+
+    def user_attributes(self, name):
+        """从数据库读取用户的 (年龄, 性别, 部门)；年龄不是数字时为空"""
+        if name not in self.parent.face_database:
+            return '', '', ''
+        user_info = self.parent.face_database[name].get('info', {})
+        age = user_info.get('age', '')
+        return (age if age and age.isdigit() else ''), user_info.get('gender', ''), user_info.get('department', '')
+
+    def record_recognition(self, name, confidence):
+        """记录识别历史，考勤模式下设置当前考勤用户"""
+        self.parent.recognition_history.append({
+            'name': name,
+            'confidence': confidence,
+            'timestamp': datetime.now().isoformat()
+        })
+        self.parent.total_recognitions += 1
+        self.parent.update_stats()
+
+        # 如果是考勤模式，设置当前考勤用户
+        if self.parent.is_attendance_running and name != "无该人像":
+            self.parent.set_current_attendance_user(name)
+
+    def stabilize_track(self, track_id, face, now):
+        """对一条人脸轨迹做一次稳定化，返回界面显示内容
+
+        每条轨迹有自己的投票历史（recognition_results）、稳定结果（stable_recognition）
+        和固定结果（fixed_recognition），画面中多个人互不影响。
+        """
+        # 特征库匹配已按 threshold 判定：name 为空即未匹配，显示无该人像
+        display_name = face['name'] or "无该人像"
+        display_confidence = face['confidence']
+        distance = face.get('distance')
+        # 距离不超过 threshold 的 recognition_instant_fix_ratio 倍时视为高置信度，直接固定
+        instant_fix_distance = self.config.get('threshold', 0.4) * \
+            self.config.get('recognition_instant_fix_ratio', 0.6)
+
+        if not self.parent.stability_control.isChecked():
+            age, gender, department = self.live_attributes(display_name)
+            return self.live_display(display_name, display_confidence, age, gender, department,
+                                     "未启用", "状态: 实时", "blue")
+
+        # 如果已经固定，直接使用固定结果
+        if track_id in self.parent.fixed_recognition:
+            return self.fixed_display(track_id, now)
+
+        # 初始化识别结果
+        if track_id not in self.parent.recognition_results:
+            self.parent.recognition_results[track_id] = {
+                'name': display_name,
+                'confidence': display_confidence,
+                'history': deque(maxlen=self.config.get('max_recognition_history', 3))
+            }
+
+        # 更新识别历史
+        history = self.parent.recognition_results[track_id]['history']
+        history.append((display_name, display_confidence))
+
+        # 获取用户信息（年龄、性别、部门）- 从数据库读取
+        age, gender, department = self.live_attributes(display_name)
+
+        # 优化：如果置信度足够高，直接固定结果（包含年龄、性别、部门）
+        if face['name'] and distance is not None and distance <= instant_fix_distance:
+            # 保存完整的用户信息到固定结果中
+            self.parent.fixed_recognition[track_id] = {
+                'name': display_name,
+                'confidence': display_confidence,
+                'age': age,
+                'gender': gender,
+                'department': department,
+                'fixed_at': now,
+                'last_seen': now
+            }
+            self.parent.update_log(
+                f"高置信度固定识别结果: {display_name} (置信度: {display_confidence:.3f}, 轨迹 {track_id})")
+
+            # 记录识别历史
+            self.record_recognition(display_name, display_confidence)
+            return {
+                'name': display_name,
+                'confidence': display_confidence,
+                'stability_text': "高置信度固定",
+                'fixed_text': "状态: 已固定",
+                'fixed_color': "green",
+                'age': age,
+                'gender': gender,
+                'department': department
+            }
+
+        # 计算稳定性
+        if len(history) >= self.config.get('min_stable_frames', 2):
+            name_counts = defaultdict(int)
+            total_confidence = 0
+            for name, conf in history:
+                name_counts[name] += 1
+                total_confidence += conf
+
+            # 找出最频繁的识别结果
+            most_common_name = max(name_counts.keys(), key=lambda k: name_counts[k])
+            stability = name_counts[most_common_name] / len(history)
+
+            # 优化：提高稳定性判断标准
+            if stability > self.config.get('recognition_stability_threshold', 0.3):
+                self.parent.stable_recognition[track_id] = {
+                    'name': most_common_name,
+                    'confidence': total_confidence / len(history),
+                    'stability': stability
+                }
+
+                # 应用结果固定 - 优化：更容易固定结果
+                if self.parent.fix_result_control.isChecked():
+                    if stability > self.config.get('recognition_fix_threshold', 0.6):
+                        if track_id not in self.parent.fixed_recognition:
                             # 保存完整的用户信息到固定结果中
-                            self.parent.fixed_recognition[face_id] = {
-                                'name': display_name,
-                                'confidence': display_confidence,
+                            self.parent.fixed_recognition[track_id] = {
+                                'name': most_common_name,
+                                'confidence': total_confidence / len(history),
                                 'age': age,
                                 'gender': gender,
                                 'department': department,
-                                'fixed_at': datetime.now()
+                                'fixed_at': now,
+                                'last_seen': now
                             }
-
-                            self.parent.result_label.setText(f"识别结果: <b>{display_name}</b>")
-                            self.parent.confidence_label.setText(f"置信度: {display_confidence:.3f}")
-                            self.parent.stability_label.setText("稳定性: 高置信度固定")
-                            self.parent.fixed_label.setText("状态: 已固定")
-                            self.parent.fixed_label.setStyleSheet("font-size: 14px; color: green;")
-
-                            # 显示年龄、性别和部门信息
-                            if age and gender:
-                                age_text = f"{age}岁"
-                                gender_text = gender
-                                dept_text = f" | 部门: {department}" if department else ""
-                                self.parent.age_gender_label.setText(f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                            else:
-                                self.parent.age_gender_label.setText("年龄/性别: -")
-
                             self.parent.update_log(
-                                f"高置信度固定识别结果: {display_name} (置信度: {display_confidence:.3f})")
-
-                            # 记录识别历史
-                            self.parent.recognition_history.append({
-                                'name': display_name,
-                                'confidence': display_confidence,
-                                'timestamp': datetime.now().isoformat()
-                            })
-                            self.parent.total_recognitions += 1
-                            self.parent.update_stats()
-
-                            # 如果是考勤模式，设置当前考勤用户
-                            if self.parent.is_attendance_running and display_name != "无该人像":
-                                self.parent.set_current_attendance_user(display_name)
-
-                            return
-
-                        # 计算稳定性
-                        if len(history) >= self.config.get('min_stable_frames', 2):
-                            name_counts = defaultdict(int)
-                            total_confidence = 0
-                            for name, conf in history:
-                                name_counts[name] += 1
-                                total_confidence += conf
-
-                            # 找出最频繁的识别结果
-                            most_common_name = max(name_counts.keys(), key=lambda k: name_counts[k])
-                            stability = name_counts[most_common_name] / len(history)
-
-                            # 优化：提高稳定性判断标准
-                            if stability > self.config.get('recognition_stability_threshold', 0.3):
-                                self.parent.stable_recognition[face_id] = {
-                                    'name': most_common_name,
-                                    'confidence': total_confidence / len(history),
-                                    'stability': stability
-                                }
-
-                                # 应用结果固定 - 优化：更容易固定结果
-                                if self.parent.fix_result_control.isChecked():
-                                    if stability > self.config.get('recognition_fix_threshold', 0.6):
-                                        if face_id not in self.parent.fixed_recognition:
-                                            # 保存完整的用户信息到固定结果中
-                                            self.parent.fixed_recognition[face_id] = {
-                                                'name': most_common_name,
-                                                'confidence': total_confidence / len(history),
-                                                'age': age,
-                                                'gender': gender,
-                                                'department': department,
-                                                'fixed_at': datetime.now()
-                                            }
-                                            self.parent.update_log(
-                                                f"识别结果已固定: {most_common_name} (稳定性: {stability:.2f})")
-
-                                    # 使用固定的结果
-                                    display_name = self.parent.fixed_recognition[face_id]['name']
-                                    display_confidence = self.parent.fixed_recognition[face_id]['confidence']
-                                    stability_text = f"固定 ({stability:.2f})"
-                                    fixed_text = "状态: 已固定"
-                                    fixed_color = "green"
-                                else:
-                                    stability_text = f"稳定 ({stability:.2f})"
-                                    fixed_text = "状态: 稳定"
-                                    fixed_color = "blue"
-                            else:
-                                stability_text = f"不稳定 ({stability:.2f})"
-                                fixed_text = "状态: 实时"
-                                fixed_color = "blue"
-                        else:
-                            stability_text = f"收集数据 ({len(history)}/{self.config.get('min_stable_frames', 2)})"
-                            fixed_text = "状态: 实时"
-                            fixed_color = "blue"
-                    else:
-                        stability_text = "未启用"
-                        fixed_text = "状态: 实时"
-                        fixed_color = "blue"
-
-                    # 更新界面显示
-                    self.parent.result_label.setText(f"识别结果: <b>{display_name}</b>")
-                    self.parent.confidence_label.setText(f"置信度: {display_confidence:.3f}")
-                    self.parent.stability_label.setText(f"稳定性: {stability_text}")
-                    self.parent.fixed_label.setText(fixed_text)
-                    self.parent.fixed_label.setStyleSheet(f"font-size: 14px; color: {fixed_color};")
-
-                    # 其他属性使用模拟数据
-                    emotion = random.choice(["happy", "neutral", "sad", "angry", "surprised"])
-                    mask = random.choice(["wearing", "not wearing"])
-
-                    # 显示年龄、性别和部门信息
-                    if age and gender:
-                        age_text = f"{age}岁"
-                        gender_text = gender
-                        dept_text = f" | 部门: {department}" if department else ""
-                        self.parent.age_gender_label.setText(f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                    else:
-                        self.parent.age_gender_label.setText("年龄/性别: -")
-
-                    self.parent.emotion_label.setText(f"情绪: {emotion}" if emotion else "情绪: -")
-                    self.parent.mask_label.setText(f"口罩: {mask}" if mask else "口罩: -")
-
-                    # 记录识别历史
-                    if display_name != "unknown" and display_name != "无该人像" and fixed_text != "状态: 已固定":
-                        self.parent.recognition_history.append({
-                            'name': display_name,
-                            'confidence': display_confidence,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                        self.parent.total_recognitions += 1
-                        self.parent.update_stats()
-
-                        # 如果是考勤模式，设置当前考勤用户
-                        if self.parent.is_attendance_running and display_name != "无该人像":
-                            self.parent.set_current_attendance_user(display_name)
-
-                    # 添加识别日志到数据库
-                    if hasattr(self.parent.database, 'add_recognition_log') and display_name != "无该人像":
-                        self.parent.database.add_recognition_log(
-                            display_name, display_confidence, age, gender, emotion, mask, "camera"
-                        )
-                else:
-                    # 只有人脸检测功能
-                    self.parent.result_label.setText("检测到人脸")
-                    self.parent.confidence_label.setText("置信度: -")
-                    self.parent.stability_label.setText("稳定性: -")
-                    self.parent.fixed_label.setText("状态: 检测模式")
-                    self.parent.fixed_label.setStyleSheet("font-size: 14px; color: orange;")
-                    self.parent.age_gender_label.setText("年龄/性别: -")
-                    self.parent.emotion_label.setText("情绪: -")
-                    self.parent.mask_label.setText("口罩: -")
-            else:
-                # 修复问题1：优化人脸丢失处理，减少误清除
-                # 未检测到人脸时，延迟清除固定结果，提高稳定性
-                face_id = 0
-                if face_id in self.parent.fixed_recognition:
-                    # 检查固定结果是否是暂停时固定的
-                    fixed_result = self.parent.fixed_recognition[face_id]
-                    if fixed_result.get('paused', False):
-                        # 如果是暂停时固定的结果，保持不变
-                        self.parent.result_label.setText(f"识别结果: <b>{fixed_result['name']}</b>")
-                        self.parent.confidence_label.setText(f"置信度: {fixed_result['confidence']:.3f}")
-                        self.parent.stability_label.setText("稳定性: 固定")
-                        self.parent.fixed_label.setText("状态: 已暂停")
-                        self.parent.fixed_label.setStyleSheet("font-size: 14px; color: orange;")
-
-                        # 使用固定结果中的完整用户信息
-                        if fixed_result.get('age') and fixed_result.get('gender'):
-                            age_text = f"{fixed_result['age']}岁"
-                            gender_text = fixed_result['gender']
-                            dept_text = f" | 部门: {fixed_result['department']}" if fixed_result.get(
-                                'department') else ""
-                            self.parent.age_gender_label.setText(f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                        else:
-                            # 如果固定结果中没有用户信息，从数据库获取
-                            display_name = fixed_result['name']
-                            if display_name in self.parent.face_database:
-                                user_info = self.parent.face_database[display_name].get('info', {})
-                                age = user_info.get('age', '')
-                                gender = user_info.get('gender', '')
-                                department = user_info.get('department', '')
-                                age_text = f"{age}岁" if age and age.isdigit() else ""
-                                gender_text = gender if gender else ""
-                                dept_text = f" | 部门: {department}" if department else ""
-                                if age_text and gender_text:
-                                    self.parent.age_gender_label.setText(
-                                        f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-
-                        # 其他属性保持不变
-                        self.parent.emotion_label.setText("情绪: - (暂停状态)")
-                        self.parent.mask_label.setText("口罩: - (暂停状态)")
-                        return
-
-                    # 如果不是暂停固定的结果，延迟清除
-                    fixed_name = fixed_result['name']
-                    fixed_time = fixed_result.get('fixed_at', datetime.now())
-                    time_since_fixed = (datetime.now() - fixed_time).total_seconds()
-
-                    # 固定结果保持3秒后再清除，提高稳定性
-                    if time_since_fixed < 3:
-                        self.parent.result_label.setText(f"识别结果: <b>{fixed_name}</b>")
-                        self.parent.confidence_label.setText(f"置信度: {fixed_result['confidence']:.3f}")
-                        self.parent.stability_label.setText("稳定性: 固定")
-                        self.parent.fixed_label.setText("状态: 已固定")
-                        self.parent.fixed_label.setStyleSheet("font-size: 14px; color: green;")
-
-                        # 显示固定的年龄、性别和部门信息
-                        if fixed_result.get('age') and fixed_result.get('gender'):
-                            age_text = f"{fixed_result['age']}岁"
-                            gender_text = fixed_result['gender']
-                            dept_text = f" | 部门: {fixed_result['department']}" if fixed_result.get(
-                                'department') else ""
-                            self.parent.age_gender_label.setText(f"年龄/性别: {age_text}/{gender_text}{dept_text}")
-                        return
-
-                    # 超过3秒未检测到人脸，清除固定结果
-                    self.parent.update_log(f"人脸丢失超过3秒，清除固定结果: {fixed_name}")
-                    del self.parent.fixed_recognition[face_id]
-
-                # 未检测到人脸
-                self.parent.result_label.setText("未检测到人脸")
-                self.parent.confidence_label.setText("置信度: -")
-                self.parent.stability_label.setText("稳定性: -")
-                self.parent.fixed_label.setText("状态: 实时")
-                self.parent.fixed_label.setStyleSheet("font-size: 14px; color: blue;")
-                self.parent.age_gender_label.setText("年龄/性别: -")
-                self.parent.emotion_label.setText("情绪: -")
-                self.parent.mask_label.setText("口罩: -")
+                                f"识别结果已固定: {most_common_name} (稳定性: {stability:.2f}, 轨迹 {track_id})")
+
+                    if track_id in self.parent.fixed_recognition:
+                        # 使用固定的结果
+                        display_name = self.parent.fixed_recognition[track_id]['name']
+                        display_confidence = self.parent.fixed_recognition[track_id]['confidence']
+                        return self.live_display(display_name, display_confidence, age, gender, department,
+                                                 f"固定 ({stability:.2f})", "状态: 已固定", "green")
+                    return self.live_display(display_name, display_confidence, age, gender, department,
+                                             f"稳定 ({stability:.2f})", "状态: 稳定", "blue")
+                return self.live_display(display_name, display_confidence, age, gender, department,
+                                         f"稳定 ({stability:.2f})", "状态: 稳定", "blue")
+            return self.live_display(display_name, display_confidence, age, gender, department,
+                                     f"不稳定 ({stability:.2f})", "状态: 实时", "blue")
+        return self.live_display(display_name, display_confidence, age, gender, department,
+                                 f"收集数据 ({len(history)}/{self.config.get('min_stable_frames', 2)})",
+                                 "状态: 实时", "blue")
+
+    def fixed_display(self, track_id, now):
+        """已固定轨迹的界面显示内容（每帧记录一次识别历史）"""
+        fixed_data = self.parent.fixed_recognition[track_id]
+        fixed_data['last_seen'] = now
+        age, gender, department = fixed_data.get('age'), fixed_data.get('gender'), fixed_data.get('department')
+        if not (age and gender):
+            # 如果固定结果中没有用户信息，从数据库获取
+            age, gender, department = self.user_attributes(fixed_data['name'])
+
+        # 记录识别历史
+        if fixed_data['name'] != "unknown" and fixed_data['name'] != "无该人像":
+            self.record_recognition(fixed_data['name'], fixed_data['confidence'])
+
+        return {
+            'name': fixed_data['name'],
+            'confidence': fixed_data['confidence'],
+            'stability_text': "固定",
+            'fixed_text': "状态: 已固定",
+            'fixed_color': "green",
+            'age': age,
+            'gender': gender,
+            'department': department,
+            # 其他属性保持不变
+            'emotion_text': "情绪: - (固定状态)",
+            'mask_text': "口罩: - (固定状态)"
+        }
+
+    def low_quality_display(self, track_id, face, now):
+        """本帧人脸质量不足、未计算特征：不参与投票，已固定的轨迹仍显示固定结果"""
+        if track_id in self.parent.fixed_recognition:
+            return self.fixed_display(track_id, now)
+        return {
+            'name': "人脸质量不足",
+            'confidence': 0.0,
+            'stability_text': f"质量 {face['quality']:.2f}" if face.get('quality') is not None else "-",
+            'fixed_text': "状态: 实时",
+            'fixed_color': "orange",
+            'age': None,
+            'gender': None,
+            'department': None,
+            'emotion_text': "情绪: -",
+            'mask_text': "口罩: -"
+        }
+
+    def live_attributes(self, display_name):
+        """实时识别结果的 (年龄, 性别, 部门)；数据库中缺少年龄或性别时使用随机值"""
+        if display_name == "无该人像" or display_name not in self.parent.face_database:
+            return None, None, None
+        user_info = self.parent.face_database[display_name].get('info', {})
+        age = user_info.get('age', '')
+        gender = user_info.get('gender', '')
+        department = user_info.get('department', '')
+
+        # 如果数据库中没有年龄或性别，使用随机值作为 fallback
+        if not age or not age.isdigit():
+            age = random.randint(18, 60)
+        else:
+            age = int(age)
+
+        if not gender:
+            gender = random.choice(["男", "女"])
+        return age, gender, department
+
+    def live_display(self, display_name, display_confidence, age, gender, department,
+                     stability_text, fixed_text, fixed_color):
+        """未固定（或刚由投票固定）的识别结果：记录历史和识别日志，返回界面显示内容"""
+        # 其他属性使用模拟数据
+        emotion = random.choice(["happy", "neutral", "sad", "angry", "surprised"])
+        mask = random.choice(["wearing", "not wearing"])
+
+        # 记录识别历史
+        if display_name != "unknown" and display_name != "无该人像" and fixed_text != "状态: 已固定":
+            self.record_recognition(display_name, display_confidence)
+
+        # 添加识别日志到数据库
+        if hasattr(self.parent.database, 'add_recognition_log') and display_name != "无该人像":
+            self.parent.database.add_recognition_log(
+                display_name, display_confidence, age, gender, emotion, mask, "camera"
+            )
+
+        return {
+            'name': display_name,
+            'confidence': display_confidence,
+            'stability_text': stability_text,
+            'fixed_text': fixed_text,
+            'fixed_color': fixed_color,
+            'age': age,
+            'gender': gender,
+            'department': department,
+            'emotion_text': f"情绪: {emotion}" if emotion else "情绪: -",
+            'mask_text': f"口罩: {mask}" if mask else "口罩: -"
+        }
+
+    def show_track_result(self, display):
+        """在结果标签中显示一条轨迹的识别结果"""
+        self.parent.result_label.setText(f"识别结果: <b>{display['name']}</b>")
+        self.parent.confidence_label.setText(f"置信度: {display['confidence']:.3f}")
+        self.parent.stability_label.setText(f"稳定性: {display['stability_text']}")
+        self.parent.fixed_label.setText(display['fixed_text'])
+        self.parent.fixed_label.setStyleSheet(f"font-size: 14px; color: {display['fixed_color']};")
+
+        # 显示年龄、性别和部门信息
+        if display.get('age') and display.get('gender'):
+            dept_text = f" | 部门: {display['department']}" if display.get('department') else ""
+            self.parent.age_gender_label.setText(f"年龄/性别: {display['age']}岁/{display['gender']}{dept_text}")
+        else:
+            self.parent.age_gender_label.setText("年龄/性别: -")
+        if 'emotion_text' in display:
+            self.parent.emotion_label.setText(display['emotion_text'])
+            self.parent.mask_label.setText(display['mask_text'])
+
+    def expire_tracks(self, seen, now):
+        """清理已离开画面的轨迹：投票历史立即清除，固定结果在最后出现3秒后清除（暂停时固定的结果保留）"""
+        for track_id in list(self.parent.recognition_results):
+            if track_id not in seen:
+                del self.parent.recognition_results[track_id]
+                self.parent.stable_recognition.pop(track_id, None)
+        for track_id, fixed_result in list(self.parent.fixed_recognition.items()):
+            if track_id in seen or fixed_result.get('paused', False):
+                continue
+            last_seen = fixed_result.get('last_seen', fixed_result.get('fixed_at', now))
+            if (now - last_seen).total_seconds() >= 3:
+                self.parent.update_log(f"人脸丢失超过3秒，清除固定结果: {fixed_result['name']}")
+                del self.parent.fixed_recognition[track_id]
+
+    def show_face_lost(self, now):
+        """画面中没有人脸：显示暂停时固定或最近3秒内仍保留的固定结果，否则显示未检测到人脸"""
+        # 修复问题1：优化人脸丢失处理，减少误清除
+        if self.parent.fixed_recognition:
+            fixed_result = max(self.parent.fixed_recognition.values(),
+                               key=lambda item: item.get('last_seen', item.get('fixed_at', now)))
+            age, gender, department = fixed_result.get('age'), fixed_result.get('gender'), \
+                fixed_result.get('department')
+            if not (age and gender):
+                age, gender, department = self.user_attributes(fixed_result['name'])
+            paused = fixed_result.get('paused', False)
+            self.show_track_result({
+                'name': fixed_result['name'],
+                'confidence': fixed_result['confidence'],
+                'stability_text': "固定",
+                'fixed_text': "状态: 已暂停" if paused else "状态: 已固定",
+                'fixed_color': "orange" if paused else "green",
+                'age': age,
+                'gender': gender,
+                'department': department,
+                'emotion_text': "情绪: - (暂停状态)" if paused else "情绪: -",
+                'mask_text': "口罩: - (暂停状态)" if paused else "口罩: -"
+            })
+            return
 
-        except Exception as e:
-            self.parent.update_log(f"人脸识别过程中发生错误: {str(e)}")
-            self.parent.result_label.setText(f"识别错误: {str(e)[:20]}...")
+        # 未检测到人脸
+        self.parent.result_label.setText("未检测到人脸")
+        self.clear_result_labels()
 
     def perform_checkout_recognition(self):
         """执行签退人脸识别（修复需求3）"""
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+多路摄像头（多个出入口闸机）
+每路视频源（设备序号、视频文件或 RTSP 地址）一个采集线程、一个最新帧队列、各自的流水线统计和人脸跟踪器；
+所有摄像头共用一个识别线程、同一套检测器/特征点预测器/ResNet 模型和同一个特征库索引。
+
+识别线程每轮从各路队列取走最新帧（没有新帧的摄像头本轮跳过），一次 analyze_frames 调用完成
+各路的检测/跟踪，所有摄像头中需要计算的人脸合并为一次批量特征计算，再按各自位置匹配特征库。
+dlib 模型不能被多个线程同时调用且推理不释放 GIL，单个推理线程跨摄像头批量比每路一个推理线程吞吐更高；
+按轮次调度，帧率高的摄像头不会占满推理时间。
+
+摄像头列表来自配置 attendance_cameras：
+
+    [{"id": "东门", "source": 1, "location": "东门闸机"},
+     {"id": "西门", "source": "rtsp://192.168.1.20/stream"},
+     {"id": "回放", "source": "records/gate.mp4", "loop": true}]
+
+id 缺省为位置或 "摄像头N"，location 缺省为 id（用于分片特征库路由和签到地点），
+source 可以直接写设备序号或地址；视频文件按文件帧率回放。
+"""
+
+import time
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from face_tracker import FaceTracker
+from frame_pipeline import PipelineStats, LatestFrameQueue, CaptureThread
+
+
+def parse_source(source):
+    """配置中的视频源：数字（或数字字符串）为设备序号，其余为文件路径或流地址"""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source.strip())
+    return source
+
+
+def is_file_source(source):
+    return isinstance(source, str) and '://' not in source
+
+
+def camera_sources(config, default_source=None):
+    """摄像头列表 [{'id', 'source', 'location', 'loop'}, ...]；未配置时使用 default_source 一路"""
+    entries = config.get('attendance_cameras', []) or []
+    if not entries and default_source is not None:
+        entries = [{'id': '考勤摄像头', 'source': default_source}]
+    sources = []
+    used_ids = set()
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            entry = {'source': entry}
+        camera_id = str(entry.get('id') or entry.get('location') or f"摄像头{i + 1}")
+        if camera_id in used_ids:
+            camera_id = f"{camera_id}-{i + 1}"
+        used_ids.add(camera_id)
+        sources.append({
+            'id': camera_id,
+            'source': parse_source(entry.get('source', i)),
+            'location': entry.get('location') or camera_id,
+            'loop': bool(entry.get('loop', False))
+        })
+    return sources
+
+
+class CameraChannel:
+    """一路摄像头：采集线程 -> 最新帧队列，跟踪器只在共用的识别线程中使用"""
+
+    def __init__(self, camera_id, source, location, queue_size=1, loop=False, ready_event=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.location = location
+        self.loop = loop
+        self.stats = PipelineStats(camera_id)
+        self.frame_queue = LatestFrameQueue(queue_size, self.stats, ready_event)
+        self.capture_thread = None
+        self.tracker = None
+        self.latest_result = None  # 最新一帧识别结果（界面线程绘制预览使用）
+        self.last_preview_id = 0
+
+    def start(self, on_failed=None):
+        file_source = is_file_source(self.source)
+        self.capture_thread = CaptureThread(self.source, self.frame_queue, realtime=file_source,
+                                            loop=self.loop and file_source)
+        if on_failed is not None:
+            self.capture_thread.capture_failed.connect(lambda message: on_failed(self, message))
+        self.capture_thread.start()
+
+    def stop(self):
+        self.frame_queue.close()
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
+            self.capture_thread = None
+
+    def snapshot(self):
+        stats = self.stats.snapshot()
+        stats['location'] = self.location
+        if self.tracker is not None:
+            stats.update(self.tracker.counters())
+        return stats
+
+
+class MultiCameraWorker(QThread):
+    """多路摄像头共用的识别线程
+
+    各路队列有新帧时置位共用的 frames_ready 事件，识别线程阻塞等待该事件，空闲时不轮询。
+
+    results_ready 发出的结果字典（每路每帧一次）:
+        {'camera', 'location', 'frame_id', 'frame_size': (宽, 高), 'captured_at', 'finished_at', 'faces'}
+    """
+
+    results_ready = pyqtSignal(object)
+    analysis_failed = pyqtSignal(str)
+
+    def __init__(self, channels, analyze_frames, frames_ready, parent=None):
+        super().__init__(parent)
+        self.channels = channels
+        self.analyze_frames = analyze_frames  # [(帧, 位置, 跟踪器), ...] -> [人脸结果列表, ...]
+        self.frames_ready = frames_ready  # 各路队列共用的新帧事件
+        self.running = False
+
+    def run(self):
+        self.running = True
+        while self.running:
+            # 先清除事件再取帧：取帧之后到达的新帧会重新置位，不会漏掉
+            if not self.frames_ready.wait(0.5):
+                continue
+            self.frames_ready.clear()
+            items = []
+            for channel in self.channels:
+                item = channel.frame_queue.take(timeout=0)
+                if item is not None:
+                    items.append((channel, item))
+            if not items:
+                continue
+            try:
+                results = self.analyze_frames([(frame, channel.location, channel.tracker)
+                                               for channel, (_, frame, _) in items])
+            except Exception as e:
+                self.analysis_failed.emit(str(e))
+                continue
+            finished_at = time.monotonic()
+            for (channel, (frame_id, frame, captured_at)), faces in zip(items, results):
+                channel.stats.record_result(captured_at, finished_at)
+                self.results_ready.emit({
+                    'camera': channel.camera_id,
+                    'location': channel.location,
+                    'frame_id': frame_id,
+                    'frame_size': (frame.shape[1], frame.shape[0]),
+                    'captured_at': captured_at,
+                    'finished_at': finished_at,
+                    'faces': faces
+                })
+
+    def stop(self, wait_ms=5000):
+        self.running = False
+        self.frames_ready.set()
+        self.wait(wait_ms)
+
+
+class MultiCameraSystem:
+    """多路摄像头：N 个采集线程 + 1 个共用识别线程"""
+
+    def __init__(self, config, sources):
+        self.config = config
+        self.frames_ready = threading.Event()  # 任一路有新帧时置位，唤醒共用识别线程
+        self.channels = [CameraChannel(item['id'], item['source'], item['location'],
+                                       config.get('frame_queue_size', 1), item.get('loop', False),
+                                       self.frames_ready)
+                         for item in sources]
+        self.worker = None
+
+    def channel(self, camera_id):
+        for channel in self.channels:
+            if channel.camera_id == camera_id:
+                return channel
+        return None
+
+    def start(self, models, on_results, on_failed=None, on_error=None):
+        """启动各路采集线程和共用识别线程；models 缺少检测器时只采集预览"""
+        for channel in self.channels:
+            # 每路一个跟踪器，检测间隔等参数可以按位置单独配置（camera_tracking）
+            channel.tracker = FaceTracker.from_config(self.config, models.detector, channel.location) \
+                if models.detector else None
+            channel.start(on_failed)
+        if models.detector is None:
+            return
+        self.worker = MultiCameraWorker(self.channels, models.analyze_frames, self.frames_ready)
+        self.worker.results_ready.connect(on_results)
+        if on_error is not None:
+            self.worker.analysis_failed.connect(on_error)
+        self.worker.start()
+
+    def stop(self):
+        for channel in self.channels:
+            channel.frame_queue.close()
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        for channel in self.channels:
+            channel.stop()
+
+    def snapshot(self):
+        """各路统计 {摄像头: 统计}"""
+        return {channel.camera_id: channel.snapshot() for channel in self.channels}
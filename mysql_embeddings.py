@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL 人脸特征二进制存储
+users 表新增两列：
+    face_embedding   BLOB         float32 原始字节（128 x 4 = 512 字节）
+    embedding_model  VARCHAR(64)  生成特征的模型标记，不同模型的特征不能互相比较
+
+旧的 face_encoding TEXT 列（逗号分隔的浮点数）通过 migrate_text_encodings 一次性转换。
+加载时使用服务端游标流式读取，直接写入预先分配的 numpy 矩阵。
+日志通过 log(消息) 回调输出（界面中为 update_log），缺省时打印到控制台。
+"""
+
+import numpy as np
+
+EMBEDDING_DIM = 128
+EMBEDDING_MODEL = 'dlib_resnet_v1'  # dlib_face_recognition_resnet_model_v1（face_recognition 库使用同一模型）
+
+
+def encode_embedding(embedding):
+    """特征向量 -> float32 原始字节"""
+    return np.asarray(embedding, dtype='<f4').reshape(EMBEDDING_DIM).tobytes()
+
+
+def decode_embedding(blob):
+    """float32 原始字节 -> 特征向量"""
+    return np.frombuffer(blob, dtype='<f4', count=EMBEDDING_DIM)
+
+
+def _column_names(cursor):
+    cursor.execute("DESCRIBE users")
+    columns = []
+    for column in cursor.fetchall():
+        # pymysql DictCursor 返回字典，其他游标返回元组
+        columns.append(column['Field'] if isinstance(column, dict) else column[0])
+    return columns
+
+
+def ensure_embedding_columns(conn):
+    """为 users 表添加二进制特征列（已存在时跳过）"""
+    cursor = conn.cursor()
+    columns = _column_names(cursor)
+    if 'face_embedding' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN face_embedding BLOB NULL COMMENT '人脸特征(float32字节)'")
+    if 'embedding_model' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN embedding_model VARCHAR(64) NULL COMMENT '特征模型标记'")
+    conn.commit()
+    cursor.close()
+
+
+def migrate_text_encodings(conn, model=EMBEDDING_MODEL, batch_size=1000, log=print):
+    """把旧的 face_encoding 文本转换为二进制特征，按主键分批处理，返回转换的行数"""
+    cursor = conn.cursor()
+    migrated = 0
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, face_encoding FROM users
+            WHERE id > %s AND face_encoding IS NOT NULL AND face_embedding IS NULL
+            ORDER BY id LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            user_id, text = (row['id'], row['face_encoding']) if isinstance(row, dict) else row
+            last_id = user_id
+            try:
+                embedding = np.array(text.split(','), dtype=np.float32)
+                updates.append((encode_embedding(embedding), model, user_id))
+            except ValueError as e:
+                log(f"用户 {user_id} 特征文本解析失败，跳过迁移: {str(e)}")
+        if updates:
+            cursor.executemany("UPDATE users SET face_embedding = %s, embedding_model = %s WHERE id = %s", updates)
+            conn.commit()
+            migrated += len(updates)
+    cursor.close()
+    return migrated
+
+
+def _streaming_cursor(conn):
+    """服务端游标：结果逐批从服务器读取，不在客户端缓存整个结果集"""
+    try:
+        import pymysql
+        if isinstance(conn, pymysql.connections.Connection):
+            return conn.cursor(pymysql.cursors.SSCursor)
+    except ImportError:
+        pass
+    # mysql.connector 默认游标即为非缓冲游标
+    return conn.cursor()
+
+
+def load_embeddings(conn, key_column='id', model=EMBEDDING_MODEL, where="", params=(), fetch_size=5000, log=print):
+    """一次流式查询加载所有二进制特征，返回 (键列表, float32 特征矩阵 (N, 128))
+
+    先用 COUNT(*) 预分配矩阵，再用服务端游标分批读取，逐行把字节拷贝进矩阵；
+    加载期间新增的行超出预分配大小时按倍数扩容。
+    """
+    condition = "face_embedding IS NOT NULL AND embedding_model = %s" + (f" AND {where}" if where else "")
+    args = (model,) + tuple(params)
+
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) AS total FROM users WHERE {condition}", args)
+    row = cursor.fetchone()
+    cursor.close()
+    total = row['total'] if isinstance(row, dict) else row[0]
+
+    matrix = np.empty((total, EMBEDDING_DIM), dtype=np.float32)
+    keys = []
+    cursor = _streaming_cursor(conn)
+    try:
+        cursor.execute(f"SELECT {key_column}, face_embedding FROM users WHERE {condition}", args)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for key, blob in rows:
+                if len(blob) != EMBEDDING_DIM * 4:
+                    log(f"用户 {key} 的二进制特征长度异常: {len(blob)}")
+                    continue
+                if len(keys) == matrix.shape[0]:
+                    grown = np.empty((max(2 * matrix.shape[0], 1024), EMBEDDING_DIM), dtype=np.float32)
+                    grown[:len(keys)] = matrix[:len(keys)]
+                    matrix = grown
+                matrix[len(keys)] = decode_embedding(blob)
+                keys.append(key)
+    finally:
+        cursor.close()
+    return keys, matrix[:len(keys)]
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+人脸照片目录清单
+face_images/<姓名>/ 下每个文件记录 (大小, 修改时间, 内容哈希, 是否缩略图)，持久化为 JSON。
+
+刷新时只列出根目录一次，并比较每个用户目录的 mtime：目录内新增、删除、重命名文件都会改变目录 mtime，
+mtime 未变的目录直接使用清单，不再重新列目录；变化目录中大小和修改时间都未变的文件沿用已有哈希，
+只对新增或修改的文件读取内容计算哈希。
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_VERSION = 1
+
+
+def is_thumb_file(file_name):
+    return file_name.endswith('_thumb.jpg')
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """文件内容的 SHA-1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PhotoManifest:
+    """照片目录清单（增量刷新，线程安全）"""
+
+    def __init__(self, root, manifest_file, compute_hash=True):
+        self.root = root
+        self.manifest_file = manifest_file
+        self.compute_hash = compute_hash
+        self.lock = threading.RLock()
+        self.directories = {}  # 姓名 -> {'mtime_ns': int, 'files': {文件名: {'size', 'mtime_ns', 'hash', 'is_thumb'}}}
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def from_config(cls, config):
+        database_path = config.get('database_path', 'face_database')
+        return cls(os.path.join(database_path, 'face_images'),
+                   os.path.join(database_path, config.get('photo_manifest_file', 'photo_manifest.json')),
+                   compute_hash=config.get('photo_manifest_hash', True))
+
+    def load(self):
+        """读取持久化的清单；文件不存在或损坏时从空清单开始（下次刷新会重新列出所有目录）"""
+        with self.lock:
+            self.directories = {}
+            if not os.path.exists(self.manifest_file):
+                return
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.directories = data.get('directories', {})
+            except (OSError, ValueError):
+                self.directories = {}
+
+    def save(self):
+        """清单有变化时写入（先写临时文件再替换，避免中断后留下半个文件）"""
+        with self.lock:
+            if not self.dirty:
+                return False
+            os.makedirs(os.path.dirname(self.manifest_file) or '.', exist_ok=True)
+            temp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'directories': self.directories},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_file, self.manifest_file)
+            self.dirty = False
+            return True
+
+    def refresh(self):
+        """增量刷新整个照片目录，返回 (重新列出的目录数, 重新计算哈希的文件数)"""
+        with self.lock:
+            rescanned = hashed = 0
+            seen = set()
+            if os.path.isdir(self.root):
+                with os.scandir(self.root) as user_entries:
+                    for user_entry in user_entries:
+                        if not user_entry.is_dir():
+                            continue
+                        seen.add(user_entry.name)
+                        mtime_ns = user_entry.stat().st_mtime_ns
+                        cached = self.directories.get(user_entry.name)
+                        if cached is not None and cached['mtime_ns'] == mtime_ns:
+                            continue
+                        hashed += self._scan_directory(user_entry.name, user_entry.path, mtime_ns)
+                        rescanned += 1
+            for name in set(self.directories) - seen:
+                del self.directories[name]
+                self.dirty = True
+            return rescanned, hashed
+
+    def refresh_directory(self, name, force=True):
+        """重新列出单个用户目录，返回计算哈希的文件数
+
+        force=True 时无条件重新列出（本程序刚写入或删除过照片时调用，不依赖 mtime 精度）；
+        force=False 时只在目录 mtime 变化或尚未记录时重新列出。
+        """
+        with self.lock:
+            path = os.path.join(self.root, name)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.forget(name)
+                return 0
+            cached = self.directories.get(name)
+            if not force and cached is not None and cached['mtime_ns'] == mtime_ns:
+                return 0
+            return self._scan_directory(name, path, mtime_ns)
+
+    def forget(self, name):
+        """用户目录已删除"""
+        with self.lock:
+            if self.directories.pop(name, None) is not None:
+                self.dirty = True
+
+    def _scan_directory(self, name, path, mtime_ns):
+        """列出一个用户目录，大小和修改时间未变的文件沿用已有记录，返回计算哈希的文件数"""
+        old_files = self.directories.get(name, {}).get('files', {})
+        files = {}
+        hashed = 0
+        with os.scandir(path) as photo_entries:
+            for entry in photo_entries:
+                if not entry.name.endswith('.jpg') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                old = old_files.get(entry.name)
+                if old is not None and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                    files[entry.name] = old
+                    continue
+                content_hash = None
+                if self.compute_hash:
+                    try:
+                        content_hash = file_hash(entry.path)
+                        hashed += 1
+                    except OSError:
+                        pass
+                files[entry.name] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'hash': content_hash,
+                    'is_thumb': is_thumb_file(entry.name)
+                }
+        self.directories[name] = {'mtime_ns': mtime_ns, 'files': files}
+        self.dirty = True
+        return hashed
+
+    def names(self):
+        with self.lock:
+            return list(self.directories)
+
+    def photos(self, name):
+        """用户的照片路径（不含缩略图），按文件名排序"""
+        with self.lock:
+            files = self.directories.get(name, {}).get('files', {})
+            return [os.path.join(self.root, name, file_name)
+                    for file_name in sorted(files) if not files[file_name]['is_thumb']]
+
+    def photo_count(self, name):
+        with self.lock:
+            files = self.directories.get(name, {}).get('files', {})
+            return sum(1 for record in files.values() if not record['is_thumb'])
+
+    def entries(self, name):
+        """用户目录的完整清单 {文件名: 记录}"""
+        with self.lock:
+            return dict(self.directories.get(name, {}).get('files', {}))
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置：项目模块位于仓库根目录（非安装包），测试时加入 sys.path"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""人脸质量评分：尺寸、清晰度、亮度与特征点姿态"""
+
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+
+from face_quality import FaceQuality  # noqa: E402
+
+
+class Shape:
+    """68 点特征点替身：只提供 part(i).x / .y"""
+
+    def __init__(self, points):
+        self.points = points
+
+    def part(self, i):
+        x, y = self.points.get(i, (0, 0))
+        return SimpleNamespace(x=x, y=y)
+
+
+def frontal_shape(nose_x=100, roll=0.0):
+    """两眼在 y=100 附近、间距约 60 像素；nose_x 控制鼻尖偏移，roll 为两眼连线倾角"""
+    dx, dy = math.cos(roll), math.sin(roll)
+
+    def at(offset):
+        return (70 + offset * dx, 100 + offset * dy)
+
+    return Shape({36: at(0), 39: at(20), 42: at(40), 45: at(60), 30: (nose_x, 130)})
+
+
+def textured(size=120, mean=128, amplitude=60, seed=0):
+    rng = np.random.default_rng(seed)
+    image = mean + rng.uniform(-amplitude, amplitude, (size, size, 3))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def quality():
+    return FaceQuality(min_face_size=100, blur_reference=100.0, min_score=0.4)
+
+
+def test_sharp_well_lit_face_scores_high(quality):
+    total, scores = quality.pre_score(textured(), (0, 0, 119, 119))
+    assert scores == {'size': 1.0, 'blur': 1.0, 'brightness': 1.0}
+    assert total == pytest.approx(1.0)
+    assert quality.accept(total)
+
+
+def test_blur_lowers_score(quality):
+    frame = textured()
+    sharp = quality.pre_score(frame, (0, 0, 119, 119))[1]['blur']
+    blurred = quality.pre_score(cv2.GaussianBlur(frame, (0, 0), 6), (0, 0, 119, 119))[1]['blur']
+    assert blurred < 0.2 < sharp
+
+
+def test_brightness(quality):
+    box = (0, 0, 119, 119)
+    assert quality.pre_score(np.full((120, 120, 3), 30, np.uint8), box)[1]['brightness'] == pytest.approx(0.5)
+    assert quality.pre_score(np.full((120, 120, 3), 240, np.uint8), box)[1]['brightness'] == pytest.approx(15 / 65)
+
+
+def test_small_face(quality):
+    total, scores = quality.pre_score(textured(), (10, 10, 60, 40))
+    assert scores['size'] == pytest.approx(0.3)
+    assert total < 1.0
+
+
+def test_box_outside_frame(quality):
+    total, scores = quality.pre_score(textured(), (200, 200, 300, 300))
+    assert total == 0.0 and scores['blur'] == 0.0
+
+
+def test_grayscale_frame(quality):
+    total, _ = quality.pre_score(textured()[:, :, 0], (0, 0, 119, 119))
+    assert total > 0.9
+
+
+def test_landmark_pose():
+    assert FaceQuality.landmark_pose(frontal_shape()) == pytest.approx(1.0)
+    # 鼻尖偏离中点 15 像素（两眼中心间距 40），偏航比例 0.375
+    assert FaceQuality.landmark_pose(frontal_shape(nose_x=115)) == pytest.approx(0.25)
+    assert FaceQuality.landmark_pose(frontal_shape(nose_x=130)) == 0.0
+    assert FaceQuality.landmark_pose(frontal_shape(roll=math.pi / 8)) < 0.6
+    assert FaceQuality.landmark_pose(Shape({})) == 0.0
+
+
+def test_with_pose(quality):
+    _, scores = quality.pre_score(textured(), (0, 0, 119, 119))
+    total, combined = quality.with_pose(scores, frontal_shape(nose_x=130))
+    assert combined['pose'] == 0.0 and 'pose' not in scores
+    assert not quality.accept(total)
+
+
+def test_from_config():
+    quality = FaceQuality.from_config({'min_face_size': 80, 'face_quality_min_score': 0.6})
+    assert quality.min_face_size == 80 and quality.min_score == 0.6 and quality.blur_reference == 100.0
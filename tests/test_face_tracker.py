@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""先跟踪后检测：检测间隔、跟踪ID保持、ROI 重新检测与特征缓存"""
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+dlib = pytest.importorskip('dlib')
+
+from face_tracker import FaceTrack, FaceTracker, box_iou, clip_box, tracking_config  # noqa: E402
+
+
+class SquareDetector:
+    """把灰度图中的亮色方块当作人脸的检测器，记录每次调用的输入尺寸"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, image):
+        self.calls.append(image.shape[:2])
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        count, _, stats, _ = cv2.connectedComponentsWithStats((gray > 128).astype(np.uint8))
+        rects = []
+        for left, top, width, height, area in stats[1:count]:
+            if width >= 8 and height >= 8:
+                rects.append(dlib.rectangle(int(left), int(top), int(left + width - 1), int(top + height - 1)))
+        return rects
+
+
+def frame_with(*squares, size=(240, 320)):
+    frame = np.zeros(size + (3,), dtype=np.uint8)
+    for left, top, side in squares:
+        frame[top:top + side, left:left + side] = 255
+    return frame
+
+
+@pytest.fixture
+def detector():
+    return SquareDetector()
+
+
+def test_track_ids_persist_across_detections(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=1)
+    tracks, detected = tracker.update(frame_with((20, 20, 60), (200, 100, 60)))
+    assert detected and [t.track_id for t in tracks] == [1, 2]
+    # 两张人脸都移动了几个像素，IOU 仍高于 match_iou，沿用原 ID
+    tracks, _ = tracker.update(frame_with((25, 22, 60), (195, 104, 60)))
+    assert {t.track_id: t.box[:2] for t in tracks} == {1: (25, 22), 2: (195, 104)}
+    # 一张人脸离开，新的人脸出现
+    tracks, _ = tracker.update(frame_with((28, 24, 60), (120, 150, 50)))
+    assert sorted(t.track_id for t in tracks) == [1, 3]
+
+
+def test_detect_interval_schedule(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=3)
+    schedule = []
+    for step in range(7):
+        schedule.append(tracker.update(frame_with((20 + step * 4, 40, 60)))[1])
+    assert schedule == [True, False, False, True, False, False, True]
+    assert tracker.counters()['detections'] == 3 and tracker.counters()['tracked_frames'] == 7
+
+
+def test_roi_tracking_follows_face(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=10, roi_expand=0.5)
+    tracker.update(frame_with((100, 80, 60)))
+    detector.calls.clear()
+    tracks, detected = tracker.update(frame_with((110, 86, 60)))
+    assert not detected
+    assert [t.track_id for t in tracks] == [1]
+    assert tracks[0].box == (110, 86, 169, 145)
+    assert tracks[0].confidence > 0.5
+    # 只在外扩后的 ROI（约 2 倍人脸框）内检测，而不是整帧
+    assert detector.calls == [(119, 119)]
+
+
+def test_roi_downscales_large_faces(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=10, roi_expand=0.25, roi_face_size=50)
+    tracker.update(frame_with((60, 40, 150), size=(300, 320)))
+    tracks, _ = tracker.update(frame_with((64, 40, 150), size=(300, 320)))
+    height, width = detector.calls[-1]
+    assert width < 150
+    left, top, right, bottom = tracks[0].box
+    assert abs(left - 64) <= 3 and abs(right - 213) <= 3 and abs(top - 40) <= 3
+
+
+def test_lost_face_forces_detection(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=10)
+    tracker.update(frame_with((100, 80, 60)))
+    tracks, detected = tracker.update(frame_with())
+    assert not detected and tracks == []
+    assert tracker.force_detection
+    tracks, detected = tracker.update(frame_with((100, 80, 60)))
+    assert detected and [t.track_id for t in tracks] == [2]
+
+
+def test_correlation_tracking(detector):
+    tracker = FaceTracker(detector, method='correlation', detect_interval=10, min_confidence=0.0)
+    frame = frame_with((100, 80, 60))
+    tracker.update(frame)
+    tracks, detected = tracker.update(frame)
+    assert not detected and len(tracks) == 1
+    left, top, right, bottom = tracks[0].box
+    assert abs(left - 100) <= 5 and abs(top - 80) <= 5
+    assert tracks[0].confidence is not None
+
+
+def test_low_confidence_forces_detection(detector):
+    tracker = FaceTracker(detector, method='correlation', detect_interval=10, min_confidence=float('inf'))
+    frame = frame_with((100, 80, 60))
+    tracker.update(frame)
+    assert not tracker.update(frame)[1]
+    assert tracker.update(frame)[1]
+
+
+def test_reset(detector):
+    tracker = FaceTracker(detector, method='roi', detect_interval=10)
+    tracker.update(frame_with((100, 80, 60)))
+    tracker.reset()
+    tracks, detected = tracker.update(frame_with((100, 80, 60)))
+    assert detected and tracks[0].track_id == 2
+
+
+def test_needs_descriptor():
+    track = FaceTrack(1, (0, 0, 10, 10))
+    assert track.needs_descriptor(0.5, now=0.0, refresh_interval=2.0, quality_gain=0.2)
+    track.store_descriptor(np.zeros(128), {'name': 'a'}, 0.5, now=10.0)
+    assert not track.needs_descriptor(0.55, now=11.0, refresh_interval=2.0, quality_gain=0.2)
+    assert track.needs_descriptor(0.65, now=11.0, refresh_interval=2.0, quality_gain=0.2)
+    assert track.needs_descriptor(0.5, now=12.0, refresh_interval=2.0, quality_gain=0.2)
+
+
+def test_tracking_config_overrides():
+    config = {'track_method': 'correlation', 'track_detect_interval': 5,
+              'camera_tracking': {1: {'track_detect_interval': 2, 'track_method': 'roi', 'unrelated': 1}}}
+    assert tracking_config(config)['track_detect_interval'] == 5
+    params = tracking_config(config, 1)
+    assert params['track_detect_interval'] == 2 and params['track_method'] == 'roi' and 'unrelated' not in params
+    assert tracking_config(config, 0)['track_method'] == 'correlation'
+    tracker = FaceTracker.from_config(config, None, camera_id=1)
+    assert (tracker.method, tracker.detect_interval, tracker.roi_expand, tracker.min_confidence) == \
+        ('roi', 2, 0.5, 7.0)
+
+
+def test_box_helpers():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(50 / 150)
+    assert box_iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+    assert clip_box((-5.4, 3.6, 400, 50), 320, 240) == (0, 4, 319, 50)
+    assert clip_box((330, 0, 400, 50), 320, 240) is None
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""二进制特征库：基础文件读写、追加日志重放、崩溃截断恢复、压缩与后台同步"""
+
+import os
+import csv
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from feature_store import FeatureStore, FeatureJournal, apply_journal_records, convert_legacy_features
+
+
+def rows(count, seed=0, dim=128):
+    return np.random.default_rng(seed).normal(0.0, 0.1, (count, dim)).astype(np.float32)
+
+
+def grouped(names, matrix):
+    """按姓名分组，便于与期望结果比较（行顺序不影响检索）"""
+    result = {}
+    for name, row in zip(names, np.asarray(matrix)):
+        result.setdefault(name, []).append(row)
+    return {name: np.stack(items) for name, items in result.items()}
+
+
+def assert_grouped_equal(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for name in expected:
+        np.testing.assert_array_equal(actual[name], expected[name])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FeatureStore(str(tmp_path / 'feature_store'), sync_batch=1000, sync_interval=60.0)
+    yield store
+    store.close()
+
+
+def reopen(store):
+    store.close()
+    return FeatureStore(store.path, sync_batch=1000, sync_interval=60.0)
+
+
+class TestBaseFile:
+
+    def test_save_load_round_trip(self, store):
+        matrix = rows(5)
+        header = store.save(['a', 'a', 'b', 'c', 'c'], ['t'] * 5, matrix, source='test')
+        assert header['count'] == 5 and header['generation'] == 1
+        # 新实例从磁盘读取，结果与写入的一致
+        names, timestamps, loaded = FeatureStore(store.path).load()
+        assert names == ['a', 'a', 'b', 'c', 'c'] and timestamps == ['t'] * 5
+        assert isinstance(loaded, np.memmap)
+        np.testing.assert_array_equal(loaded, matrix)
+
+    def test_new_generation_removes_old_files(self, store):
+        store.save(['a'], ['t'], rows(1))
+        store.save(['b'], ['t'], rows(1, seed=1))
+        store.save([], [], np.empty((0, 128), dtype=np.float32))
+        assert sorted(os.listdir(store.path)) == ['header.json', 'names.3.json']
+        names, _, matrix = store.load()
+        assert names == [] and matrix.shape == (0, 128)
+
+    def test_mismatched_lengths(self, store):
+        with pytest.raises(ValueError):
+            store.save(['a', 'b'], ['t'], rows(2))
+
+    def test_wrong_dimension(self, store):
+        store.save(['a'], ['t'], rows(1))
+        with pytest.raises(ValueError):
+            FeatureStore(store.path, dim=64).read_header()
+
+    def test_convert_legacy_features(self, tmp_path):
+        csv_rows = rows(2)
+        csv_file = tmp_path / 'face_features.csv'
+        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'timestamp'] + [f'feature_{i}' for i in range(128)])
+            writer.writerow(['a', 't1'] + [repr(float(v)) for v in csv_rows[0]])
+            writer.writerow(['a', 't2'] + [repr(float(v)) for v in csv_rows[1]])
+            writer.writerow(['short', 't3', '0.1'])
+        json_file = tmp_path / 'face_features.json'
+        json_rows = rows(2, seed=5)
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({'a': {'features': [json_rows[0].tolist()]},
+                       'b': {'features': [json_rows[1].tolist()], 'info': {'created_at': 'c'}}}, f)
+
+        store = FeatureStore(str(tmp_path / 'store'))
+        assert convert_legacy_features(store, str(csv_file), str(json_file)) == 3
+        names, timestamps, matrix = store.load()
+        assert names == ['a', 'a', 'b'] and timestamps == ['t1', 't2', 'c']
+        np.testing.assert_array_equal(matrix[:2], csv_rows)
+        np.testing.assert_allclose(matrix[2], json_rows[1])
+        assert store.read_header()['source'] == 'face_features.csv+face_features.json'
+
+
+class TestJournal:
+
+    def test_append_and_replay(self, store):
+        base = rows(4)
+        store.save(['a', 'a', 'b', 'c'], ['t0'] * 4, base)
+        store.snapshot()
+        added = rows(2, seed=1)
+        replaced = rows(3, seed=2)
+        store.append_add('a', added)
+        store.append_add('d', added[:1], timestamps=['t1'])
+        store.append_replace('b', replaced)
+        store.append_remove('c')
+
+        expected = {'a': np.concatenate([base[:2], added]), 'b': replaced, 'd': added[:1]}
+        names, timestamps, matrix = store.snapshot()
+        assert_grouped_equal(grouped(names, matrix), expected)
+        assert timestamps[names.index('d')] == 't1'
+
+        # 重新打开后重放日志尾部，得到同样的结果
+        store = reopen(store)
+        names, _, matrix = store.snapshot()
+        assert_grouped_equal(grouped(names, matrix), expected)
+        assert store.journal.last_seq == 5
+        store.close()
+
+    def test_append_requires_open_journal(self, store):
+        with pytest.raises(RuntimeError):
+            store.append_remove('a')
+
+    def test_readonly_snapshot(self, store):
+        store.open_journal()
+        store.append_add('a', rows(1))
+        store.sync()
+        reader = FeatureStore(store.path)
+        names, _, _ = reader.snapshot(open_journal=False)
+        assert names == ['a']
+        assert reader.journal.handle is None
+
+    @pytest.mark.parametrize('tail', [b'{"seq": 3, "op": "add", "name": "x", "feat', b'not json at all\n'])
+    def test_truncated_tail_is_ignored_and_cut(self, store, tail):
+        """崩溃时写了一半的记录被忽略，并在打开时截掉，之后追加的记录仍可读"""
+        store.open_journal()
+        first = rows(1, seed=1)
+        store.append_add('a', first)
+        store.append_add('b', rows(1, seed=2))
+        store.close()
+        with open(store.journal.path, 'ab') as f:
+            f.write(tail)
+        valid_size = len(open(store.journal.path, 'rb').read()) - len(tail)
+
+        store = FeatureStore(store.path)
+        names, _, matrix = store.snapshot()
+        assert names == ['a', 'b']
+        with open(store.journal.path, 'rb') as f:
+            assert len(f.read()) == valid_size
+
+        later = rows(1, seed=3)
+        assert store.append_add('c', later) == 3
+        store = reopen(store)
+        names, _, matrix = store.snapshot()
+        assert names == ['a', 'b', 'c']
+        np.testing.assert_array_equal(matrix[0], first[0])
+        np.testing.assert_array_equal(matrix[2], later[0])
+        store.close()
+
+    def test_journal_decode_round_trip(self, tmp_path):
+        journal = FeatureJournal(str(tmp_path / 'journal.log'))
+        features = rows(2)
+        record = journal.decode(journal.encode({'seq': 1, 'op': 'add', 'name': '张三', 'features': features}))
+        assert record['name'] == '张三'
+        np.testing.assert_array_equal(record['features'], features)
+
+    def test_sync_batch(self, tmp_path):
+        store = FeatureStore(str(tmp_path), sync_batch=2, sync_interval=60.0)
+        store.open_journal()
+        store.append_remove('a')
+        assert store.journal.pending == 1
+        store.append_remove('b')
+        assert store.journal.pending == 0
+        store.close()
+
+
+class TestCompaction:
+
+    def test_compact_merges_journal(self, store):
+        base = rows(3)
+        store.save(['a', 'b', 'c'], ['t'] * 3, base)
+        store.snapshot()
+        added = rows(2, seed=1)
+        store.append_add('d', added)
+        store.append_remove('b')
+        assert store.compact() == 2
+        assert store.compact() == 0
+
+        header = store.read_header()
+        assert header['generation'] == 2 and header['journal_seq'] == 2 and header['count'] == 4
+        assert store.journal.tail_records == 0
+        assert open(store.journal.path, 'rb').read() == b''
+        names, _, matrix = store.load()
+        assert_grouped_equal(grouped(names, matrix), {'a': base[:1], 'c': base[2:], 'd': added})
+
+        # 压缩后继续追加，序号延续，重新打开只重放新记录
+        store.append_remove('a')
+        assert store.journal.last_seq == 3
+        store = reopen(store)
+        names, _, matrix = store.snapshot()
+        assert sorted(set(names)) == ['c', 'd']
+        store.close()
+
+    def test_crash_between_commit_and_truncate(self, store):
+        """header 已记录 journal_seq 但日志未截断：重放时跳过已合并的记录，不会重复追加"""
+        store.open_journal()
+        store.append_add('a', rows(1))
+        store.append_add('a', rows(1, seed=1))
+        store.sync()
+        names, timestamps, matrix = store.snapshot(open_journal=False)
+        store.save(names, timestamps, matrix, journal_seq=2)
+
+        store = reopen(store)
+        names, _, matrix = store.snapshot()
+        assert names == ['a', 'a']
+        assert store.append_remove('a') == 3
+        store.close()
+
+    def test_compact_keeps_records_appended_during_merge(self, store):
+        store.open_journal()
+        store.append_add('a', rows(1))
+        original = store.journal.truncate_through
+
+        def append_then_truncate(seq):
+            # 模拟合并期间其他线程追加的记录
+            store.append_add('late', rows(1, seed=1))
+            original(seq)
+
+        store.journal.truncate_through = append_then_truncate
+        store.compact()
+        assert store.journal.tail_records == 1
+        names, _, _ = store.snapshot()
+        assert names == ['a', 'late']
+
+
+class TestBackground:
+
+    def test_failures_back_off_and_recover(self, tmp_path):
+        store = FeatureStore(str(tmp_path), sync_interval=0.01)
+        store.open_journal()
+        messages = []
+        recovered = threading.Event()
+        attempts = []
+
+        def flaky_sync():
+            attempts.append(1)
+            if len(attempts) <= 2:
+                raise OSError('磁盘已满')
+
+        def on_error(message):
+            messages.append(message)
+            if '已恢复' in message:
+                recovered.set()
+
+        delays = []
+        wait = store._stop_event.wait
+
+        def recording_wait(timeout):
+            delays.append(timeout)
+            return wait(timeout)
+
+        store.journal.sync = flaky_sync
+        store._stop_event.wait = recording_wait
+        store.start_background(on_error=on_error)
+        assert recovered.wait(5.0)
+        store._stop_event.set()
+        store._worker.join()
+        store._worker = None
+
+        # 正常周期 -> 失败后按倍数退避 -> 恢复后回到正常周期
+        assert delays[:4] == [0.01, 0.02, 0.04, 0.01]
+        assert '第1次' in messages[0]
+        assert '第2次' in messages[1] and '磁盘已满' in messages[1]
+        assert '连续失败2次' in messages[2]
+        assert store.failures == 0 and store.last_error is None
+        del store.journal.sync, store._stop_event.wait
+        store.close()
+
+    def test_background_compacts_long_tail(self, tmp_path):
+        store = FeatureStore(str(tmp_path), sync_interval=0.01, compact_records=3)
+        store.snapshot()
+        store.start_background()
+        for i in range(3):
+            store.append_add(f'p{i}', rows(1, seed=i))
+        for _ in range(500):
+            if store.exists() and store.base_journal_seq() == 3:
+                break
+            threading.Event().wait(0.01)
+        store.close()
+        assert store.read_header()['count'] == 3
+
+
+class TestHelpers:
+
+    def test_apply_journal_records_order(self):
+        base = rows(2)
+        a1, a2 = rows(1, seed=1), rows(1, seed=2)
+        records = [
+            {'op': 'add', 'name': 'x', 'timestamps': ['1'], 'features': a1},
+            {'op': 'remove', 'name': 'x'},
+            {'op': 'add', 'name': 'x', 'timestamps': ['2'], 'features': a2},
+            {'op': 'remove', 'name': 'a'},
+        ]
+        names, timestamps, matrix = apply_journal_records(['a', 'b'], ['0', '0'], base, records)
+        assert names == ['b', 'x'] and timestamps == ['0', '2']
+        np.testing.assert_array_equal(matrix, np.concatenate([base[1:], a2]))
+
+    def test_apply_to_empty(self):
+        names, _, matrix = apply_journal_records([], [], np.empty((0, 128), np.float32),
+                                                 [{'op': 'remove', 'name': 'a'}])
+        assert names == [] and matrix.shape == (0, 128)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""采集/识别流水线：最新帧优先队列、统计与识别线程的批量处理"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('dlib')
+pytest.importorskip('PyQt5.QtMultimedia')
+
+from frame_pipeline import LatestFrameQueue, PipelineStats, RecognitionWorker, bgr_to_rgb  # noqa: E402
+
+
+def frame(value=0):
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+
+class TestLatestFrameQueue:
+
+    def test_single_slot_keeps_newest(self):
+        stats = PipelineStats(0)
+        queue = LatestFrameQueue(capacity=1, stats=stats)
+        for value in range(3):
+            queue.put(frame(value))
+        frame_id, item, _ = queue.take(timeout=0)
+        assert frame_id == 3 and item[0, 0, 0] == 2
+        assert stats.snapshot()['dropped'] == 2 and stats.snapshot()['captured'] == 3
+
+    def test_take_discards_older_frames(self):
+        stats = PipelineStats(0)
+        queue = LatestFrameQueue(capacity=4, stats=stats)
+        for value in range(3):
+            queue.put(frame(value))
+        assert queue.take(timeout=0)[0] == 3
+        assert stats.dropped == 2
+        assert queue.take(timeout=0) is None
+
+    def test_take_batch(self):
+        stats = PipelineStats(0)
+        queue = LatestFrameQueue(capacity=4, stats=stats)
+        for value in range(6):
+            queue.put(frame(value))
+        assert stats.dropped == 2
+        items = queue.take_batch(max_items=3, timeout=0)
+        assert [frame_id for frame_id, _, _ in items] == [4, 5, 6]
+        assert stats.dropped == 3
+        assert queue.take_batch(timeout=0) == []
+
+    def test_latest_is_not_consumed(self):
+        queue = LatestFrameQueue()
+        assert queue.latest() == (0, None)
+        queue.put(frame(7))
+        queue.take(timeout=0)
+        frame_id, item = queue.latest()
+        assert frame_id == 1 and item[0, 0, 0] == 7
+
+    def test_take_waits_for_producer(self):
+        queue = LatestFrameQueue()
+        timer = threading.Timer(0.05, queue.put, args=(frame(1),))
+        timer.start()
+        item = queue.take(timeout=2.0)
+        timer.join()
+        assert item is not None and item[0] == 1
+
+    def test_timeout(self):
+        queue = LatestFrameQueue()
+        start = time.monotonic()
+        assert queue.take(timeout=0.05) is None
+        assert time.monotonic() - start >= 0.04
+
+    def test_close_wakes_waiters(self):
+        queue = LatestFrameQueue()
+        queue.put(frame())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(queue.take_batch(timeout=5.0)))
+        queue.take(timeout=0)
+        waiter.start()
+        queue.close()
+        waiter.join(2.0)
+        assert results == [[]]
+        queue.put(frame())
+        assert queue.take(timeout=0) is None
+
+    def test_shared_ready_event(self):
+        ready = threading.Event()
+        first = LatestFrameQueue(ready_event=ready)
+        second = LatestFrameQueue(ready_event=ready)
+        first.put(frame())
+        assert ready.is_set()
+        ready.clear()
+        second.put(frame())
+        assert ready.is_set()
+        ready.clear()
+        first.close()
+        assert ready.is_set()
+
+
+class TestPipelineStats:
+
+    def test_snapshot(self):
+        stats = PipelineStats('cam')
+        assert stats.snapshot()['lag_ms_avg'] is None and stats.snapshot()['drop_rate'] == 0.0
+        for i in range(11):
+            stats.record_capture(i * 0.1)
+            stats.record_result(i * 0.1, i * 0.1 + 0.02)
+        stats.record_drop(11)
+        snapshot = stats.snapshot()
+        assert snapshot['camera'] == 'cam' and snapshot['drop_rate'] == 1.0
+        assert snapshot['capture_fps'] == pytest.approx(10.0)
+        assert snapshot['process_fps'] == pytest.approx(10.0)
+        assert snapshot['lag_ms_avg'] == pytest.approx(20.0)
+        assert snapshot['lag_ms_max'] == pytest.approx(20.0)
+
+    def test_window(self):
+        stats = PipelineStats(0, window=3)
+        for i in range(5):
+            stats.record_result(0.0, float(i))
+        assert list(stats.lags) == [2.0, 3.0, 4.0]
+
+
+class TestRecognitionWorker:
+    """直接在测试线程中调用 run()：信号同线程直接投递，分析函数处理完后停止循环"""
+
+    def test_batch_results_in_capture_order(self):
+        stats = PipelineStats(0)
+        queue = LatestFrameQueue(capacity=4, stats=stats)
+        for value in range(3):
+            queue.put(frame(value))
+        batches = []
+
+        def analyze_batch(frames):
+            batches.append([f[0, 0, 0] for f in frames])
+            worker.running = False
+            return [[{'name': str(f[0, 0, 0])}] for f in frames]
+
+        worker = RecognitionWorker(queue, analyze=None, analyze_batch=analyze_batch, batch_size=4)
+        results = []
+        worker.results_ready.connect(results.append)
+        worker.run()
+        assert batches == [[0, 1, 2]]
+        assert [r['frame_id'] for r in results] == [1, 2, 3]
+        assert results[0]['frame_size'] == (6, 4) and results[2]['faces'] == [{'name': '2'}]
+        assert stats.processed == 3
+
+    def test_single_frame_and_failure(self):
+        queue = LatestFrameQueue()
+        queue.put(frame(1))
+        errors = []
+
+        def analyze(rgb):
+            worker.running = False
+            raise RuntimeError('检测失败')
+
+        worker = RecognitionWorker(queue, analyze=analyze)
+        worker.analysis_failed.connect(errors.append)
+        worker.run()
+        assert errors == ['检测失败']
+
+
+def test_bgr_to_rgb():
+    bgr = np.zeros((2, 3, 3), dtype=np.uint8)
+    bgr[..., 0] = 255
+    rgb = bgr_to_rgb(bgr[:, ::-1])
+    assert rgb.flags['C_CONTIGUOUS'] and (rgb[..., 2] == 255).all() and (rgb[..., 0] == 0).all()
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""特征库索引：穷举/IVF/量化/两级匹配检索、批量检索、阈值匹配、增量更新与压缩、全精度映射文件清理"""
+
+import os
+
+import numpy as np
+import pytest
+
+from gallery import FaceGalleryIndex, ivf_recall_report, sweep_exact_tier_files
+from gallery_shards import ShardedGallery
+
+
+def clustered_identities(count, templates=3, seed=0):
+    """每人一个随机中心，模板为中心加小噪声，返回 (face_database, 中心矩阵, 姓名列表)
+
+    中心各维标准差 0.1、噪声 0.01：不同人约相距 1.6，同一人模板约相距 0.16，与 dlib 特征的 0.4 阈值同量级。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, 0.1, (count, 128)).astype(np.float32)
+    names = [f"user{i:04d}" for i in range(count)]
+    face_database = {name: {'features': list(center + rng.normal(0.0, 0.01, (templates, 128)).astype(np.float32)),
+                            'images': [], 'info': {}}
+                     for name, center in zip(names, centers)}
+    return face_database, centers, names
+
+
+def jitter(vectors, noise=0.01, seed=1):
+    """模拟同一人的新采集"""
+    rng = np.random.default_rng(seed)
+    return (vectors + rng.normal(0.0, noise, vectors.shape)).astype(np.float32)
+
+
+def top_names(results):
+    return [name for name, _ in results]
+
+
+def assert_same_results(results, expected):
+    """姓名顺序一致，距离在 float32 累加误差范围内一致"""
+    assert top_names(results) == top_names(expected)
+    np.testing.assert_allclose([d for _, d in results], [d for _, d in expected], rtol=1e-5, atol=1e-5)
+
+
+@pytest.fixture
+def identities():
+    return clustered_identities(200)
+
+
+def brute_force_top(face_database, probe, k=1):
+    """逐人计算最小欧氏距离，作为检索结果的参照"""
+    best = []
+    for name, data in face_database.items():
+        features = np.asarray(data['features'], dtype=np.float64)
+        if len(features):
+            best.append((name, float(np.sqrt(((features - probe) ** 2).sum(axis=1)).min())))
+    best.sort(key=lambda item: item[1])
+    return best[:k]
+
+
+class TestExactSearch:
+
+    def test_matches_brute_force(self, identities):
+        face_database, centers, _ = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        assert len(gallery) == 600
+        assert gallery.identity_count == 200
+        for probe in jitter(centers[:20], noise=0.05):
+            expected = brute_force_top(face_database, probe, k=3)
+            results = gallery.search(probe, k=3)
+            assert top_names(results) == top_names(expected)
+            np.testing.assert_allclose([d for _, d in results], [d for _, d in expected], rtol=1e-4, atol=1e-5)
+
+    def test_results_are_unique_identities(self, identities):
+        face_database, centers, _ = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        names = top_names(gallery.search(centers[0], k=10))
+        assert len(names) == len(set(names)) == 10
+
+    def test_match_threshold(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        name, distance = gallery.match(centers[3], threshold=0.4)
+        assert name == names[3] and distance < 0.4
+        name, distance = gallery.match(centers[3] + 1.0, threshold=0.4)
+        assert name is None and distance > 0.4
+
+    def test_build_from_arrays_equals_build(self):
+        rows = np.eye(4, 128, dtype=np.float32)
+        gallery = FaceGalleryIndex().build_from_arrays(['a', 'b', 'a', 'c'], rows)
+        assert gallery.identity_count == 3 and len(gallery) == 4
+        assert gallery.search(rows[2], k=1) == [('a', pytest.approx(0.0, abs=1e-6))]
+        assert gallery.search(rows[3], k=3)[0][0] == 'c'
+
+    def test_empty_gallery(self):
+        gallery = FaceGalleryIndex().build({})
+        assert gallery.search(np.zeros(128)) == []
+        assert gallery.match(np.zeros(128), 0.4) == (None, None)
+
+    def test_skips_wrong_dimension(self):
+        gallery = FaceGalleryIndex().build({'a': {'features': [np.zeros(128), np.zeros(64)]}})
+        assert len(gallery) == 1
+
+
+class TestIVF:
+
+    def build(self, count=2000, nlist=32, nprobe=8):
+        face_database, centers, names = clustered_identities(count, templates=2, seed=3)
+        gallery = FaceGalleryIndex(backend='ivf', ivf_nlist=nlist, ivf_nprobe=nprobe, ivf_min_templates=100)
+        return gallery.build(face_database), face_database, centers, names
+
+    def test_disabled_below_min_templates(self, identities):
+        face_database, _, _ = identities
+        gallery = FaceGalleryIndex(backend='ivf', ivf_min_templates=10000).build(face_database)
+        assert gallery.ivf is None
+
+    def test_recall_against_exact(self):
+        gallery, _, centers, _ = self.build()
+        probes = jitter(centers[::4], noise=0.02)
+        hits = 0
+        scanned = 0
+        for probe in probes:
+            exact = gallery.search(probe, k=1, exhaustive=True)
+            approximate = gallery.search(probe, k=1)
+            hits += top_names(exact) == top_names(approximate)
+            scanned += len(gallery.ivf.candidates(probe))
+        assert hits / len(probes) >= 0.95
+        # nprobe/nlist = 1/4；随机数据的簇大小不均，扫描比例放宽到 3/4
+        assert scanned / (len(probes) * len(gallery)) < 0.75
+
+    def test_full_probe_equals_exact(self):
+        gallery, _, centers, _ = self.build(count=500, nlist=16)
+        for probe in jitter(centers[:50], noise=0.05):
+            assert_same_results(gallery.search(probe, k=3, nprobe=16), gallery.search(probe, k=3, exhaustive=True))
+
+    def test_inverted_lists_cover_every_row(self):
+        gallery, _, _, _ = self.build(count=500, nlist=16)
+        rows = np.sort(np.concatenate(gallery.ivf.lists))
+        np.testing.assert_array_equal(rows, np.arange(gallery.size))
+
+    def test_added_rows_are_searchable(self):
+        gallery, _, _, _ = self.build(count=500, nlist=16)
+        vector = np.random.default_rng(9).normal(0.0, 0.1, 128).astype(np.float32)
+        gallery.add('newcomer', vector)
+        assert gallery.search(vector, k=1)[0][0] == 'newcomer'
+
+    def test_recall_report(self):
+        gallery, _, _, _ = self.build(count=500, nlist=16)
+        report = ivf_recall_report(gallery, [1, 16], probe_count=50)
+        assert [row['nprobe'] for row in report] == [1, 16]
+        assert report[1]['recall'] == 1.0
+        assert report[0]['scanned_ratio'] < report[1]['scanned_ratio']
+
+    def test_recall_report_samples_live_rows_only(self):
+        gallery, _, _, names = self.build(count=500, nlist=16)
+        for name in names[:400]:
+            gallery.remove(name)
+        _, live = gallery.live_rows()
+        probes = []
+        search = gallery.search
+
+        def recording_search(probe, k=1, **kwargs):
+            if kwargs.get('exhaustive'):
+                probes.append(probe)
+            return search(probe, k, **kwargs)
+
+        gallery.search = recording_search
+        ivf_recall_report(gallery, [4], probe_count=1000, noise=0.0)
+        # 无噪声时探针即为抽样的模板，且只能来自未删除的行
+        assert len(probes) == len(live) == 200
+        assert all(np.any(np.all(live == probe, axis=1)) for probe in probes)
+
+    def test_recall_report_rejects_sharded_gallery(self, identities):
+        gallery = ShardedGallery(lambda number: FaceGalleryIndex(backend='ivf', ivf_min_templates=0),
+                                 lambda name: '')
+        gallery.build(identities[0])
+        with pytest.raises(ValueError, match='分片'):
+            ivf_recall_report(gallery, [1])
+
+    def test_recall_report_requires_ivf(self, identities):
+        gallery = FaceGalleryIndex().build(identities[0])
+        with pytest.raises(ValueError):
+            ivf_recall_report(gallery, [1])
+
+
+class TestQuantizedStorage:
+
+    @pytest.mark.parametrize('storage', ['int8', 'float16'])
+    def test_top1_matches_float32(self, identities, storage):
+        face_database, centers, _ = identities
+        exact = FaceGalleryIndex().build(face_database)
+        quantized = FaceGalleryIndex(storage=storage, rerank_k=16).build(face_database)
+        for probe in jitter(centers, noise=0.03):
+            expected = exact.search(probe, k=1)
+            results = quantized.search(probe, k=1)
+            assert top_names(results) == top_names(expected)
+            # 候选行用全精度特征重排，距离与 float32 一致
+            assert results[0][1] == pytest.approx(expected[0][1], rel=1e-5)
+
+    def test_scan_tier_is_smaller(self, identities):
+        face_database, _, _ = identities
+        exact = FaceGalleryIndex().build(face_database).memory_usage()
+        int8 = FaceGalleryIndex(storage='int8').build(face_database).memory_usage()
+        assert int8['scan_tier'] < exact['scan_tier'] / 3
+
+    def test_updates_reach_quantized_tier(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(storage='int8').build(face_database)
+        gallery.remove(names[0])
+        assert names[0] not in top_names(gallery.search(centers[0], k=5))
+        gallery.add('extra', centers[0])
+        assert gallery.search(centers[0], k=1)[0][0] == 'extra'
+
+
+class TestExactTierFiles:
+
+    def config(self, tmp_path):
+        return {'database_path': str(tmp_path), 'gallery_storage': 'int8', 'gallery_exact_tier_on_disk': True}
+
+    def test_memory_mapped_tier_leaves_no_files(self, tmp_path, identities):
+        gallery = FaceGalleryIndex.from_config(self.config(tmp_path)).build(identities[0])
+        assert isinstance(gallery.matrix, np.memmap)
+        assert gallery.memory_usage()['exact_tier'] == 0
+        for i in range(300):
+            gallery.add(f'extra{i}', np.full((2, 128), i / 1000.0))  # 多次扩容，每次分配新的映射
+        assert gallery.search(np.full(128, 0.299), k=1)[0][0] == 'extra299'
+        if os.name != 'nt':
+            # 映射后立即删除文件名，进程崩溃也不会遗留文件
+            assert os.listdir(tmp_path) == []
+        gallery.close()
+        assert len(gallery) == 0
+        assert os.listdir(tmp_path) == []
+
+    def test_sweep_removes_files_of_dead_processes(self, tmp_path):
+        dead_pid = 2 ** 22 + 12345  # 超出 Linux pid_max，不会是存活进程
+        stale = [f'gallery_exact.{dead_pid}.1.npy', f'gallery_exact.s3.{dead_pid}.7.npy']
+        kept = [f'gallery_exact.{os.getpid()}.1.npy', 'gallery_exact.npy', 'other.1.2.npy']
+        for name in stale + kept:
+            (tmp_path / name).write_bytes(b'')
+        assert sweep_exact_tier_files({'database_path': str(tmp_path)}) == 2
+        assert sorted(os.listdir(tmp_path)) == sorted(kept)
+
+    def test_sweep_missing_directory(self, tmp_path):
+        assert sweep_exact_tier_files({'database_path': str(tmp_path / 'missing')}) == 0
+
+
+class TestIncrementalUpdates:
+
+    def test_add_new_identity_and_grow(self, identities):
+        face_database, _, _ = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        capacity = gallery.matrix.shape[0]
+        rng = np.random.default_rng(7)
+        added = {}
+        for i in range(100):
+            added[f'new{i}'] = rng.normal(0.0, 0.1, (2, 128)).astype(np.float32)
+            gallery.add(f'new{i}', added[f'new{i}'])
+        assert gallery.matrix.shape[0] > capacity
+        assert len(gallery) == 600 + 200
+        for name, vectors in added.items():
+            assert gallery.search(vectors[0], k=1)[0] == (name, pytest.approx(0.0, abs=1e-3))
+            np.testing.assert_array_equal(gallery.templates(name), vectors)
+
+    def test_add_templates_to_existing_identity(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        gallery.add(names[0], centers[0] + 0.001)
+        assert gallery.templates(names[0]).shape == (4, 128)
+        assert gallery.identity_count == 200
+
+    def test_remove_marks_tombstones(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(compaction_ratio=0.5).build(face_database)
+        assert gallery.remove(names[0])
+        assert not gallery.remove(names[0])
+        assert gallery.dead_rows == 3 and gallery.size == 600 and len(gallery) == 597
+        assert names[0] not in top_names(gallery.search(centers[0], k=10))
+        assert gallery.templates(names[0]).shape == (0, 128)
+
+    def test_replace_swaps_all_templates(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(compaction_ratio=0.5).build(face_database)
+        replacement = np.stack([centers[10] + 0.002, centers[10] - 0.002])
+        gallery.replace(names[0], replacement)
+        np.testing.assert_array_equal(gallery.templates(names[0]), replacement)
+        assert gallery.dead_rows == 3
+        assert names[0] not in top_names(gallery.search(centers[0], k=1))
+
+    def test_compaction_round_trip(self, identities):
+        """删除/替换后压缩，结果与用剩余数据重新构建的索引一致"""
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(compaction_ratio=0.24).build(face_database)
+        expected = {name: dict(data) for name, data in face_database.items()}
+        rng = np.random.default_rng(11)
+        for name in names[:40]:
+            gallery.remove(name)
+            del expected[name]
+        for name in names[40:50]:
+            rows = rng.normal(0.0, 0.1, (3, 128)).astype(np.float32)
+            gallery.replace(name, rows)
+            expected[name] = {'features': list(rows)}
+        assert gallery.dead_rows == 150 and gallery.size == 630
+
+        # 150/630 < 0.24，再删除一人后 153/630 > 0.24，触发压缩
+        gallery.remove(names[50])
+        del expected[names[50]]
+        assert gallery.dead_rows == 0
+        assert gallery.size == len(gallery) == 3 * len(expected)
+        assert sorted(n for n in gallery.names if n is not None) == sorted(expected)
+
+        rebuilt = FaceGalleryIndex().build(expected)
+        for probe in jitter(centers, noise=0.05):
+            assert top_names(gallery.search(probe, k=3)) == top_names(rebuilt.search(probe, k=3))
+
+    def test_live_rows(self, identities):
+        face_database, _, names = identities
+        gallery = FaceGalleryIndex(compaction_ratio=1.0).build(face_database)
+        gallery.remove(names[0])
+        row_names, matrix = gallery.live_rows()
+        assert len(row_names) == matrix.shape[0] == 597
+        assert names[0] not in row_names
+
+
+class TestCentroidMatching:
+
+    def test_top1_matches_exact(self, identities):
+        face_database, centers, _ = identities
+        exact = FaceGalleryIndex().build(face_database)
+        gallery = FaceGalleryIndex(backend='centroid', centroid_top_k=8).build(face_database)
+        for probe in jitter(centers, noise=0.03):
+            assert_same_results(gallery.search(probe, k=1), exact.search(probe, k=1))
+
+    def test_centroid_follows_updates(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(backend='centroid', centroid_top_k=4).build(face_database)
+        moved = centers[1] + 0.5
+        gallery.replace(names[0], [moved, moved])
+        assert gallery.search(moved, k=1)[0][0] == names[0]
+        np.testing.assert_allclose(gallery.centroids[gallery.name_to_id[names[0]]], moved, atol=1e-6)
+        gallery.remove(names[1])
+        assert names[1] not in top_names(gallery.search(centers[1], k=4))
+
+    def test_stale_snapshot_ignores_rows_added_later(self, identities):
+        """检索持有的快照之后追加的行（可能触发扩容）不能被用来索引快照中的旧矩阵"""
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex(backend='centroid', centroid_top_k=4).build(face_database)
+        state = gallery._snapshot()
+        rng = np.random.default_rng(5)
+        for name in names[:50]:
+            gallery.replace(name, centers[names.index(name)] + rng.normal(0.0, 0.01, (4, 128)))
+        for i in range(300):
+            gallery.add(f'late{i}', rng.normal(0.0, 0.1, (2, 128)))
+        assert gallery.matrix.shape[0] > state['matrix'].shape[0]
+
+        gallery._snapshot = lambda: state
+        results = gallery.search_batch(centers[:60], k=1)
+        assert all(len(items) <= 1 for items in results)
+        # 未变化的身份在旧快照中仍能找到
+        assert [items[0][0] for items in results[50:60]] == names[50:60]
+
+    def test_snapshot_names_are_copy_on_write(self, identities):
+        face_database, _, names = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        state = gallery._snapshot()
+        gallery.remove(names[0])
+        assert state['names'][0] == names[0]
+        assert gallery.names[0] is None
+
+
+class TestBatchSearch:
+
+    def test_batch_equals_single(self, identities):
+        face_database, centers, _ = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        probes = jitter(centers[:50])
+        # block_bytes 很小时按探针分块，结果不应受分块影响
+        batched = gallery.search_batch(probes, k=2, block_bytes=4 * 600 * 7)
+        for probe, results in zip(probes, batched):
+            assert_same_results(results, gallery.search(probe, k=2))
+
+    @pytest.mark.parametrize('backend', ['ivf', 'centroid'])
+    def test_batch_equals_single_other_backends(self, identities, backend):
+        gallery = FaceGalleryIndex(backend=backend, ivf_nlist=8, ivf_min_templates=0,
+                                   centroid_top_k=4).build(identities[0])
+        probes = jitter(identities[1][:30], noise=0.03)
+        for probe, results in zip(probes, gallery.search_batch(probes, k=1)):
+            assert_same_results(results, gallery.search(probe, k=1))
+
+    def test_match_batch(self, identities):
+        face_database, centers, names = identities
+        gallery = FaceGalleryIndex().build(face_database)
+        matches = gallery.match_batch(np.stack([centers[5], centers[3] + 1.0]), threshold=0.4)
+        assert matches[0][0] == names[5] and matches[1][0] is None
+        assert gallery.match_batch(np.empty((0, 128)), threshold=0.4) == []
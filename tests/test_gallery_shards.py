@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""分片特征库：按部门拆分、位置路由、未命中回退、跨分片迁移"""
+
+import numpy as np
+import pytest
+
+from gallery import FaceGalleryIndex
+from gallery_shards import ShardedGallery, create_gallery, DEFAULT_SHARD
+
+# 每个部门两人，空部门归入默认分片
+DEPARTMENTS = {'张三': '研发', '李四': '研发', '王五': '财务', '赵六': '财务',
+               '孙七': '行政', '周八': '行政', '吴九': '', '郑十': ''}
+NAMES = list(DEPARTMENTS)
+
+
+def face(index, offset=0.0):
+    """第 index 个人的特征：各人占一个坐标轴（相互距离约 1.41），offset 模拟同一人不同照片的差异"""
+    vector = np.zeros(128, dtype=np.float32)
+    vector[index] = 1.0
+    vector[64 + index] = offset
+    return vector
+
+
+@pytest.fixture
+def face_database():
+    return {name: {'features': [face(i), face(i, 0.05), face(i, -0.05)]} for i, name in enumerate(NAMES)}
+
+
+@pytest.fixture
+def departments():
+    return dict(DEPARTMENTS)
+
+
+@pytest.fixture
+def gallery(face_database, departments):
+    gallery = ShardedGallery(lambda number: FaceGalleryIndex(), departments.get,
+                             routes={'gate_rd': ['研发'], 'gate_fin': ['财务', '行政'], 'gate_none': ['不存在']})
+    return gallery.build(face_database)
+
+
+class TestBuild:
+
+    def test_split_by_key(self, gallery):
+        assert sorted(gallery.shards) == sorted(['研发', '财务', '行政', ''])
+        assert gallery.shard_sizes() == {key: (2, 6) for key in gallery.shards}
+        assert len(gallery) == 24 and gallery.identity_count == 8
+        assert gallery.memory_usage()['shards'] == {key: 6 for key in gallery.shards}
+
+    def test_rebuild_closes_dropped_shards(self, gallery, face_database):
+        dropped = gallery.shards['行政']
+        gallery.build({name: data for name, data in face_database.items() if DEPARTMENTS[name] != '行政'})
+        assert '行政' not in gallery.shards
+        assert len(dropped) == 0
+
+    def test_unrouted_search_matches_single_index(self, gallery, face_database):
+        single = FaceGalleryIndex().build(face_database)
+        # 单人探针比较第一名；混合探针的前三名分属三个分片且距离各不相同
+        probes = [(face(i, 0.02), 1) for i in range(len(NAMES))]
+        probes.append((0.6 * face(0) + 0.4 * face(2) + 0.2 * face(5), 3))
+        for probe, k in probes:
+            results = gallery.search(probe, k=k)
+            expected = single.search(probe, k=k)
+            assert [n for n, _ in results] == [n for n, _ in expected]
+            np.testing.assert_allclose([d for _, d in results], [d for _, d in expected], rtol=1e-5)
+
+    def test_live_rows_and_templates(self, gallery, face_database):
+        row_names, matrix = gallery.live_rows()
+        assert sorted(row_names) == sorted(NAMES * 3) and matrix.shape == (24, 128)
+        np.testing.assert_array_equal(gallery.templates('王五'), np.stack(face_database['王五']['features']))
+        assert gallery.templates('nobody').shape == (0, 128)
+
+
+class TestRouting:
+
+    def test_route(self, gallery):
+        assert gallery.route(None) is None
+        assert gallery.route('elsewhere') is None
+        assert gallery.route('gate_fin') == ['财务', '行政']
+        assert gallery.route('gate_none') == []
+
+    def test_routed_search_only_scans_local_shard(self, gallery):
+        # 财务部门的王五在研发闸机只能找到研发部门的人
+        results = gallery.search(face(2), k=3, location='gate_rd')
+        assert sorted(name for name, _ in results) == ['张三', '李四']
+
+    def test_fallback_when_local_shard_misses(self, gallery):
+        name, distance = gallery.match(face(2), threshold=0.4, location='gate_rd')
+        assert name == '王五' and distance < 0.4
+        assert gallery.match(face(0), threshold=0.4, location='gate_rd')[0] == '张三'
+
+    def test_no_fallback(self, gallery):
+        gallery.fallback = False
+        name, distance = gallery.match(face(2), threshold=0.4, location='gate_rd')
+        assert name is None and distance > 0.4
+        assert gallery.match(face(1), threshold=0.4, location='gate_rd')[0] == '李四'
+
+    def test_match_batch_mixed(self, gallery):
+        matches = gallery.match_batch(np.stack([face(3), face(0), face(40)]), threshold=0.4, location='gate_fin')
+        assert [name for name, _ in matches] == ['赵六', '张三', None]
+
+
+class TestUpdates:
+
+    def test_add_new_identity_to_its_shard(self, gallery, departments):
+        departments['新人'] = '财务'
+        gallery.add('新人', face(20))
+        assert gallery.name_to_shard['新人'] == '财务'
+        assert gallery.search(face(20), k=1, location='gate_fin')[0][0] == '新人'
+
+    def test_reassign_moves_templates(self, gallery, departments, face_database):
+        assert not gallery.reassign('王五')
+        departments['王五'] = '研发'
+        assert gallery.reassign('王五')
+        assert gallery.name_to_shard['王五'] == '研发'
+        assert gallery.shards['财务'].identity_count == 1
+        assert gallery.shards['研发'].identity_count == 3
+        np.testing.assert_array_equal(gallery.templates('王五'), np.stack(face_database['王五']['features']))
+        # 迁移后在新部门的闸机本地分片即可命中，旧部门闸机不再命中
+        gallery.fallback = False
+        assert gallery.match(face(2), threshold=0.4, location='gate_rd')[0] == '王五'
+        assert gallery.match(face(2), threshold=0.4, location='gate_fin')[0] is None
+
+    def test_reassign_last_identity_empties_shard(self, gallery, departments):
+        for name in ('孙七', '周八'):
+            departments[name] = '财务'
+            gallery.reassign(name)
+        assert gallery.shards['行政'].identity_count == 0
+        assert gallery.shards['财务'].identity_count == 4
+        assert gallery.identity_count == 8
+
+    def test_replace_with_changed_key_moves_shard(self, gallery, departments):
+        departments['孙七'] = DEFAULT_SHARD
+        gallery.replace('孙七', [face(4)])
+        assert gallery.name_to_shard['孙七'] == DEFAULT_SHARD
+        assert gallery.shards['行政'].identity_count == 1
+        assert gallery.templates('孙七').shape == (1, 128)
+
+    def test_remove(self, gallery):
+        assert gallery.remove('张三')
+        assert not gallery.remove('张三')
+        assert '张三' not in [n for n, _ in gallery.search(face(0), k=5)]
+        assert gallery.identity_count == 7
+
+    def test_close(self, gallery):
+        gallery.close()
+        assert len(gallery) == 0 and gallery.shards == {}
+
+    def test_single_index_reassign_is_noop(self, face_database):
+        assert FaceGalleryIndex().build(face_database).reassign('张三') is False
+
+
+class TestCreateGallery:
+
+    def test_single_index_without_shard_field(self):
+        assert isinstance(create_gallery({}), FaceGalleryIndex)
+        assert isinstance(create_gallery({'gallery_shard_field': 'department'}), FaceGalleryIndex)
+
+    def test_sharded_index(self, tmp_path):
+        info = {'a': {'department': '研发'}, 'b': {}}
+        config = {'gallery_shard_field': 'department', 'gallery_shard_routes': {'gate': ['研发']},
+                  'database_path': str(tmp_path)}
+        gallery = create_gallery(config, lambda name: info.get(name, {}))
+        assert isinstance(gallery, ShardedGallery)
+        gallery.build({'a': {'features': [np.zeros(128)]}, 'b': {'features': [np.ones(128)]}})
+        assert gallery.name_to_shard == {'a': '研发', 'b': DEFAULT_SHARD}
+        assert gallery.route('gate') == ['研发']
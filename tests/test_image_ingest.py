@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""统一图像读取：解码阶段缩小、EXIF 摆正、坐标换算"""
+
+import io
+
+import numpy as np
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from image_ingest import box_to_original, load_rgb, open_image  # noqa: E402
+
+
+def encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    rgb = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y[:, None], (height, width)),
+                    np.full((height, width), 128.0)], axis=2)
+    return Image.fromarray(rgb.astype(np.uint8), 'RGB')
+
+
+def test_full_size_decode():
+    rgb, scale = load_rgb(encode(gradient(320, 240), 'PNG'))
+    assert rgb.shape == (240, 320, 3) and rgb.dtype == np.uint8 and scale == 1.0
+    assert rgb.flags['C_CONTIGUOUS'] and rgb.flags['WRITEABLE']
+
+
+def test_jpeg_draft_scale():
+    rgb, scale = load_rgb(encode(gradient(1600, 1200), 'JPEG'), max_side=400)
+    # draft 按 1/2、1/4、1/8 缩小，结果落在 [max_side, 2 * max_side) 之间
+    assert 400 <= max(rgb.shape[:2]) < 800
+    assert scale == rgb.shape[1] / 1600
+
+
+def test_png_reduce():
+    rgb, scale = load_rgb(encode(gradient(1600, 1200), 'PNG'), max_side=400)
+    assert rgb.shape == (300, 400, 3) and scale == 0.25
+    rgb, scale = load_rgb(encode(gradient(1000, 500), 'PNG'), max_side=400)
+    assert rgb.shape == (250, 500, 3) and scale == 0.5
+
+
+def test_fit():
+    rgb, scale = load_rgb(encode(gradient(1000, 500), 'PNG'), max_side=400, fit=True)
+    assert rgb.shape == (200, 400, 3) and scale == 0.4
+
+
+def test_exif_transpose():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 需要顺时针旋转 90 度
+    data = encode(gradient(1600, 800), 'JPEG', exif=exif.tobytes())
+    rgb, scale = load_rgb(data, max_side=400)
+    assert rgb.shape[0] > rgb.shape[1]
+    assert scale == rgb.shape[1] / 800
+    rgb, _ = load_rgb(data, exif_transpose=False)
+    assert rgb.shape == (800, 1600, 3)
+
+
+def test_mode_conversion():
+    rgb, _ = load_rgb(encode(Image.new('L', (10, 8), 77), 'PNG'))
+    assert rgb.shape == (8, 10, 3) and (rgb == 77).all()
+    rgb, _ = load_rgb(Image.new('RGBA', (4, 4), (1, 2, 3, 0)))
+    assert rgb.shape == (4, 4, 3) and tuple(rgb[0, 0]) == (1, 2, 3)
+
+
+def test_sources(tmp_path):
+    data = encode(gradient(20, 10), 'PNG')
+    path = tmp_path / 'face.png'
+    path.write_bytes(data)
+    for source in (data, bytearray(data), str(path), path, io.BytesIO(data)):
+        assert open_image(source).size == (20, 10)
+    with pytest.raises(TypeError):
+        open_image(12)
+
+
+def test_ndarray_passthrough():
+    frame = np.zeros((10, 20, 3), dtype=np.uint8)[:, ::2]
+    rgb, scale = load_rgb(frame, max_side=4)
+    assert rgb.shape == (10, 10, 3) and scale == 1.0 and rgb.flags['C_CONTIGUOUS']
+
+
+def test_box_to_original():
+    assert box_to_original((10.4, 20, 30, 40), 1.0) == (10, 20, 30, 40)
+    assert box_to_original((10, 20, 30, 41), 0.25) == (40, 80, 120, 164)
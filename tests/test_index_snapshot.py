@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""索引快照：写入/内存映射读取、失效标记、来源指纹"""
+
+import os
+
+import numpy as np
+import pytest
+
+from gallery import FaceGalleryIndex
+from index_snapshot import IndexSnapshot, snapshot_users, source_fingerprint
+
+
+def unit(*values):
+    """前几维取给定值、其余为 0 的特征向量"""
+    vector = np.zeros(128, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+@pytest.fixture
+def face_database():
+    return {
+        '张三': {'features': [unit(1.0), unit(0.9, 0.1)], 'images': ['张三/face_1.jpg'],
+               'info': {'department': '研发'}},
+        '李四': {'features': [unit(0.0, 1.0)], 'images': [], 'info': {}},
+        '王五': {'features': [unit(0.0, 0.0, 1.0), unit(0.0, 0.1, 0.9), unit(0.1, 0.0, 0.9)],
+               'images': [], 'info': {'department': '财务'}},
+    }
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return IndexSnapshot.from_config({'database_path': str(tmp_path)})
+
+
+def test_write_and_load(snapshot, face_database):
+    row_names, matrix = FaceGalleryIndex().build(face_database).live_rows()
+    manifest = snapshot.write(row_names, matrix, snapshot_users(face_database), 'abc', sources={'x': 1})
+    assert manifest['count'] == 6 and manifest['users'] == 3
+
+    data = snapshot.load()
+    assert data['row_names'] == row_names
+    assert isinstance(data['matrix'], np.memmap)
+    np.testing.assert_array_equal(data['matrix'], matrix)
+    assert data['users']['张三'] == {'info': {'department': '研发'}, 'images': ['张三/face_1.jpg']}
+    assert data['fingerprint'] == 'abc' and data['ivf'] is None
+
+
+def test_missing_snapshot(snapshot):
+    assert snapshot.load() is None
+    assert not snapshot.invalidate()
+
+
+def test_new_generation_replaces_old_files(snapshot):
+    snapshot.write(['a'], np.zeros((1, 128)), {'a': {}}, 'one')
+    snapshot.write([], np.empty((0, 128)), {}, 'two')
+    assert sorted(os.listdir(snapshot.path)) == ['manifest.json', 'rows.2.json', 'users.2.json']
+    data = snapshot.load()
+    assert data['matrix'].shape == (0, 128) and data['fingerprint'] == 'two'
+
+
+def test_invalidate(snapshot):
+    snapshot.write(['a'], np.zeros((1, 128)), {'a': {}}, 'abc')
+    assert snapshot.invalidate()
+    assert not snapshot.invalidate()
+    data = snapshot.load()
+    # 数据仍可映射使用，只是指纹不再与任何来源匹配
+    assert data['fingerprint'] is None and data['row_names'] == ['a']
+
+
+def test_ivf_round_trip(snapshot, face_database):
+    gallery = FaceGalleryIndex(backend='ivf', ivf_nlist=3, ivf_min_templates=0).build(face_database)
+    row_names, matrix = gallery.live_rows()
+    snapshot.write(row_names, matrix, {}, 'f', ivf=gallery.ivf)
+    data = snapshot.load(nprobe=1)
+    np.testing.assert_array_equal(data['ivf'].centroids, gallery.ivf.centroids)
+    restored = FaceGalleryIndex(backend='ivf', ivf_nlist=3, ivf_min_templates=0)
+    restored.build_from_arrays(data['row_names'], data['matrix'], ivf=data['ivf'])
+    for probe in (unit(0.95, 0.05), unit(0.0, 0.9), unit(0.05, 0.0, 0.95)):
+        assert restored.search(probe, k=1, nprobe=1) == gallery.search(probe, k=1, nprobe=1)
+
+
+def test_mismatched_rows(snapshot):
+    with pytest.raises(ValueError):
+        snapshot.write(['a', 'b'], np.zeros((1, 128)), {}, 'f')
+
+
+def test_fingerprint_tracks_sources(tmp_path):
+    config = {'database_path': str(tmp_path), 'gallery_backend': 'exact'}
+    first, parts = source_fingerprint(config)
+    assert parts['feature_store'] is None and 'mysql' not in parts
+    assert source_fingerprint(config)[0] == first
+
+    os.makedirs(str(tmp_path / 'face_images' / '张三'))
+    second, _ = source_fingerprint(config)
+    assert second != first
+    assert source_fingerprint(dict(config, gallery_backend='ivf'))[0] != second
+
+
+def test_fingerprint_tracks_photos_of_existing_users(tmp_path):
+    """已有用户目录中的照片变化不改变照片根目录的 mtime，但要让快照过期"""
+    config = {'database_path': str(tmp_path)}
+    root = tmp_path / 'face_images'
+    for name in ('张三', '李四'):
+        os.makedirs(str(root / name))
+        os.utime(str(root / name), ns=(1_000_000_000_000, 1_000_000_000_000))
+    os.utime(str(root), ns=(1_000_000_000_000, 1_000_000_000_000))
+    first, parts = source_fingerprint(config)
+    assert parts['face_images'][0] == 2
+
+    (root / '李四' / 'face_1.jpg').write_bytes(b'photo')
+    os.utime(str(root / '李四'), ns=(2_000_000_000_000, 2_000_000_000_000))
+    assert os.stat(str(root)).st_mtime_ns == 1_000_000_000_000
+    assert source_fingerprint(config)[0] != first
+
+    # 根目录下的普通文件不计入
+    second = source_fingerprint(config)[0]
+    (root / 'readme.txt').write_bytes(b'')
+    assert source_fingerprint(config)[0] == second
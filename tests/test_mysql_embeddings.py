@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""MySQL 二进制特征：编码往返、流式加载（用内存中的连接替身代替数据库）、文本特征迁移、按姓名补齐缺失特征"""
+
+import numpy as np
+import pytest
+
+from face_sources import load_mysql_only_features
+from mysql_embeddings import (EMBEDDING_DIM, EMBEDDING_MODEL, decode_embedding, encode_embedding,
+                              ensure_embedding_columns, load_embeddings, migrate_text_encodings)
+
+
+class FakeCursor:
+    """按 SQL 语句分派的游标替身，只实现本模块用到的接口"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def execute(self, sql, args=()):
+        sql = ' '.join(sql.split())
+        self.conn.executed.append((sql, args))
+        if sql.startswith('SELECT COUNT(*)'):
+            self.result = [{'total': self.conn.count_override if self.conn.count_override is not None
+                            else len(self.conn.matching(sql, args))}]
+        elif ', face_embedding FROM users' in sql:
+            key = sql.split()[1].rstrip(',')
+            self.result = [(row[key], row['face_embedding']) for row in self.conn.matching(sql, args)]
+        elif sql.startswith('SELECT id, face_encoding'):
+            last_id, limit = args
+            rows = [row for row in self.conn.rows if row['id'] > last_id
+                    and row.get('face_encoding') is not None and row.get('face_embedding') is None]
+            self.result = [{'id': row['id'], 'face_encoding': row['face_encoding']} for row in rows[:limit]]
+        elif sql.startswith('DESCRIBE users'):
+            self.result = [{'Field': name} for name in self.conn.columns]
+        elif sql.startswith('ALTER TABLE users ADD COLUMN'):
+            self.conn.columns.append(sql.split()[5])
+        else:
+            raise AssertionError(f'unexpected SQL: {sql}')
+
+    def executemany(self, sql, updates):
+        for blob, model, user_id in updates:
+            row = next(row for row in self.conn.rows if row['id'] == user_id)
+            row['face_embedding'] = blob
+            row['embedding_model'] = model
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return list(self.result)
+
+    def fetchmany(self, size):
+        rows, self.result = self.result[:size], self.result[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, rows, columns=None):
+        self.rows = rows
+        self.columns = list(columns or ['id', 'name', 'face_encoding'])
+        self.executed = []
+        self.commits = 0
+        self.count_override = None
+
+    def matching(self, sql, args):
+        rows = [row for row in self.rows
+                if row.get('face_embedding') is not None and row.get('embedding_model') == args[0]]
+        if 'name IN' in sql:
+            rows = [row for row in rows if row['name'] in args[1:]]
+        return rows
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def embeddings(count, seed=0):
+    return np.random.default_rng(seed).normal(0.0, 0.1, (count, EMBEDDING_DIM)).astype(np.float32)
+
+
+def test_encode_decode_round_trip():
+    vector = embeddings(1)[0]
+    blob = encode_embedding(vector)
+    assert len(blob) == EMBEDDING_DIM * 4
+    np.testing.assert_array_equal(decode_embedding(blob), vector)
+    with pytest.raises(ValueError):
+        encode_embedding(np.zeros(64))
+
+
+def test_load_embeddings_streams_into_matrix():
+    vectors = embeddings(7)
+    rows = [{'id': i + 1, 'face_embedding': encode_embedding(v), 'embedding_model': EMBEDDING_MODEL}
+            for i, v in enumerate(vectors)]
+    rows.append({'id': 8, 'face_embedding': encode_embedding(vectors[0]), 'embedding_model': 'other'})
+    rows.append({'id': 9, 'face_embedding': None})
+    keys, matrix = load_embeddings(FakeConnection(rows), fetch_size=3)
+    assert keys == list(range(1, 8))
+    np.testing.assert_array_equal(matrix, vectors)
+
+
+def test_load_embeddings_skips_bad_blobs():
+    vectors = embeddings(2)
+    rows = [{'id': 1, 'face_embedding': encode_embedding(vectors[0]), 'embedding_model': EMBEDDING_MODEL},
+            {'id': 2, 'face_embedding': b'short', 'embedding_model': EMBEDDING_MODEL},
+            {'id': 3, 'face_embedding': encode_embedding(vectors[1]), 'embedding_model': EMBEDDING_MODEL}]
+    keys, matrix = load_embeddings(FakeConnection(rows))
+    assert keys == [1, 3]
+    np.testing.assert_array_equal(matrix, vectors)
+
+
+def test_load_embeddings_grows_past_count():
+    """COUNT(*) 之后新增的行超出预分配大小时扩容"""
+    vectors = embeddings(1500)
+    rows = [{'id': i, 'face_embedding': encode_embedding(v), 'embedding_model': EMBEDDING_MODEL}
+            for i, v in enumerate(vectors)]
+    conn = FakeConnection(rows)
+    conn.count_override = 2
+    keys, matrix = load_embeddings(conn, fetch_size=500)
+    assert len(keys) == 1500
+    np.testing.assert_array_equal(matrix, vectors)
+
+
+def test_load_embeddings_extra_condition():
+    conn = FakeConnection([])
+    keys, matrix = load_embeddings(conn, key_column='name', where='department = %s', params=('研发',))
+    assert keys == [] and matrix.shape == (0, EMBEDDING_DIM)
+    sql, args = conn.executed[-1]
+    assert sql.startswith('SELECT name, face_embedding') and sql.endswith('AND department = %s')
+    assert args == (EMBEDDING_MODEL, '研发')
+
+
+def test_migrate_text_encodings():
+    vectors = embeddings(3)
+    rows = [{'id': i + 1, 'face_encoding': ','.join(repr(float(x)) for x in v)} for i, v in enumerate(vectors)]
+    rows.append({'id': 4, 'face_encoding': 'not,numbers'})
+    rows.append({'id': 5, 'face_encoding': ','.join(['0.1'] * 64)})
+    rows.append({'id': 6, 'face_encoding': None})
+    conn = FakeConnection(rows)
+    assert migrate_text_encodings(conn, batch_size=2) == 3
+    for row, vector in zip(rows, vectors):
+        np.testing.assert_array_equal(decode_embedding(row['face_embedding']), vector)
+        assert row['embedding_model'] == EMBEDDING_MODEL
+    assert all(row.get('face_embedding') is None for row in rows[3:])
+    # 再次迁移时没有需要转换的行
+    assert migrate_text_encodings(conn) == 0
+
+
+def test_ensure_embedding_columns():
+    conn = FakeConnection([])
+    ensure_embedding_columns(conn)
+    assert conn.columns[-2:] == ['face_embedding', 'embedding_model']
+    executed = len(conn.executed)
+    ensure_embedding_columns(conn)
+    assert len(conn.executed) == executed + 1
+
+
+def test_migrate_reports_bad_text_through_log():
+    messages = []
+    conn = FakeConnection([{'id': 1, 'face_encoding': 'bad'}])
+    assert migrate_text_encodings(conn, log=messages.append) == 0
+    assert len(messages) == 1 and '用户 1' in messages[0]
+
+
+def test_mysql_only_features_queries_missing_names():
+    vectors = embeddings(3)
+    rows = [{'id': i + 1, 'name': name, 'face_embedding': encode_embedding(v), 'embedding_model': EMBEDDING_MODEL}
+            for i, (name, v) in enumerate(zip(['张三', '李四', '王五'], vectors))]
+    face_database = {'张三': {'features': [vectors[0] + 1.0]}, '李四': {'features': []},
+                     '王五': {'features': []}, '赵六': {'features': []}}
+    conn = FakeConnection(rows)
+    mysql_only = load_mysql_only_features(face_database, conn, chunk_size=2)
+    assert sorted(mysql_only) == ['李四', '王五']
+    np.testing.assert_array_equal(face_database['王五']['features'][0], vectors[2])
+    # 已有本地特征的用户不查询，缺失的姓名按批放进 IN 列表
+    selects = [args for sql, args in conn.executed if sql.startswith('SELECT name, face_embedding')]
+    assert selects == [(EMBEDDING_MODEL, '李四', '王五'), (EMBEDDING_MODEL, '赵六')]
+    np.testing.assert_array_equal(face_database['张三']['features'][0], vectors[0] + 1.0)
+
+
+def test_mysql_only_features_nothing_missing():
+    conn = FakeConnection([])
+    assert load_mysql_only_features({'张三': {'features': [np.zeros(EMBEDDING_DIM)]}}, conn) == {}
+    assert conn.executed == []
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""照片目录清单：按目录 mtime 增量刷新、哈希复用、持久化"""
+
+import os
+
+import pytest
+
+from photo_manifest import PhotoManifest, file_hash, is_thumb_file
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def pin_mtime(path, mtime_ns):
+    """固定目录修改时间，避免依赖文件系统的时间精度"""
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'face_images'
+    write(str(root / '张三' / 'face_1.jpg'), b'one')
+    write(str(root / '张三' / 'face_1_thumb.jpg'), b'thumb')
+    write(str(root / '张三' / 'notes.txt'), b'ignored')
+    write(str(root / '李四' / 'face_1.jpg'), b'two')
+    write(str(root / '李四' / 'face_2.jpg'), b'three')
+    for name in ('张三', '李四'):
+        pin_mtime(str(root / name), 1_000_000_000_000)
+    manifest = PhotoManifest(str(root), str(tmp_path / 'photo_manifest.json'))
+    return root, manifest
+
+
+def test_first_refresh_lists_everything(tree):
+    root, manifest = tree
+    assert manifest.refresh() == (2, 4)
+    assert sorted(manifest.names()) == ['张三', '李四']
+    assert manifest.photos('张三') == [str(root / '张三' / 'face_1.jpg')]
+    assert manifest.photo_count('李四') == 2
+    entries = manifest.entries('张三')
+    assert sorted(entries) == ['face_1.jpg', 'face_1_thumb.jpg']
+    assert entries['face_1_thumb.jpg']['is_thumb']
+    assert entries['face_1.jpg']['hash'] == file_hash(str(root / '张三' / 'face_1.jpg'))
+
+
+def test_unchanged_directories_are_skipped(tree):
+    root, manifest = tree
+    manifest.refresh()
+    assert manifest.refresh() == (0, 0)
+    # 目录 mtime 未变时不重新列出，新文件不会出现在清单中
+    write(str(root / '李四' / 'face_3.jpg'), b'four')
+    pin_mtime(str(root / '李四'), 1_000_000_000_000)
+    assert manifest.refresh() == (0, 0)
+    assert manifest.photo_count('李四') == 2
+
+
+def test_changed_directory_only_hashes_new_files(tree):
+    root, manifest = tree
+    manifest.refresh()
+    write(str(root / '李四' / 'face_3.jpg'), b'four')
+    os.remove(str(root / '李四' / 'face_1.jpg'))
+    pin_mtime(str(root / '李四'), 2_000_000_000_000)
+    assert manifest.refresh() == (1, 1)
+    assert [os.path.basename(p) for p in manifest.photos('李四')] == ['face_2.jpg', 'face_3.jpg']
+
+
+def test_modified_file_is_rehashed(tree):
+    root, manifest = tree
+    manifest.refresh()
+    path = str(root / '张三' / 'face_1.jpg')
+    write(path, b'changed content')
+    pin_mtime(str(root / '张三'), 3_000_000_000_000)
+    assert manifest.refresh() == (1, 1)
+    assert manifest.entries('张三')['face_1.jpg']['hash'] == file_hash(path)
+
+
+def test_removed_directories_are_forgotten(tree):
+    root, manifest = tree
+    manifest.refresh()
+    for file_name in os.listdir(str(root / '李四')):
+        os.remove(str(root / '李四' / file_name))
+    os.rmdir(str(root / '李四'))
+    manifest.dirty = False
+    manifest.refresh()
+    assert manifest.names() == ['张三']
+    assert manifest.dirty
+    assert manifest.photos('李四') == []
+
+
+def test_refresh_directory_force(tree):
+    root, manifest = tree
+    manifest.refresh()
+    # 同一秒内写入新照片，目录 mtime 看起来未变
+    write(str(root / '张三' / 'face_2.jpg'), b'new')
+    pin_mtime(str(root / '张三'), 1_000_000_000_000)
+    assert manifest.refresh_directory('张三', force=False) == 0
+    assert manifest.photo_count('张三') == 1
+    assert manifest.refresh_directory('张三') == 1
+    assert manifest.photo_count('张三') == 2
+
+
+def test_refresh_directory_not_cached_or_missing(tree):
+    root, manifest = tree
+    assert manifest.refresh_directory('李四', force=False) == 2
+    manifest.refresh()
+    assert manifest.refresh_directory('王五') == 0
+    assert '王五' not in manifest.names()
+
+
+def test_save_and_reload(tree, tmp_path):
+    root, manifest = tree
+    assert not manifest.save()
+    manifest.refresh()
+    assert manifest.save()
+    assert not manifest.dirty and not manifest.save()
+
+    reloaded = PhotoManifest(str(root), manifest.manifest_file)
+    assert reloaded.entries('张三') == manifest.entries('张三')
+    assert reloaded.refresh() == (0, 0)
+
+
+def test_corrupt_manifest_starts_empty(tree):
+    root, manifest = tree
+    write(manifest.manifest_file, b'{not json')
+    assert PhotoManifest(str(root), manifest.manifest_file).names() == []
+
+
+def test_without_hash(tree):
+    root, manifest = tree
+    manifest = PhotoManifest(str(root), manifest.manifest_file, compute_hash=False)
+    assert manifest.refresh() == (2, 0)
+    assert manifest.entries('李四')['face_1.jpg']['hash'] is None
+
+
+def test_is_thumb_file():
+    assert is_thumb_file('face_1_thumb.jpg')
+    assert not is_thumb_file('face_1.jpg')
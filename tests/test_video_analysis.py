@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""视频离线分析：出现区间合并与时间格式"""
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('dlib')
+
+from video_analysis import AppearanceIntervals, analyze_video, format_time  # noqa: E402
+
+
+@pytest.fixture
+def closed():
+    return []
+
+
+@pytest.fixture
+def intervals(closed):
+    # 每 0.5 秒抽一帧，间隔不超过 2 秒的命中并入同一区间
+    return AppearanceIntervals(step=0.5, merge_gap=2.0, on_close=closed.append)
+
+
+def test_hits_within_merge_gap_share_interval(intervals, closed):
+    for timestamp in (0.0, 0.5, 1.0, 3.0):  # 1.5 -> 3.0 相隔 1.5 秒，仍在 merge_gap 之内
+        intervals.add('张三', timestamp, 0.6)
+    assert closed == []
+    interval = intervals.open['张三']
+    assert (interval['start'], interval['end'], interval['hits']) == (0.0, 3.5, 4)
+
+
+def test_gap_beyond_merge_gap_starts_new_interval(intervals, closed):
+    intervals.add('张三', 0.0, 0.6)
+    intervals.add('张三', 0.5, 0.7)
+    intervals.add('张三', 3.0, 0.8)  # 区间结束于 1.0，3.0 > 1.0 + 2.0 不成立，合并
+    intervals.add('张三', 6.0, 0.5)  # 6.0 > 3.5 + 2.0，开始新区间
+    assert len(closed) == 1
+    assert (closed[0]['start'], closed[0]['end'], closed[0]['hits']) == (0.0, 3.5, 3)
+    assert (closed[0]['best_confidence'], closed[0]['best_time']) == (0.8, 3.0)
+    assert intervals.open['张三']['start'] == 6.0
+
+
+def test_exact_merge_gap_boundary(intervals, closed):
+    intervals.add('张三', 0.0, 0.6)
+    intervals.add('张三', 2.5, 0.6)  # 恰好等于 end + merge_gap，仍然合并
+    assert closed == []
+    intervals.add('张三', 5.0 + 1e-6, 0.6)
+    assert len(closed) == 1
+
+
+def test_close_stale_and_summary(intervals, closed):
+    intervals.add('张三', 0.0, 0.6)
+    intervals.add('李四', 1.0, 0.9)
+    intervals.close_stale(3.0)  # 张三区间结束于 0.5，已超过 merge_gap
+    assert [interval['name'] for interval in closed] == ['张三']
+    assert list(intervals.open) == ['李四']
+
+    intervals.add('张三', 10.0, 0.7)
+    intervals.add('张三', 10.5, 0.65)
+    intervals.close_all()
+    assert [interval['name'] for interval in closed] == ['张三', '李四', '张三']
+    assert intervals.open == {}
+    person = intervals.summary['张三']
+    assert person['intervals'] == 2
+    assert person['seconds'] == pytest.approx(0.5 + 1.0)
+    assert (person['first'], person['last'], person['best_confidence']) == (0.0, 11.0, 0.7)
+    assert intervals.summary['李四']['seconds'] == pytest.approx(0.5)
+
+
+def test_close_all_orders_by_start(intervals, closed):
+    intervals.add('b', 2.0, 0.5)
+    intervals.add('a', 3.0, 0.5)
+    intervals.add('c', 1.0, 0.5)
+    intervals.close_all()
+    assert [interval['name'] for interval in closed] == ['c', 'b', 'a']
+
+
+def test_without_callback():
+    intervals = AppearanceIntervals(step=1.0, merge_gap=0.0)
+    intervals.add('a', 0.0, 0.5)
+    intervals.add('a', 1.0, 0.5)
+    intervals.add('a', 3.0, 0.5)
+    intervals.close_all()
+    assert intervals.summary['a']['intervals'] == 2
+    assert intervals.summary['a']['seconds'] == pytest.approx(3.0)
+
+
+def test_format_time():
+    assert format_time(0) == '00:00:00.0'
+    assert format_time(3725.25) == '01:02:05.2'
+    assert format_time(-1) == '00:00:00.0'
+
+
+def test_missing_models(tmp_path):
+    config = {'shape_predictor_path': str(tmp_path / 'missing.dat')}
+    with pytest.raises(FileNotFoundError):
+        analyze_video('video.mp4', config, lambda descriptors: [], str(tmp_path / 'report.csv'))
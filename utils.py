@@ -12,6 +12,9 @@ from PyQt5.QtWidgets import (QMessageBox, QFileDialog, QDialog, QVBoxLayout,
 from PyQt5.QtGui import QImage, QPixmap, QIcon
 from PyQt5.QtCore import Qt, QSize
 
+from frame_pipeline import VideoAnalysisThread
+from video_analysis import format_time
+
 # 允许加载截断的图像
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -22,6 +25,7 @@ class FaceRecognitionUtils:
     def __init__(self, parent):
         self.parent = parent
         self.config = parent.config
+        self.video_thread = None  # 视频文件识别线程
 
     def select_image(self):
         """选择图片文件"""
@@ -113,19 +117,78 @@ class FaceRecognitionUtils:
                 return None
 
     def select_video(self):
-        """选择视频文件"""
+        """选择视频文件，在后台抽帧识别，生成每人出现区间报告"""
         try:
+            if self.video_thread is not None and self.video_thread.isRunning():
+                reply = QMessageBox.question(self.parent, "确认", "视频识别正在进行，是否停止？",
+                                             QMessageBox.Yes | QMessageBox.No)
+                if reply == QMessageBox.Yes:
+                    self.stop_video_analysis()
+                return
+
             file_path, _ = QFileDialog.getOpenFileName(
                 self.parent, "选择视频文件", "",
                 "Video Files (*.mp4 *.avi *.mov *.mkv);;All Files (*)"
             )
             if file_path:
                 self.parent.update_log(f"选择视频: {os.path.basename(file_path)}")
-                QMessageBox.information(self.parent, "提示", "视频播放功能开发中...")
+                if self.parent.model_status != "完整":
+                    QMessageBox.warning(self.parent, "警告", "模型不完整，无法进行视频识别")
+                    return
+
+                report_file = os.path.join('logs', f"video_{os.path.splitext(os.path.basename(file_path))[0]}_"
+                                                   f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+                # 特征库匹配在视频线程中进行，检测和特征计算在进程池中进行
+                self.video_thread = VideoAnalysisThread(file_path, self.config,
+                                                        self.parent.models.match_descriptors, report_file)
+                self.video_thread.progress.connect(self.on_video_progress)
+                self.video_thread.analysis_finished.connect(self.on_video_finished)
+                self.video_thread.analysis_failed.connect(self.on_video_failed)
+                self.video_thread.start()
+                self.parent.update_log(
+                    f"开始视频识别: 每秒抽取 {self.config.get('video_sample_fps', 2.0)} 帧，"
+                    f"工作进程 {self.config.get('video_workers', 0) or os.cpu_count()} 个")
         except Exception as e:
             self.parent.update_log(f"加载视频失败: {str(e)}")
             QMessageBox.critical(self.parent, "错误", f"加载视频失败: {str(e)}")
 
+    def stop_video_analysis(self):
+        """停止视频识别（已完成的区间仍写入报告）"""
+        if self.video_thread is not None and self.video_thread.isRunning():
+            self.video_thread.stop()
+            self.parent.update_log("视频识别已停止")
+
+    def on_video_progress(self, done, total):
+        """视频识别进度（Qt信号，在界面线程中执行）"""
+        if total:
+            self.parent.update_log(f"视频识别进度: {done}/{total} 帧 ({done / total:.0%})")
+        else:
+            self.parent.update_log(f"视频识别进度: {done} 帧")
+
+    def on_video_finished(self, result):
+        """视频识别完成：日志中列出每人的出现情况，并提示报告位置"""
+        summary = result['summary']
+        stats = result['stats']
+        self.parent.update_log(
+            f"视频识别{'已停止' if stats['stopped'] else '完成'}: 时长 {stats['duration']:.0f}s，"
+            f"抽样 {stats['samples']} 帧，人脸 {stats['faces']} 个（未匹配 {stats['unknown']}，"
+            f"质量不足 {stats['rejected']}），耗时 {stats['elapsed']:.1f}s（{stats['speed']:.1f}倍速）")
+        lines = []
+        for name, person in sorted(summary.items(), key=lambda item: item[1]['first']):
+            line = (f"{name}: 首次 {format_time(person['first'])}，最后 {format_time(person['last'])}，"
+                    f"{person['intervals']} 段共 {person['seconds']:.0f}s，最高置信度 {person['best_confidence']:.3f}")
+            lines.append(line)
+            self.parent.update_log(line)
+        self.parent.update_log(f"视频识别报告: {result['report_file']}")
+        message = "\n".join(lines[:20]) if lines else "视频中未识别到已注册人员"
+        if len(lines) > 20:
+            message += f"\n... 共 {len(lines)} 人"
+        QMessageBox.information(self.parent, "视频识别结果", f"{message}\n\n报告已保存: {result['report_file']}")
+
+    def on_video_failed(self, message):
+        self.parent.update_log(f"视频识别失败: {message}")
+        QMessageBox.critical(self.parent, "错误", f"视频识别失败: {message}")
+
     def display_image_from_pil(self, pil_image):
         """从PIL图像显示"""
         try:
@@ -212,6 +275,7 @@ class FaceRecognitionUtils:
 
                 # 添加到照片列表
                 self.add_photo_to_list(photo_path)
+                self.parent.database.refresh_user_photos(name)
                 self.parent.enrollment_status.setText(f"成功添加录入照片: {photo_filename}")
                 self.parent.update_log(f"添加录入照片: {photo_path}")
 
@@ -318,7 +382,7 @@ class FaceRecognitionUtils:
             self.parent.enrollment_status.setText(f"人脸捕获成功！已保存照片: {photo_filename}")
 
             # 检查照片数量限制
-            photo_files = [f for f in os.listdir(user_photo_dir) if f.endswith('.jpg') and not f.endswith('_thumb.jpg')]
+            photo_files = self.parent.database.refresh_user_photos(name)
             if len(photo_files) >= self.config.get('face_images_per_person', 5):
                 self.parent.capture_btn.setEnabled(False)
                 self.parent.enrollment_status.setText(
@@ -373,8 +437,10 @@ class FaceRecognitionUtils:
             if reply == QMessageBox.No:
                 return
 
+            photo_dirs = set()
             for item in selected_items:
                 photo_path = item.data(0x0100)
+                photo_dirs.add(os.path.dirname(photo_path))
                 # 删除原图和缩略图
                 if os.path.exists(photo_path):
                     os.remove(photo_path)
@@ -384,6 +450,10 @@ class FaceRecognitionUtils:
                 # 从列表中移除
                 self.parent.photos_list.takeItem(self.parent.photos_list.row(item))
 
+            # 更新照片清单
+            for photo_dir in photo_dirs:
+                self.parent.database.refresh_user_photos(os.path.basename(photo_dir))
+
             self.parent.enrollment_status.setText(f"成功删除 {len(selected_items)} 张照片")
             self.parent.update_log(f"删除照片: {len(selected_items)} 张")
 
@@ -448,6 +518,7 @@ class FaceRecognitionUtils:
                 except Exception as e:
                     self.parent.update_log(f"导入照片失败 {file_path}: {str(e)}")
 
+            self.parent.database.refresh_user_photos(name)
             self.parent.enrollment_status.setText(f"批量导入完成，成功导入 {imported_count} 张照片")
             self.parent.update_log(f"批量导入照片: {imported_count} 张成功")
 
@@ -501,9 +572,8 @@ class FaceRecognitionUtils:
             photo_list.setGridSize(QSize(140, 160))
 
             # 加载照片
-            photo_files = [f for f in os.listdir(user_photo_dir) if f.endswith('.jpg') and not f.endswith('_thumb.jpg')]
-            for photo_file in photo_files:
-                photo_path = os.path.join(user_photo_dir, photo_file)
+            for photo_path in self.parent.database.refresh_user_photos(name, force=False):
+                photo_file = os.path.basename(photo_path)
                 item = QListWidgetItem()
                 pixmap = QPixmap(photo_path)
                 pixmap = pixmap.scaled(120, 120, Qt.KeepAspectRatio)
@@ -568,29 +638,10 @@ class FaceRecognitionUtils:
 
             def save_changes():
                 try:
-                    # 更新内存中的数据
-                    if name in self.parent.face_database:
-                        self.parent.face_database[name]['info'].update({
-                            'age': age_edit.text().strip(),
-                            'gender': gender_edit.text().strip(),
-                            'department': department_edit.text().strip(),
-                            'updated_at': datetime.now().isoformat()
-                        })
-
-                    # 更新数据库
-                    if self.parent.database.db_conn and self.parent.database.db_cursor:
-                        sql = """
-                        UPDATE users 
-                        SET age = %s, gender = %s, department = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE name = %s
-                        """
-                        self.parent.database.db_cursor.execute(sql, (
-                            age_edit.text().strip(),
-                            gender_edit.text().strip(),
-                            department_edit.text().strip(),
-                            name
-                        ))
-                        self.parent.database.db_conn.commit()
+                    # 更新内存、特征库分片和MySQL
+                    self.parent.database.update_user_info(name, age_edit.text().strip(),
+                                                          gender_edit.text().strip(),
+                                                          department_edit.text().strip())
 
                     # 更新表格显示
                     self.parent.data_table.item(row, 1).setText(age_edit.text().strip())
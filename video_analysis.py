@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+视频文件识别
+OpenCV 流式解码视频文件，按 video_sample_fps 抽帧（未抽中的帧只 grab 不转换），抽中的帧缩小到
+video_max_side 后交给进程池。每个工作进程各自加载一份 dlib 检测器、特征点预测器和 ResNet 识别模型
+（dlib 模型对象不能在线程间共享，HOG 检测和 ResNet 推理也不释放 GIL，线程池无法并行），
+返回人脸特征；主进程按抽帧顺序批量匹配特征库，把同一人相邻的命中合并为出现区间：
+
+    {'name', 'start', 'end', 'hits', 'best_confidence', 'best_time'}   时间为视频内秒数
+
+同时在途的抽样帧不超过 工作进程数 x video_queue_per_worker，结束的区间随即写入报告，
+内存占用与视频长度无关。
+"""
+
+import os
+import csv
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import cv2
+import dlib
+
+from face_quality import FaceQuality
+
+# 工作进程需要的配置项（进程间只传递这些值）
+WORKER_CONFIG_KEYS = ('min_face_size', 'face_quality_min_score', 'face_quality_blur_reference')
+
+_worker = {}  # 工作进程内的模型: detector, predictor, recognizer, quality
+
+
+def model_paths(config):
+    """特征点预测器和识别模型路径"""
+    return (config.get('shape_predictor_path', 'models/shape_predictor_68_face_landmarks.dat'),
+            config.get('face_recognition_model_path', 'models/dlib_face_recognition_resnet_model_v1.dat'))
+
+
+def format_time(seconds):
+    """秒 -> HH:MM:SS.s"""
+    minutes, seconds = divmod(max(0.0, seconds), 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:04.1f}"
+
+
+def _init_worker(predictor_path, recognition_path, quality_config):
+    """工作进程初始化：每个进程加载自己的一份模型"""
+    _worker['detector'] = dlib.get_frontal_face_detector()
+    _worker['predictor'] = dlib.shape_predictor(predictor_path)
+    _worker['recognizer'] = dlib.face_recognition_model_v1(recognition_path)
+    _worker['quality'] = FaceQuality.from_config(quality_config)
+
+
+def _analyze_sample(timestamp, frame):
+    """工作进程中分析一帧 BGR 图像：检测 -> 质量评分 -> 特征点 -> 特征
+
+    返回 (时间, [特征, ...], 因质量不足跳过的人脸数)
+    """
+    rgb = np.ascontiguousarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    quality = _worker['quality']
+    shapes = dlib.full_object_detections()
+    rejected = 0
+    for rect in _worker['detector'](rgb):
+        box = (max(0, rect.left()), max(0, rect.top()), min(rgb.shape[1] - 1, rect.right()),
+               min(rgb.shape[0] - 1, rect.bottom()))
+        total, scores = quality.pre_score(rgb, box)
+        if not quality.accept(total):
+            rejected += 1
+            continue
+        shape = _worker['predictor'](rgb, rect)
+        total, _ = quality.with_pose(scores, shape)
+        if not quality.accept(total):
+            rejected += 1
+            continue
+        shapes.append(shape)
+    if len(shapes) == 0:
+        return timestamp, [], rejected
+    # 一帧中的全部人脸一次网络调用
+    descriptors = _worker['recognizer'].compute_face_descriptor(rgb, shapes)
+    return timestamp, [np.asarray(descriptor, dtype=np.float32) for descriptor in descriptors], rejected
+
+
+class AppearanceIntervals:
+    """把逐帧命中合并为每人的出现区间
+
+    每个抽样帧代表 [t, t + step) 这段时间；同一人两次命中间隔不超过 merge_gap 秒时并入同一区间。
+    只保留每人当前未结束的区间，结束的区间交给 on_close（写报告），并累计到每人的汇总中。
+    """
+
+    def __init__(self, step, merge_gap, on_close=None):
+        self.step = step
+        self.merge_gap = merge_gap
+        self.on_close = on_close
+        self.open = {}  # 姓名 -> 未结束的区间
+        self.summary = {}  # 姓名 -> {'intervals', 'seconds', 'first', 'last', 'best_confidence'}
+
+    def add(self, name, timestamp, confidence):
+        interval = self.open.get(name)
+        if interval is not None and timestamp > interval['end'] + self.merge_gap:
+            self.close(name)
+            interval = None
+        if interval is None:
+            interval = {'name': name, 'start': timestamp, 'end': timestamp + self.step, 'hits': 0,
+                        'best_confidence': confidence, 'best_time': timestamp}
+            self.open[name] = interval
+        interval['end'] = timestamp + self.step
+        interval['hits'] += 1
+        if confidence > interval['best_confidence']:
+            interval['best_confidence'] = confidence
+            interval['best_time'] = timestamp
+
+    def close(self, name):
+        interval = self.open.pop(name)
+        person = self.summary.setdefault(name, {'intervals': 0, 'seconds': 0.0, 'first': interval['start'],
+                                                'last': interval['end'], 'best_confidence': 0.0})
+        person['intervals'] += 1
+        person['seconds'] += interval['end'] - interval['start']
+        person['last'] = interval['end']
+        person['best_confidence'] = max(person['best_confidence'], interval['best_confidence'])
+        if self.on_close is not None:
+            self.on_close(interval)
+
+    def close_stale(self, timestamp):
+        """结束距 timestamp 已超过 merge_gap 的区间"""
+        for name in [name for name, interval in self.open.items()
+                     if timestamp > interval['end'] + self.merge_gap]:
+            self.close(name)
+
+    def close_all(self):
+        for name in sorted(self.open, key=lambda item: self.open[item]['start']):
+            self.close(name)
+
+
+def analyze_video(video_path, config, match, report_file, progress=None, should_stop=None):
+    """分析视频文件，出现区间写入报告CSV，返回 (每人汇总, 统计)
+
+    match: [特征, ...] -> [{'name', 'distance', 'confidence'}, ...]，在主进程中匹配特征库
+    （name 为 None 表示未匹配）；progress(已读帧数, 总帧数) 约每秒调用一次；should_stop() 为真时提前结束。
+    """
+    predictor_path, recognition_path = model_paths(config)
+    for path in (predictor_path, recognition_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"模型文件不存在: {path}")
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频文件: {video_path}")
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps <= 0:
+        fps = 25.0
+    total_frames = max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+    sample_every = max(1, int(round(fps / max(0.01, config.get('video_sample_fps', 2.0)))))
+    step = sample_every / fps  # 每个抽样帧代表的时长（秒）
+    max_side = config.get('video_max_side', 1280)
+    workers = config.get('video_workers', 0) or os.cpu_count() or 1
+    max_pending = workers * max(1, config.get('video_queue_per_worker', 2))
+    quality_config = {key: config.get(key) for key in WORKER_CONFIG_KEYS if config.get(key) is not None}
+
+    stats = {'fps': fps, 'frames': 0, 'samples': 0, 'faces': 0, 'unknown': 0, 'rejected': 0, 'errors': 0}
+    start = time.perf_counter()
+    report_dir = os.path.dirname(report_file)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+
+    with open(report_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f'# 视频: {video_path}', f'帧率: {fps:.2f}', f'抽帧间隔: {sample_every}帧',
+                         f'阈值: {config.get("threshold", 0.4)}'])
+        writer.writerow(['name', 'start', 'end', 'start_time', 'end_time', 'duration', 'hits',
+                         'best_confidence', 'best_time'])
+
+        def write_interval(interval):
+            writer.writerow([interval['name'], f"{interval['start']:.3f}", f"{interval['end']:.3f}",
+                             format_time(interval['start']), format_time(interval['end']),
+                             f"{interval['end'] - interval['start']:.3f}", interval['hits'],
+                             f"{interval['best_confidence']:.6f}", format_time(interval['best_time'])])
+
+        intervals = AppearanceIntervals(step, config.get('video_merge_gap', 2.0), write_interval)
+
+        def handle(future):
+            """按抽帧顺序处理一帧结果：批量匹配 -> 合并区间"""
+            try:
+                timestamp, descriptors, rejected = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception:
+                stats['errors'] += 1
+                return
+            stats['rejected'] += rejected
+            stats['faces'] += len(descriptors)
+            best = {}  # 一帧中同一人只计一次，取最高置信度
+            if descriptors:
+                for item in match(descriptors):
+                    if item['name'] is None:
+                        stats['unknown'] += 1
+                    elif item['confidence'] > best.get(item['name'], -1.0):
+                        best[item['name']] = item['confidence']
+            for name, confidence in best.items():
+                intervals.add(name, timestamp, confidence)
+            intervals.close_stale(timestamp)
+
+        pending = deque()
+        last_progress = 0.0
+        frame_index = -1
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(predictor_path, recognition_path, quality_config)) as pool:
+                while not (should_stop and should_stop()):
+                    # 未抽中的帧只 grab（不做颜色转换和拷贝）
+                    if not capture.grab():
+                        break
+                    frame_index += 1
+                    if frame_index % sample_every:
+                        continue
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        continue
+                    if max_side and max(frame.shape[:2]) > max_side:
+                        scale = max_side / max(frame.shape[:2])
+                        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    pending.append(pool.submit(_analyze_sample, frame_index / fps, frame))
+                    stats['samples'] += 1
+                    # 在途帧数达到上限时按顺序等待最早的一帧，解码不会无限超前
+                    while len(pending) >= max_pending:
+                        handle(pending.popleft())
+                    if progress is not None and time.perf_counter() - last_progress >= 1.0:
+                        last_progress = time.perf_counter()
+                        progress(frame_index + 1, total_frames)
+                while pending:
+                    handle(pending.popleft())
+        finally:
+            capture.release()
+            for future in pending:
+                future.cancel()
+        intervals.close_all()
+
+    stats['frames'] = frame_index + 1
+    stats['duration'] = stats['frames'] / fps
+    stats['elapsed'] = time.perf_counter() - start
+    stats['speed'] = stats['duration'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+    stats['stopped'] = bool(should_stop and should_stop())
+    return intervals.summary, stats